@@ -1,82 +1,1906 @@
-import subprocess
 import time
+STARTUP_STARTED = time.perf_counter()
+import subprocess
 import signal
 import sys
 import os
 import logging
-from datetime import datetime, time as dt_time
+import logging.handlers
+import atexit
+from datetime import datetime, timedelta, time as dt_time
 from pathlib import Path
-import tkinter as tk
-from tkinter import ttk, messagebox
 import threading
 import queue
 import re
 import json
-import zipfile
+import hashlib
+import hmac
+import zlib
+import shutil
+import struct
+import locale
+import gzip
+import codecs
+import array
+import socket
+import select
+from collections import deque, namedtuple
+from concurrent.futures import ThreadPoolExecutor, Future
+import urllib.parse
+import itertools
+import heapq
+import bisect
+
+# В режиме демона (--headless) tkinter не импортируется, окно не нужно
+HEADLESS = "--headless" in sys.argv[1:]
 
 # Настройка логирования
 LOG_DIR = "logs"
 LOG_FILE = os.path.join(LOG_DIR, "server.log")
 SETTINGS_FILE = "settings.json"
-Path(LOG_DIR).mkdir(parents=True, exist_ok=True)
-
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s - %(levelname)s - %(message)s",
-    handlers=[
-        logging.FileHandler(LOG_FILE, encoding="utf-8"),
-        logging.StreamHandler(sys.stdout)
-    ]
-)
+EVENTS_DIR = "events"
+LOG_MAX_BYTES = 10 * 1024 * 1024
+LOG_ROTATE_INTERVAL = 24 * 3600
+LOG_TOTAL_MAX_BYTES = 200 * 1024 * 1024
+LOG_QUEUE_SIZE = 10000
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """Передача записей в ограниченную очередь без ожидания; при переполнении записи считаются и отбрасываются."""
+
+    def __init__(self, log_records):
+        super().__init__(log_records)
+        self.dropped = 0
+
+    def enqueue(self, record):
+        try:
+            if self.dropped:
+                self.queue.put_nowait(logging.makeLogRecord({
+                    "name": record.name, "levelno": logging.WARNING, "levelname": "WARNING",
+                    "msg": f"Очередь лога переполнена, пропущено записей: {self.dropped}"
+                }))
+                self.dropped = 0
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+class RotatingLogHandler(logging.handlers.RotatingFileHandler):
+    """Файл лога с ротацией по размеру и времени.
+    
+    Закрытые сегменты сжимаются в gzip в отдельном потоке, самые старые удаляются,
+    пока суммарный размер логов превышает лимит.
+    """
+
+    def __init__(self, filename, max_bytes, interval, total_max_bytes):
+        super().__init__(filename, maxBytes=max_bytes, encoding="utf-8", delay=True)
+        self.interval = interval
+        self.total_max_bytes = total_max_bytes
+        self.rollover_at = time.time() + interval
+        self.compress_lock = threading.Lock()
+
+    def shouldRollover(self, record):
+        if time.time() >= self.rollover_at:
+            return True
+        return super().shouldRollover(record)
+
+    def doRollover(self):
+        if self.stream:
+            self.stream.close()
+            self.stream = None
+        self.rollover_at = time.time() + self.interval
+        if os.path.exists(self.baseFilename) and os.path.getsize(self.baseFilename) > 0:
+            segment = f"{self.baseFilename}.{datetime.now().strftime('%Y-%m-%d_%H-%M-%S')}"
+            suffix = 1
+            while os.path.exists(segment) or os.path.exists(f"{segment}.gz"):
+                segment = f"{self.baseFilename}.{datetime.now().strftime('%Y-%m-%d_%H-%M-%S')}-{suffix}"
+                suffix += 1
+            os.replace(self.baseFilename, segment)
+            threading.Thread(target=self.compress_segment, args=(segment,), daemon=True).start()
+        self.stream = self._open()
+
+    def compress_segment(self, segment):
+        """Сжатие закрытого сегмента и соблюдение лимита общего размера."""
+        try:
+            with self.compress_lock:
+                with open(segment, "rb") as src, gzip.open(f"{segment}.gz.tmp", "wb") as dst:
+                    shutil.copyfileobj(src, dst)
+                os.replace(f"{segment}.gz.tmp", f"{segment}.gz")
+                os.remove(segment)
+                self.enforce_total_size()
+        except OSError as e:
+            sys.stderr.write(f"Ошибка сжатия лога {segment}: {e}\n")
+
+    def enforce_total_size(self):
+        """Удаление самых старых сжатых сегментов сверх лимита."""
+        log_dir = os.path.dirname(self.baseFilename)
+        prefix = os.path.basename(self.baseFilename) + "."
+        segments = sorted(f for f in os.listdir(log_dir) if f.startswith(prefix) and f.endswith(".gz"))
+        sizes = {f: os.path.getsize(os.path.join(log_dir, f)) for f in segments}
+        total = sum(sizes.values()) + (os.path.getsize(self.baseFilename) if os.path.exists(self.baseFilename) else 0)
+        for f in segments:
+            if total <= self.total_max_bytes:
+                break
+            os.remove(os.path.join(log_dir, f))
+            total -= sizes[f]
+
+def setup_logging():
+    """Логирование через очередь: вызывающий поток не ждёт диска, запись ведёт фоновый поток."""
+    Path(LOG_DIR).mkdir(parents=True, exist_ok=True)
+    log_records = queue.Queue(LOG_QUEUE_SIZE)
+    formatter = logging.Formatter("%(asctime)s - %(levelname)s - %(message)s")
+    file_handler = RotatingLogHandler(LOG_FILE, LOG_MAX_BYTES, LOG_ROTATE_INTERVAL, LOG_TOTAL_MAX_BYTES)
+    file_handler.setFormatter(formatter)
+    stream_handler = logging.StreamHandler(sys.stdout)
+    stream_handler.setFormatter(formatter)
+    listener = logging.handlers.QueueListener(log_records, file_handler, stream_handler)
+    listener.start()
+    atexit.register(listener.stop)
+    root_logger = logging.getLogger()
+    root_logger.setLevel(logging.INFO)
+    root_logger.addHandler(NonBlockingQueueHandler(log_records))
+    return listener
+
 logger = logging.getLogger(__name__)
 
+def import_tkinter():
+    """Импорт tkinter только в режиме с окном и только после запуска демона."""
+    global tk, ttk, messagebox, filedialog
+    import tkinter as tk
+    from tkinter import ttk, messagebox, filedialog
+
+class StartupTimer:
+    """Замер фаз запуска утилиты от начала импорта модуля."""
+    
+    def __init__(self, started):
+        self.started = started
+        self.last = started
+        self.phases = []
+        self.server_launched = None
+    
+    def mark(self, phase):
+        now = time.perf_counter()
+        self.phases.append((phase, now - self.last))
+        self.last = now
+    
+    def note_server_launch(self):
+        if self.server_launched is None:
+            self.server_launched = time.perf_counter() - self.started
+    
+    def report(self):
+        parts = ", ".join(f"{phase} {seconds * 1000:.0f} мс" for phase, seconds in self.phases)
+        message = f"Фазы запуска: {parts}; всего {(self.last - self.started) * 1000:.0f} мс"
+        if self.server_launched is not None:
+            message += f"; сервер запущен через {self.server_launched * 1000:.0f} мс"
+        logger.info(message)
+
+startup_timer = StartupTimer(STARTUP_STARTED)
+
 # Параметры запуска сервера
 SERVER_EXECUTABLE = "SCUMServer.exe"
+STEAM_APP_ID = "3792580"
 DEFAULT_STEAMCMD_EXECUTABLE = "C:/steamcmd/steamcmd.exe"
 DEFAULT_STEAMCMD_INSTALL_DIR = "C:/Scum/SCUMServer/"
 DEFAULT_SAVE_DIR = "C:/Scum/SCUMServer/SCUM/Saved/SaveFiles/"
 DEFAULT_BACKUP_DIR = "C:/Scum/SCUMServer/backup/"
 SAVE_FILES = ["SCUM.db", "SCUM.db-shm", "SCUM.db-wal"]
+BACKUP_MODES = {"zip": "ZIP-архив", "chunks": "Инкрементальный (дедупликация)"}
+DEFAULT_BACKUP_MODE = "zip"
+CHUNK_STORE_DIR = "chunks"
+CATALOG_FILE = "catalog.json"
+# Ярусы хранения: последние N бэкапов, по одному в час/день/неделю внутри окна
+DEFAULT_RETENTION = {"keep_last": 3, "hourly_hours": 24, "daily_days": 7, "weekly_weeks": 4}
+CATALOG_MAINTENANCE_INTERVAL = 3600
+# Размер блока кратен размеру страницы SQLite (до 64 КБ), поэтому изменённые страницы
+# не сдвигают границы соседних блоков
+CHUNK_SIZE = 1024 * 1024
+CHUNK_COMPRESSION_LEVEL = 1
+BACKUP_COMPRESSIONS = {"deflate": "Deflate (параллельно)", "store": "Без сжатия", "lzma": "LZMA (один поток)"}
+DEFAULT_BACKUP_COMPRESSION = "deflate"
+DEFAULT_BACKUP_COMPRESSION_LEVEL = 6
+DEFAULT_BACKUP_WORKERS = 0
+ZIP_BLOCK_SIZE = 4 * 1024 * 1024
+# Восстановление: префикс рабочей папки внутри папки сохранений и сколько ошибок integrity_check показывать
+RESTORE_WORK_PREFIX = ".restore_"
+RESTORE_INTEGRITY_ERRORS = 5
+ZIP64_LIMIT = 0xFFFFFFFF
+# Максимальная длина строки вывода дочернего процесса
+CHILD_LINE_LIMIT = 1024 * 1024
+CHILD_READ_SIZE = 64 * 1024
+CREATE_NO_WINDOW = 0x08000000
+NO_WINDOW = {"creationflags": CREATE_NO_WINDOW} if sys.platform == "win32" else {}
+# События из вывода сервера: тип -> регулярные выражения (проверяются по порядку)
+EVENT_TYPES = {"login": "Вход", "logout": "Выход", "chat": "Чат", "admin": "Команда админа", "fatal": "Фатальная ошибка", "error": "Ошибка"}
+EVENT_PATTERNS = [
+    ("login", re.compile(r"'(?:[\d.]+ )?(?P<steam_id>\d{17}):(?P<player>.+?)\(\d+\)' logged in")),
+    ("login", re.compile(r"Login request: .*?\?Name=(?P<player>[^?\s]+).*?userId: \S*?:(?P<steam_id>\d{17})")),
+    ("logout", re.compile(r"'(?:[\d.]+ )?(?P<steam_id>\d{17}):(?P<player>.+?)\(\d+\)' logged out")),
+    ("chat", re.compile(r"'(?P<steam_id>\d{17}):(?P<player>.+?)\(\d+\)' '(?P<channel>\w+): (?P<message>.*)'")),
+    ("admin", re.compile(r"'(?P<steam_id>\d{17}):(?P<player>.+?)\(\d+\)' Command: '(?P<message>.*)'")),
+    ("fatal", re.compile(r"Fatal error|Assertion failed|appError called|Unhandled Exception")),
+    ("error", re.compile(r"\bError: ")),
+]
+EVENT_FLUSH_INTERVAL = 10
+# Телеметрия процесса сервера
+TELEMETRY_FIELDS = ("time", "cpu_percent", "rss_mb", "threads", "handles", "read_mb", "write_mb")
+TELEMETRY_CAPACITY = 17280
+DEFAULT_TELEMETRY_INTERVAL = 5
+# Окно оценки скорости роста памяти и минимум точек для неё
+TELEMETRY_GROWTH_WINDOW = 1800
+TELEMETRY_GROWTH_MIN_SAMPLES = 12
+# Сторож зависаний: период проверки, порог простоя CPU и запрос A2S_INFO
+WATCHDOG_CHECK_INTERVAL = 5
+DEFAULT_WATCHDOG_GRACE = 300
+DEFAULT_WATCHDOG_STARTUP_GRACE = 900
+WATCHDOG_CPU_IDLE = 1.0
+WATCHDOG_CPU_PINNED_TOLERANCE = 2.0
+WATCHDOG_PROBE_TIMEOUT = 2
+A2S_INFO_REQUEST = b"\xff\xff\xff\xffTSource Engine Query\x00"
+# Отслеживание изменений сохранений основного сервера: inotify в Linux, иначе опрос
+SAVE_WATCH_POLL_INTERVAL = 5
+SAVE_WATCH_SETTLE = 1
+DEFAULT_CHANGE_BACKUP_MB = 64
+CHANGE_BACKUP_MIN_INTERVAL = 900
+WAL_MAGIC = (0x377F0682, 0x377F0683)
+WAL_HEADER_SIZE = 32
+WAL_FRAME_HEADER_SIZE = 24
+SAVE_REGIONS_LIMIT = 100
+# IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+INOTIFY_MASK = 0x2 | 0x8 | 0x40 | 0x80 | 0x100 | 0x200
+
+# Здоровье SCUM.db: период замеров и история (в файле DB_HEALTH_FILE), бюджет замера работающей базы
+DB_HEALTH_FILE = "db_health.jsonl"
+DB_HEALTH_INTERVAL = 3600
+DB_HEALTH_HISTORY = 24 * 30
+DB_INSPECT_BUDGET = 10
+DB_TOP_TABLES = 10
+# Обслуживание базы в конвейере рестарта: пороги, при которых действие оправдано, и бюджет по времени
+DEFAULT_DB_MAINTENANCE_BUDGET = 120
+DB_CHECKPOINT_MIN_WAL = 16 * 1024 * 1024
+DB_VACUUM_FREE_RATIO = 0.2
+DB_VACUUM_MIN_FREE = 32 * 1024 * 1024
+# Оценки скорости VACUUM (байт базы в секунду) и checkpoint (байт WAL в секунду) до первого замера на этой машине
+DB_VACUUM_RATE = 25 * 1024 * 1024
+DB_CHECKPOINT_RATE = 100 * 1024 * 1024
+DB_ANALYZE_INTERVAL = 7 * 24 * 3600
+DB_ANALYZE_ROW_CHANGE = 0.25
+DB_ANALYZE_LIMIT = 1000
+
+# Онлайн-бэкап: страниц за шаг и пауза между шагами, чтобы не мешать записи сервера
+ONLINE_BACKUP_PAGES = 256
+ONLINE_BACKUP_SLEEP = 0.005
+# Фоновые бэкапы: период событий прогресса, сколько последних заданий хранить
+BACKUP_PROGRESS_INTERVAL = 0.5
+BACKUP_JOB_HISTORY = 20
+# LZMA сжимает единицы МБ/с: читаем меньшими блоками, чтобы прогресс и отмена срабатывали быстро
+LZMA_READ_SIZE = 1024 * 1024
+# Конвейер планового рестарта: доступные этапы и глубина истории отчётов
+PIPELINE_STAGE_NAMES = ("backup", "maintenance", "update")
+PIPELINE_HISTORY = 50
+# Несколько инстансов: шаг сдвига плановых рестартов, потоки общего пула и дисковые слоты
+# (слоты ограничивают фоновые архивации, онлайн-бэкапы и восстановление)
+RESTART_STAGGER = 120
+INSTANCE_JOB_WORKERS = 2
+DISK_JOB_SLOTS = 1
+# Локальный JSON API управления: адрес, порт по умолчанию, хвост лога и предел ожидания long-poll
+API_HOST = "127.0.0.1"
+DEFAULT_API_PORT = 8765
+API_LOG_TAIL = 5000
+API_LOG_WAIT_MAX = 30
+# Шина событий: сколько последних событий хранится для отставших подписчиков; период применения событий в окне, мс
+EVENT_BUS_CAPACITY = 1000
+METRIC_DURATION_BUCKETS = (1, 5, 15, 30, 60, 120, 300, 600, 1800, 3600)
+GUI_PUMP_INTERVAL = 100
+# Проверка новой сборки: срок жизни результата и таймаут запроса app_info_print
+BUILD_CHECK_TTL = 900
+STEAMCMD_INFO_TIMEOUT = 180
+# Обновление: на месте или через теневую копию установки с заменой изменённых файлов
+UPDATE_MODES = {"inplace": "На месте (сервер остановлен)", "staged": "Через теневую копию (сервер работает)"}
+DEFAULT_UPDATE_MODE = "inplace"
+SHADOW_SUFFIX = ".staged"
+ROLLBACK_SUFFIX = ".rollback"
+ROLLBACK_MANIFEST = "rollback.json"
+# Падение сервера в течение этого времени после обновления вызывает автоматический откат
+UPDATE_PROBATION = 120
+# В теневую копию не попадают сохранения; исполняемые файлы и метаданные Steam копируются,
+# остальное - reflink-клоны (Btrfs, XFS), а где ФС их не умеет - жёсткие ссылки
+SHADOW_EXCLUDE = ("SCUM/Saved", "steamapps/downloading", "steamapps/temp")
+SHADOW_COPY_SUFFIXES = (".exe", ".dll", ".acf", ".vdf")
+# ioctl FICLONE (Linux): файл-приёмник получает общие с источником блоки до первой записи
+FICLONE = 0x40049409
 DEFAULT_ARGS = ["-log", "-port=7777"]
 server_args = DEFAULT_ARGS[:]
-DEFAULT_RESTART_TIMES = [dt_time(12, 0), dt_time(21, 0)]
+# Расписание рестартов: "ЧЧ:ММ" ежедневно, "пн,чт ЧЧ:ММ" или "пн-пт ЧЧ:ММ" по дням недели,
+# "ГГГГ-ММ-ДД ЧЧ:ММ" - разовое окно обслуживания; в поле GUI записи разделяются ";"
+DEFAULT_RESTART_SCHEDULE = ["12:00", "21:00"]
+SCHEDULE_SEPARATOR = ";"
+SCHEDULE_WEEKDAYS = {
+    "пн": 0, "вт": 1, "ср": 2, "чт": 3, "пт": 4, "сб": 5, "вс": 6,
+    "mon": 0, "tue": 1, "wed": 2, "thu": 3, "fri": 4, "sat": 5, "sun": 6
+}
+DEFAULT_LOG_MAX_LINES = 5000
+# Буфер строк вывода между каналами дочерних процессов и журналом API; политика при переполнении
+DEFAULT_LOG_BUFFER_LINES = 20000
+LOG_OVERFLOW_POLICIES = {"drop_oldest": "Вытеснять старые строки", "sample": "Сохранять каждую N-ю строку", "summarise": "Сворачивать повторы"}
+DEFAULT_LOG_OVERFLOW_POLICY = "drop_oldest"
+LOG_SAMPLE_RATE = 10
+LOG_REPEAT_PATTERN = re.compile(r"\d+")
+DEFAULT_CRASH_RESTART_DELAY = 5
+# Верхняя граница сна супервизора: защита от переводов системных часов
+SUPERVISOR_MAX_SLEEP = 60
+
+class LogBuffer:
+    """Ограниченный буфер строк: писатели кладут пачки, читатель забирает всё накопленное пачкой.
+    
+    Запись никогда не блокирует (её вызывает поток чтения каналов дочерних процессов).
+    Заполненный буфер обслуживает политика: drop_oldest вытесняет самые старые строки,
+    sample пропускает только каждую LOG_SAMPLE_RATE-ю новую строку, summarise сворачивает
+    подряд идущие строки, отличающиеся лишь числами, в одну строку-счётчик.
+    Читатель получает отметку о числе отброшенных строк."""
+    
+    def __init__(self, capacity=DEFAULT_LOG_BUFFER_LINES, policy=DEFAULT_LOG_OVERFLOW_POLICY):
+        self.capacity = max(1, int(capacity))
+        self.policy = policy
+        self.lines = deque()
+        self.condition = threading.Condition()
+        self.dropped = 0
+        self.sample_seq = 0
+        self.repeat_key = None
+        self.repeats = 0
+        self.dropped_total = 0
+        self.summarised_total = 0
+    
+    def configure(self, capacity, policy):
+        with self.condition:
+            self.capacity = max(1, int(capacity))
+            self.policy = policy if policy in LOG_OVERFLOW_POLICIES else DEFAULT_LOG_OVERFLOW_POLICY
+    
+    def put(self, line):
+        self.put_many((line,))
+    
+    def put_many(self, lines):
+        with self.condition:
+            for line in lines:
+                self._add(line)
+            self.condition.notify()
+    
+    def _add(self, line):
+        if len(self.lines) < self.capacity:
+            self._flush_repeats()
+            self.repeat_key = None
+            self.lines.append(line)
+            return
+        if self.policy == "summarise":
+            key = LOG_REPEAT_PATTERN.sub("#", line)
+            if key == self.repeat_key:
+                self.repeats += 1
+                self.summarised_total += 1
+                return
+            self._flush_repeats()
+            self.repeat_key = key
+        elif self.policy == "sample":
+            self.sample_seq += 1
+            if self.sample_seq % LOG_SAMPLE_RATE:
+                self._drop(1)
+                return
+        self._evict()
+        self.lines.append(line)
+    
+    def _drop(self, count):
+        self.dropped += count
+        self.dropped_total += count
+    
+    def _evict(self):
+        if len(self.lines) >= self.capacity:
+            self.lines.popleft()
+            self._drop(1)
+    
+    def _flush_repeats(self):
+        if self.repeats:
+            self._evict()
+            self.lines.append(f"... похожих строк свёрнуто: {self.repeats}")
+            self.repeats = 0
+    
+    def get_batch(self, timeout=None):
+        """Все накопленные строки списком; ждёт до timeout, пока их нет (пустой список по таймауту)."""
+        with self.condition:
+            if not self.lines and not self.repeats:
+                self.condition.wait(timeout)
+            self._flush_repeats()
+            batch = list(self.lines)
+            self.lines.clear()
+            if self.dropped:
+                batch.insert(0, f"... пропущено строк при переполнении буфера лога: {self.dropped}")
+                self.dropped = 0
+            return batch
+    
+    def qsize(self):
+        return len(self.lines)
 
 # Глобальные переменные
-shutdown_flag = False
-restart_now = False
-server_running = False
+shutdown_event = threading.Event()
 auto_start = False
 current_process = None
 start_time = 0
-log_queue = queue.Queue()
-restart_times = DEFAULT_RESTART_TIMES[:]
+log_queue = LogBuffer()
+restart_schedule = DEFAULT_RESTART_SCHEDULE[:]
 steamcmd_executable = DEFAULT_STEAMCMD_EXECUTABLE
 steamcmd_install_dir = DEFAULT_STEAMCMD_INSTALL_DIR
 save_dir = DEFAULT_SAVE_DIR
 backup_dir = DEFAULT_BACKUP_DIR
+log_max_lines = DEFAULT_LOG_MAX_LINES
+log_buffer_lines = DEFAULT_LOG_BUFFER_LINES
+log_overflow_policy = DEFAULT_LOG_OVERFLOW_POLICY
+backup_mode = DEFAULT_BACKUP_MODE
+backup_compression = DEFAULT_BACKUP_COMPRESSION
+backup_compression_level = DEFAULT_BACKUP_COMPRESSION_LEVEL
+backup_workers = DEFAULT_BACKUP_WORKERS
+retention_enabled = False
+retention = dict(DEFAULT_RETENTION)
+backup_catalogs = {}
+chunk_store_locks = {}
+catalog_maintenance_event = threading.Event()
+crash_restart_delay = DEFAULT_CRASH_RESTART_DELAY
+telemetry_interval = DEFAULT_TELEMETRY_INTERVAL
+rss_limit_mb = 0
+rss_growth_limit_mb_per_hour = 0
+watchdog_enabled = False
+watchdog_grace = DEFAULT_WATCHDOG_GRACE
+watchdog_startup_grace = DEFAULT_WATCHDOG_STARTUP_GRACE
+watchdog_query_port = 0
+change_backup_enabled = False
+change_backup_mb = DEFAULT_CHANGE_BACKUP_MB
+db_maintenance_budget = DEFAULT_DB_MAINTENANCE_BUDGET
+supervisor_event = threading.Event()
+restart_pipeline = []
+pipeline_reports = deque(maxlen=PIPELINE_HISTORY)
+build_check_cache = {}
+update_mode = DEFAULT_UPDATE_MODE
+staged_update = None
+update_applied_at = None
+update_lock = threading.Lock()
+instances = []
+instance_jobs = ThreadPoolExecutor(max_workers=INSTANCE_JOB_WORKERS, thread_name_prefix="instance-job")
+backup_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="backup-job")
+backup_jobs = deque(maxlen=BACKUP_JOB_HISTORY)
+backup_jobs_lock = threading.Lock()
+backup_job_ids = itertools.count(1)
+disk_slot = threading.BoundedSemaphore(DISK_JOB_SLOTS)
+api_port = DEFAULT_API_PORT
+api_token = ""
+update_job_lock = threading.Lock()
+api_client = None
+gui_status = {}
+gui_backup_ids = []
+gui_backup_version = ""
+gui_backup_listbox = None
+gui_log_queue = queue.Queue()
+gui_events = queue.Queue()
+backup_progress = {}
+settings_saved_hook = None
 
-def create_splash_screen(root):
-    """Создание экрана загрузки."""
-    logger.info("Создание экрана загрузки")
-    splash = tk.Toplevel(root)
-    splash.overrideredirect(True)
-    splash.geometry("400x100+500+300")
-    splash.attributes("-alpha", 0.8)
-    splash.attributes("-topmost", True)
+class LogConsole:
+    """Консоль логов поверх tk.Text с кольцевым буфером фиксированного размера."""
+
+    def __init__(self, text_widget, max_lines, dropped_label=None):
+        self.widget = text_widget
+        self.dropped_label = dropped_label
+        self.max_lines = max(1, int(max_lines))
+        self.pending = deque(maxlen=self.max_lines)
+        self.dropped = 0
+
+    def set_max_lines(self, max_lines):
+        """Изменение лимита строк с сохранением последних строк буфера."""
+        self.max_lines = max(1, int(max_lines))
+        self.pending = deque(self.pending, maxlen=self.max_lines)
+        self.trim()
+
+    def push(self, line):
+        """Добавление строки в буфер; при переполнении самая старая строка отбрасывается."""
+        if len(self.pending) == self.max_lines:
+            self.dropped += 1
+        self.pending.append(line)
+
+    def trim(self):
+        """Удаление старых строк сверх лимита из текстового поля."""
+        # Последняя строка tk.Text всегда пустая: текст заканчивается переводом строки
+        line_count = int(self.widget.index("end-1c").split(".")[0]) - 1
+        excess = line_count - self.max_lines
+        if excess > 0:
+            self.widget.delete("1.0", f"{excess + 1}.0")
+
+    def flush(self):
+        """Вставка накопленных строк одним вызовом и прокрутка, если пользователь внизу."""
+        if not self.pending:
+            return
+        at_bottom = self.widget.yview()[1] >= 0.999
+        text = "\n".join(self.pending) + "\n"
+        self.pending.clear()
+        self.widget.insert(tk.END, text)
+        self.trim()
+        if at_bottom:
+            self.widget.see(tk.END)
+        if self.dropped and self.dropped_label is not None:
+            self.dropped_label.config(text=f"Пропущено строк: {self.dropped}")
+
+class ChunkStore:
+    """Хранилище блоков с дедупликацией: каждый уникальный блок хранится один раз по хэшу."""
+
+    def __init__(self, root_dir, chunk_size=CHUNK_SIZE):
+        self.root_dir = root_dir
+        self.chunk_size = chunk_size
+        self.objects_dir = os.path.join(root_dir, "objects")
+        self.manifests_dir = os.path.join(root_dir, "manifests")
+        Path(self.objects_dir).mkdir(parents=True, exist_ok=True)
+        Path(self.manifests_dir).mkdir(parents=True, exist_ok=True)
+        self.lock = chunk_store_locks.setdefault(os.path.normcase(os.path.abspath(root_dir)), threading.Lock())
+
+    def chunk_path(self, digest):
+        """Путь к файлу блока; первые два символа хэша задают подкаталог."""
+        return os.path.join(self.objects_dir, digest[:2], digest)
+
+    def put_chunk(self, digest, data):
+        """Запись блока, если его ещё нет в хранилище. Возвращает True для нового блока."""
+        path = self.chunk_path(digest)
+        if os.path.exists(path):
+            return False
+        Path(os.path.dirname(path)).mkdir(exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(zlib.compress(data, CHUNK_COMPRESSION_LEVEL))
+        os.replace(tmp_path, path)
+        return True
+
+    def get_chunk(self, digest):
+        """Чтение и распаковка блока с проверкой хэша."""
+        with open(self.chunk_path(digest), "rb") as f:
+            data = zlib.decompress(f.read())
+        if hashlib.sha256(data).hexdigest() != digest:
+            raise ValueError(f"Повреждён блок {digest}")
+        return data
+
+    def backup_files(self, files, name, progress=None):
+        """Разбиение файлов на блоки и запись манифеста; пишутся только новые блоки.
+        
+        Блокировка хранилища держится до записи манифеста: сборка мусора не удалит
+        уже записанные или переиспользованные блоки незавершённого бэкапа."""
+        with self.lock:
+            stats = {"bytes": 0, "new_bytes": 0, "chunks": 0, "new_chunks": 0}
+            entries = []
+            for file in files:
+                file_hash = hashlib.sha256()
+                chunks = []
+                size = 0
+                with open(file, "rb") as f:
+                    while True:
+                        data = f.read(self.chunk_size)
+                        if not data:
+                            break
+                        digest = hashlib.sha256(data).hexdigest()
+                        file_hash.update(data)
+                        chunks.append(digest)
+                        size += len(data)
+                        stats["chunks"] += 1
+                        if self.put_chunk(digest, data):
+                            stats["new_chunks"] += 1
+                            stats["new_bytes"] += len(data)
+                        if progress is not None:
+                            progress(len(data))
+                stats["bytes"] += size
+                entries.append({"name": os.path.basename(file), "size": size, "sha256": file_hash.hexdigest(), "chunks": chunks})
+        
+            manifest_path = os.path.join(self.manifests_dir, f"{name}.json")
+            tmp_path = f"{manifest_path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({
+                    "version": 1,
+                    "created": datetime.now().isoformat(timespec="seconds"),
+                    "chunk_size": self.chunk_size,
+                    "files": entries
+                }, f, indent=4)
+            os.replace(tmp_path, manifest_path)
+            return manifest_path, stats
+
+    def load_manifest(self, manifest_path):
+        """Чтение манифеста бэкапа."""
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def restore(self, manifest_path, target_dir, executor, max_pending):
+        """Сборка файлов бэкапа из блоков в target_dir с проверкой размеров и хэшей файлов.
+        
+        Блоки читаются, распаковываются и сверяются со своим хэшем на пуле executor,
+        в файл пишутся по порядку. Возвращает {имя: размер}."""
+        manifest = self.load_manifest(manifest_path)
+        Path(target_dir).mkdir(parents=True, exist_ok=True)
+        restored = {}
+        for entry in manifest["files"]:
+            name = os.path.basename(entry["name"])
+            pieces = (executor.submit(self.get_chunk, digest) for digest in entry["chunks"])
+            size, digest, _ = write_pieces(os.path.join(target_dir, name), pieces, max_pending)
+            if size != entry["size"] or digest != entry["sha256"]:
+                raise ValueError(f"Хэш восстановленного файла {name} не совпадает")
+            restored[name] = size
+        return restored
+
+    def list_manifests(self):
+        """Список манифестов от старых к новым."""
+        return sorted(os.path.join(self.manifests_dir, f) for f in os.listdir(self.manifests_dir) if f.endswith(".json"))
+
+    def collect_garbage(self):
+        """Удаление блоков, на которые не ссылается ни один манифест; ждёт завершения идущих бэкапов."""
+        with self.lock:
+            referenced = set()
+            for manifest_path in self.list_manifests():
+                for entry in self.load_manifest(manifest_path)["files"]:
+                    referenced.update(entry["chunks"])
+            removed = 0
+            for subdir in os.listdir(self.objects_dir):
+                subdir_path = os.path.join(self.objects_dir, subdir)
+                for digest in os.listdir(subdir_path):
+                    if digest not in referenced:
+                        os.remove(os.path.join(subdir_path, digest))
+                        removed += 1
+            return removed
+
+class BackupCatalog:
+    """Индекс бэкапов в backup_dir/catalog.json: список без чтения архивов."""
+
+    def __init__(self, root_dir):
+        self.root_dir = root_dir
+        self.path = os.path.join(root_dir, CATALOG_FILE)
+        self.lock = threading.Lock()
+        self.version = 0
+        self.entries = self._load()
+
+    def _load(self):
+        """Чтение каталога; при первом запуске — импорт уже лежащих в папке бэкапов."""
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                return json.load(f)["entries"]
+        except FileNotFoundError:
+            pass
+        except (json.JSONDecodeError, KeyError) as e:
+            logger.warning(f"Каталог бэкапов повреждён ({e}), выполняется повторный импорт")
+        entries = self._import_existing()
+        if entries:
+            Path(self.root_dir).mkdir(parents=True, exist_ok=True)
+            self._save(entries)
+        return entries
+
+    def _import_existing(self):
+        """Однократный импорт backup_*.zip и манифестов по именам и размерам файлов."""
+        entries = []
+        candidates = []
+        if os.path.isdir(self.root_dir):
+            candidates += [(f, "zip") for f in os.listdir(self.root_dir) if f.startswith("backup_") and f.endswith(".zip")]
+        manifests_dir = os.path.join(self.root_dir, CHUNK_STORE_DIR, "manifests")
+        if os.path.isdir(manifests_dir):
+            candidates += [(os.path.join(CHUNK_STORE_DIR, "manifests", f), "chunks") for f in os.listdir(manifests_dir) if f.startswith("backup_") and f.endswith(".json")]
+        for rel_path, kind in candidates:
+            backup_id = os.path.splitext(os.path.basename(rel_path))[0]
+            try:
+                created = datetime.strptime(backup_id[len("backup_"):], "%Y-%m-%d_%H-%M-%S")
+            except ValueError:
+                continue
+            entries.append({
+                "id": backup_id,
+                "created": created.isoformat(timespec="seconds"),
+                "kind": kind,
+                "path": rel_path,
+                "size": os.path.getsize(os.path.join(self.root_dir, rel_path)),
+                "data_size": None,
+                "files": {},
+                "build_id": None,
+                "source": "import",
+                "verified": None
+            })
+        entries.sort(key=lambda e: e["created"])
+        logger.info(f"Импортировано в каталог бэкапов: {len(entries)}")
+        return entries
+
+    def _save(self, entries):
+        """Атомарная запись каталога."""
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"version": 1, "entries": entries}, f, indent=1)
+        os.replace(tmp_path, self.path)
+
+    def add(self, entry):
+        """Добавление записи о новом бэкапе."""
+        with self.lock:
+            self.entries = [e for e in self.entries if e["id"] != entry["id"]]
+            self.entries.append(entry)
+            self.entries.sort(key=lambda e: e["created"])
+            self._save(self.entries)
+            self.version += 1
+        self._publish()
+
+    def update(self, backup_id, **fields):
+        """Изменение полей записи (например, статуса проверки)."""
+        with self.lock:
+            for entry in self.entries:
+                if entry["id"] == backup_id:
+                    entry.update(fields)
+            self._save(self.entries)
+            self.version += 1
+        self._publish()
+
+    def remove(self, backup_ids):
+        """Удаление записей из каталога."""
+        with self.lock:
+            self.entries = [e for e in self.entries if e["id"] not in backup_ids]
+            self._save(self.entries)
+            self.version += 1
+        self._publish()
+
+    def _publish(self):
+        """Событие шины об изменении каталога: окно перечитывает список только по нему."""
+        event_bus.publish("catalog", root_dir=self.root_dir, version=self.version)
+
+    def list(self):
+        """Копия списка записей от старых к новым."""
+        with self.lock:
+            return list(self.entries)
+
+    def entry_path(self, entry):
+        """Абсолютный путь к архиву или манифесту записи."""
+        return os.path.join(self.root_dir, entry["path"])
+
+def get_backup_catalog(root_dir=None):
+    """Каталог папки бэкапов (по умолчанию текущей); один объект на папку."""
+    root_dir = root_dir or backup_dir
+    if root_dir not in backup_catalogs:
+        backup_catalogs[root_dir] = BackupCatalog(root_dir)
+    return backup_catalogs[root_dir]
+
+def read_installed_build_id(install_dir=None):
+    """Build ID установленного сервера из appmanifest SteamCMD или None."""
+    manifest = os.path.join(install_dir or steamcmd_install_dir, "steamapps", f"appmanifest_{STEAM_APP_ID}.acf")
+    try:
+        with open(manifest, "r", encoding="utf-8", errors="replace") as f:
+            match = re.search(r'"buildid"\s+"(\d+)"', f.read())
+    except OSError:
+        return None
+    return match.group(1) if match else None
+
+def select_backups_to_prune(entries, policy, now):
+    """Выбор бэкапов на удаление по ярусам хранения (самый свежий в каждом интервале)."""
+    newest_first = sorted(entries, key=lambda e: e["created"], reverse=True)
+    keep = {e["id"] for e in newest_first[:policy.get("keep_last", 0)]}
+    tiers = [
+        (timedelta(hours=policy.get("hourly_hours", 0)), lambda d: d.strftime("%Y-%m-%d %H")),
+        (timedelta(days=policy.get("daily_days", 0)), lambda d: d.strftime("%Y-%m-%d")),
+        (timedelta(weeks=policy.get("weekly_weeks", 0)), lambda d: d.isocalendar()[:2]),
+    ]
+    for window, bucket_of in tiers:
+        seen = set()
+        for entry in newest_first:
+            created = datetime.fromisoformat(entry["created"])
+            if now - created > window:
+                break
+            bucket = bucket_of(created)
+            if bucket not in seen:
+                seen.add(bucket)
+                keep.add(entry["id"])
+    return [e for e in entries if e["id"] not in keep]
+
+def verify_backup(catalog, entry):
+    """Проверка целостности бэкапа: CRC архива или наличие всех блоков манифеста."""
+    import zipfile
+    path = catalog.entry_path(entry)
+    try:
+        if entry["kind"] == "zip":
+            with zipfile.ZipFile(path) as zipf:
+                return zipf.testzip() is None
+        store = ChunkStore(os.path.join(catalog.root_dir, CHUNK_STORE_DIR))
+        manifest = store.load_manifest(path)
+        return all(os.path.exists(store.chunk_path(d)) for f in manifest["files"] for d in f["chunks"])
+    except (OSError, ValueError, zipfile.BadZipFile) as e:
+        logger.error(f"Ошибка проверки бэкапа {entry['id']}: {e}")
+        return False
+
+def prune_backups(catalog):
+    """Удаление бэкапов вне политики хранения и неиспользуемых блоков."""
+    to_prune = select_backups_to_prune(catalog.list(), retention, datetime.now())
+    if not to_prune:
+        return
+    for entry in to_prune:
+        try:
+            os.remove(catalog.entry_path(entry))
+        except FileNotFoundError:
+            pass
+        logger.info(f"Удалён бэкап по политике хранения: {entry['id']}")
+        log_queue.put(f"Удалён старый бэкап: {entry['id']}")
+    catalog.remove({e["id"] for e in to_prune})
+    if any(e["kind"] == "chunks" for e in to_prune):
+        removed = ChunkStore(os.path.join(catalog.root_dir, CHUNK_STORE_DIR)).collect_garbage()
+        logger.info(f"Удалено неиспользуемых блоков: {removed}")
+
+def maintain_backup_catalogs():
+    """Проверка новых бэкапов и очистка по политике хранения в папках бэкапов всех инстансов."""
+    for root_dir in dict.fromkeys([backup_dir] + [instance.backup_dir for instance in list(instances)]):
+        try:
+            catalog = get_backup_catalog(root_dir)
+            for entry in catalog.list():
+                if entry.get("verified") is None:
+                    catalog.update(entry["id"], verified=verify_backup(catalog, entry))
+            if retention_enabled:
+                prune_backups(catalog)
+        except Exception as e:
+            logger.error(f"Ошибка обслуживания каталога бэкапов {root_dir}: {e}")
+
+def catalog_maintenance():
+    """Фоновое обслуживание каталогов по расписанию или по запросу."""
+    while not shutdown_event.is_set():
+        catalog_maintenance_event.wait(CATALOG_MAINTENANCE_INTERVAL)
+        catalog_maintenance_event.clear()
+        maintain_backup_catalogs()
+
+def compress_block(data, level, last):
+    """Сжатие блока в сырой deflate; блоки разделены полным сбросом и склеиваются в один поток."""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, -15)
+    return compressor.compress(data) + compressor.flush(zlib.Z_FINISH if last else zlib.Z_FULL_FLUSH)
+
+class ParallelZipWriter:
+    """Запись ZIP-архива с параллельным поблочным deflate-сжатием.
     
-    label = tk.Label(
-        splash,
-        text="Запуск утилиты сервера, ожидайте",
-        font=("Arial", 14),
-        fg="blue",
-        bg="white",
-        pady=20
-    )
-    label.pack(expand=True, fill="both")
+    Блоки сжимаются независимо на пуле потоков (zlib отпускает GIL) и пишутся
+    в архив по порядку, поэтому результат читается любыми стандартными ZIP-утилитами.
+    """
+
+    def __init__(self, path, compression=DEFAULT_BACKUP_COMPRESSION, level=DEFAULT_BACKUP_COMPRESSION_LEVEL, workers=DEFAULT_BACKUP_WORKERS, block_size=ZIP_BLOCK_SIZE, progress=None):
+        self.fp = open(path, "wb")
+        self.progress = progress
+        self.method = 0 if compression == "store" else 8
+        self.level = level
+        self.workers = workers or os.cpu_count() or 1
+        self.block_size = block_size
+        self.entries = []
+        self.block_index = {}
+        self.hashes = {}
+        self.executor = ThreadPoolExecutor(max_workers=self.workers) if self.method == 8 else None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+    def write(self, file, arcname):
+        """Добавление файла в архив. Возвращает число прочитанных байт."""
+        st = os.stat(file)
+        mtime = time.localtime(st.st_mtime)
+        dos_time = mtime.tm_hour << 11 | mtime.tm_min << 5 | mtime.tm_sec // 2
+        dos_date = max(mtime.tm_year - 1980, 0) << 9 | mtime.tm_mon << 5 | mtime.tm_mday
+        name = arcname.encode("utf-8")
+        zip64 = st.st_size * 1.05 > ZIP64_LIMIT
+        extra = struct.pack("<HHQQ", 1, 16, 0, 0) if zip64 else b""
+        header_offset = self.fp.tell()
+        self.fp.write(struct.pack("<IHHHHHIIIHH", 0x04034b50, 45 if zip64 else 20, 0x800, self.method, dos_time, dos_date, 0, 0, 0, len(name), len(extra)))
+        self.fp.write(name + extra)
+        data_offset = self.fp.tell()
+        
+        crc, file_size, blocks, digest = self._write_data(file)
+        self.hashes[arcname] = digest
+        
+        compress_size = self.fp.tell() - data_offset
+        if not zip64 and (file_size > ZIP64_LIMIT or compress_size > ZIP64_LIMIT):
+            raise OverflowError(f"Файл {file} изменился во время записи и превысил лимит ZIP")
+        self.fp.seek(header_offset + 14)
+        if zip64:
+            self.fp.write(struct.pack("<III", crc, ZIP64_LIMIT, ZIP64_LIMIT))
+            self.fp.seek(header_offset + 30 + len(name) + 4)
+            self.fp.write(struct.pack("<QQ", file_size, compress_size))
+        else:
+            self.fp.write(struct.pack("<III", crc, compress_size, file_size))
+        self.fp.seek(0, os.SEEK_END)
+        
+        self.entries.append((name, zip64, dos_time, dos_date, crc, compress_size, file_size, header_offset))
+        if blocks:
+            self.block_index[arcname] = blocks
+        return file_size
+
+    def _write_data(self, file):
+        """Чтение файла блоками, сжатие на пуле и запись результатов по порядку."""
+        crc = 0
+        file_hash = hashlib.sha256()
+        file_size = 0
+        blocks = []
+        pending = deque()
+        max_pending = self.workers * 2
+        written = 0
+        with open(file, "rb") as f:
+            data = f.read(self.block_size)
+            while True:
+                next_data = f.read(self.block_size) if data else b""
+                crc = zlib.crc32(data, crc)
+                file_hash.update(data)
+                if self.method == 0:
+                    self.fp.write(data)
+                else:
+                    pending.append((file_size, self.executor.submit(compress_block, data, self.level, not next_data)))
+                    while len(pending) >= max_pending:
+                        offset, future = pending.popleft()
+                        chunk = future.result()
+                        blocks.append([written, offset])
+                        self.fp.write(chunk)
+                        written += len(chunk)
+                file_size += len(data)
+                if self.progress is not None:
+                    self.progress(len(data))
+                if not next_data:
+                    break
+                data = next_data
+        while pending:
+            offset, future = pending.popleft()
+            chunk = future.result()
+            blocks.append([written, offset])
+            self.fp.write(chunk)
+            written += len(chunk)
+        return crc, file_size, blocks, file_hash.hexdigest()
+
+    def close(self):
+        """Запись центрального каталога (с ZIP64 при необходимости) и закрытие файла."""
+        cd_offset = self.fp.tell()
+        for name, zip64, dos_time, dos_date, crc, compress_size, file_size, header_offset in self.entries:
+            extra_values = []
+            if zip64:
+                extra_values += [file_size, compress_size]
+            if header_offset > ZIP64_LIMIT:
+                extra_values.append(header_offset)
+            extra = struct.pack(f"<HH{len(extra_values)}Q", 1, 8 * len(extra_values), *extra_values) if extra_values else b""
+            self.fp.write(struct.pack(
+                "<IHHHHHHIIIHHHHHII", 0x02014b50, 45, 45 if extra else 20, 0x800, self.method, dos_time, dos_date, crc,
+                ZIP64_LIMIT if zip64 else compress_size, ZIP64_LIMIT if zip64 else file_size,
+                len(name), len(extra), 0, 0, 0, 0, min(header_offset, ZIP64_LIMIT)))
+            self.fp.write(name + extra)
+        cd_end = self.fp.tell()
+        cd_size = cd_end - cd_offset
+        count = len(self.entries)
+        if count >= 0xFFFF or cd_offset > ZIP64_LIMIT or cd_size > ZIP64_LIMIT:
+            self.fp.write(struct.pack("<IQHHIIQQQQ", 0x06064b50, 44, 45, 45, 0, 0, count, count, cd_size, cd_offset))
+            self.fp.write(struct.pack("<IIQI", 0x07064b50, 0, cd_end, 1))
+        self.fp.write(struct.pack("<IHHHHIIH", 0x06054b50, 0, 0, min(count, 0xFFFF), min(count, 0xFFFF), min(cd_size, ZIP64_LIMIT), min(cd_offset, ZIP64_LIMIT), 0))
+        self.fp.close()
+        if self.executor:
+            self.executor.shutdown()
+
+    def abort(self):
+        """Закрытие без записи каталога (архив считается испорченным)."""
+        self.fp.close()
+        if self.executor:
+            self.executor.shutdown()
+
+OutputLine = namedtuple("OutputLine", "timestamp stream text")
+
+class ChildProcess:
+    """Дочерний процесс под управлением ChildOutputMux с интерфейсом, как у subprocess.Popen."""
+
+    def __init__(self, mux, args):
+        self.mux = mux
+        self.args = args
+        self.process = None
+        self.pid = None
+        self.returncode = None
+        self.exit_time = None
+        self.exited = threading.Event()
+
+    def poll(self):
+        """Код возврата или None, если процесс ещё работает."""
+        return self.returncode if self.exited.is_set() else None
+
+    def wait(self, timeout=None):
+        """Ожидание завершения процесса."""
+        if not self.exited.wait(timeout):
+            raise subprocess.TimeoutExpired(self.args, timeout)
+        return self.returncode
+
+    def _signal(self, method):
+        try:
+            getattr(self.process, method)()
+        except ProcessLookupError:
+            pass
+
+    def terminate(self):
+        self.mux.loop.call_soon_threadsafe(self._signal, "terminate")
+
+    def kill(self):
+        self.mux.loop.call_soon_threadsafe(self._signal, "kill")
+
+class ChildOutputMux:
+    """Один поток asyncio одновременно читает stdout и stderr всех дочерних процессов.
     
-    splash.update()
-    logger.info("Экран загрузки отображен")
-    return splash
+    Каналы читаются блоками до CHILD_READ_SIZE байт и декодируются инкрементально;
+    строки блока получают монотонную метку времени и тег потока и уходят в sink
+    одной пачкой, поэтому заполнение одного канала не блокирует другой.
+    """
+
+    def __init__(self):
+        self.loop = None
+        self.lock = threading.Lock()
+        self.encoding = locale.getpreferredencoding(False)
+
+    def _ensure_loop(self):
+        import asyncio
+        with self.lock:
+            if self.loop is None:
+                # Для дочерних процессов в Windows нужен Proactor-цикл
+                self.loop = asyncio.ProactorEventLoop() if sys.platform == "win32" else asyncio.new_event_loop()
+                threading.Thread(target=self.loop.run_forever, name="child-output", daemon=True).start()
+        return self.loop
+
+    def spawn(self, args, sink, on_exit=None, **popen_kwargs):
+        """Запуск процесса; вывод передаётся пачками в sink([OutputLine, ...]), по завершении вызывается on_exit(child)."""
+        import asyncio
+        loop = self._ensure_loop()
+        child = ChildProcess(self, args)
+        future = asyncio.run_coroutine_threadsafe(self._start(child, sink, on_exit, popen_kwargs), loop)
+        future.result()
+        return child
+
+    async def _start(self, child, sink, on_exit, popen_kwargs):
+        import asyncio
+        child.process = await asyncio.create_subprocess_exec(
+            *child.args,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+            limit=CHILD_LINE_LIMIT,
+            **popen_kwargs
+        )
+        child.pid = child.process.pid
+        asyncio.ensure_future(self._pump(child.process.stdout, "stdout", sink))
+        asyncio.ensure_future(self._pump(child.process.stderr, "stderr", sink))
+        asyncio.ensure_future(self._wait(child, on_exit))
+
+    async def _pump(self, stream, tag, sink):
+        decoder = codecs.getincrementaldecoder(self.encoding)(errors="replace")
+        partial = ""
+        overlong = False
+        while True:
+            chunk = await stream.read(CHILD_READ_SIZE)
+            parts = (partial + decoder.decode(chunk, final=not chunk)).split("\n")
+            partial = parts.pop()
+            if overlong and parts:
+                # Хвост слишком длинной строки до её перевода строки
+                parts.pop(0)
+                overlong = False
+            now = time.monotonic()
+            notice = f"Строка длиннее {CHILD_LINE_LIMIT} символов пропущена"
+            # Строка могла целиком прийти за одно чтение и не задержаться в partial
+            batch = [OutputLine(now, tag, notice if len(part) > CHILD_LINE_LIMIT else part.strip()) for part in parts]
+            if len(partial) > CHILD_LINE_LIMIT:
+                if not overlong:
+                    batch.append(OutputLine(now, tag, notice))
+                overlong = True
+                partial = ""
+            if not chunk and partial and not overlong:
+                batch.append(OutputLine(now, tag, partial.strip()))
+            if batch:
+                sink(batch)
+            if not chunk:
+                break
+
+    async def _wait(self, child, on_exit):
+        child.returncode = await child.process.wait()
+        child.exit_time = time.monotonic()
+        child.exited.set()
+        if on_exit:
+            on_exit(child)
+
+output_mux = ChildOutputMux()
+
+def queue_output_lines(lines):
+    """Передача пачки строк вывода дочернего процесса в консоль логов."""
+    log_queue.put_many(line.text if line.stream == "stdout" else f"STDERR: {line.text}" for line in lines)
+
+def handle_server_output(lines):
+    """Пачка строк вывода сервера: консоль логов и извлечение событий."""
+    queue_output_lines(lines)
+    watchdog.note_output(lines[-1].timestamp)
+    for line in lines:
+        event = extract_event(line)
+        if event is not None:
+            event_store.put(event)
+
+def extract_event(line):
+    """Структурированное событие из строки вывода сервера или None."""
+    for event_type, pattern in EVENT_PATTERNS:
+        match = pattern.search(line.text)
+        if match:
+            # Монотонная метка строки переводится в настенное время
+            event = {"ts": round(time.time() - (time.monotonic() - line.timestamp), 3), "type": event_type}
+            event.update({k: v for k, v in match.groupdict().items() if v is not None})
+            event["text"] = line.text
+            return event
+    return None
+
+class EventStore:
+    """Хранилище событий: сжатые посуточные сегменты и индекс блоков.
+    
+    Каждый сброс дописывает в сегмент events/ГГГГ-ММ-ДД.jsonl.gz отдельный gzip-блок;
+    ГГГГ-ММ-ДД.idx.json хранит смещение, интервал времени и счётчики типов каждого
+    блока, а index.json — сводку по сегментам. Запросы читают только нужные блоки.
+    """
+
+    def __init__(self, root_dir=EVENTS_DIR):
+        self.root_dir = root_dir
+        self.queue = queue.Queue()
+        self.lock = threading.Lock()
+        self.summary_path = os.path.join(root_dir, "index.json")
+        self.summary = None
+        self.thread = None
+
+    def start(self):
+        """Запуск фонового потока записи."""
+        Path(self.root_dir).mkdir(parents=True, exist_ok=True)
+        self.summary = self._read_json(self.summary_path, {})
+        self.thread = threading.Thread(target=self._writer, name="event-store", daemon=True)
+        self.thread.start()
+
+    def put(self, event):
+        self.queue.put(event)
+
+    def _read_json(self, path, default):
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return default
+
+    def _write_json(self, path, data):
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f)
+        os.replace(tmp_path, path)
+
+    def _writer(self):
+        while True:
+            batch = [self.queue.get()]
+            deadline = time.monotonic() + EVENT_FLUSH_INTERVAL
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self.queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            try:
+                self.flush(batch)
+            except OSError as e:
+                logger.error(f"Ошибка записи событий: {e}")
+
+    def flush(self, events):
+        """Запись пачки событий блоками по суткам."""
+        by_segment = {}
+        for event in events:
+            segment = datetime.fromtimestamp(event["ts"]).strftime("%Y-%m-%d")
+            by_segment.setdefault(segment, []).append(event)
+        with self.lock:
+            for segment, segment_events in by_segment.items():
+                data_path = os.path.join(self.root_dir, f"{segment}.jsonl.gz")
+                payload = "".join(json.dumps(e, ensure_ascii=False) + "\n" for e in segment_events).encode("utf-8")
+                block = gzip.compress(payload)
+                with open(data_path, "ab") as f:
+                    offset = f.tell()
+                    f.write(block)
+                counts = {}
+                for e in segment_events:
+                    counts[e["type"]] = counts.get(e["type"], 0) + 1
+                start = min(e["ts"] for e in segment_events)
+                end = max(e["ts"] for e in segment_events)
+                index_path = os.path.join(self.root_dir, f"{segment}.idx.json")
+                blocks = self._read_json(index_path, [])
+                blocks.append([offset, len(block), start, end, counts])
+                self._write_json(index_path, blocks)
+                info = self.summary.setdefault(segment, {"start": start, "end": end, "counts": {}})
+                info["start"] = min(info["start"], start)
+                info["end"] = max(info["end"], end)
+                for event_type, count in counts.items():
+                    info["counts"][event_type] = info["counts"].get(event_type, 0) + count
+            self._write_json(self.summary_path, self.summary)
+
+    def _blocks(self, start, end, types):
+        """Блоки, пересекающиеся с интервалом и содержащие нужные типы."""
+        for segment, info in sorted(self.summary.items()):
+            if info["end"] < start or info["start"] > end:
+                continue
+            if types and not any(info["counts"].get(t) for t in types):
+                continue
+            for block in self._read_json(os.path.join(self.root_dir, f"{segment}.idx.json"), []):
+                offset, length, block_start, block_end, counts = block
+                if block_end < start or block_start > end:
+                    continue
+                if types and not any(counts.get(t) for t in types):
+                    continue
+                yield segment, block
+
+    def query(self, start, end, types=None, limit=1000):
+        """События за интервал [start, end] (unix-время) указанных типов, от старых к новым."""
+        result = []
+        with self.lock:
+            for segment, (offset, length, *_rest) in self._blocks(start, end, types):
+                with open(os.path.join(self.root_dir, f"{segment}.jsonl.gz"), "rb") as f:
+                    f.seek(offset)
+                    payload = gzip.decompress(f.read(length))
+                for raw in payload.splitlines():
+                    event = json.loads(raw)
+                    if start <= event["ts"] <= end and (not types or event["type"] in types):
+                        result.append(event)
+                        if len(result) >= limit:
+                            return result
+        return result
+
+    def count(self, start, end, types=None):
+        """Число событий за интервал; полностью попавшие блоки считаются по индексу."""
+        total = 0
+        partial = []
+        with self.lock:
+            for segment, block in self._blocks(start, end, types):
+                _offset, _length, block_start, block_end, counts = block
+                if start <= block_start and block_end <= end:
+                    total += sum(n for t, n in counts.items() if not types or t in types)
+                else:
+                    partial.append(block)
+        for block in partial:
+            total += len(self.query(max(start, block[2]), min(end, block[3]), types, limit=10 ** 9))
+        return total
+
+event_store = EventStore()
+
+class MetricRing:
+    """Кольцевой буфер временного ряда на array('d'): по массиву на каждое поле."""
+
+    def __init__(self, fields, capacity):
+        self.fields = fields
+        self.capacity = capacity
+        self.columns = {f: array.array("d", bytes(8 * capacity)) for f in fields}
+        self.head = 0
+        self.size = 0
+        self.lock = threading.Lock()
+
+    def append(self, sample):
+        with self.lock:
+            for field in self.fields:
+                self.columns[field][self.head] = sample[field]
+            self.head = (self.head + 1) % self.capacity
+            self.size = min(self.size + 1, self.capacity)
+
+    def series(self, field):
+        """Значения поля от старых к новым."""
+        with self.lock:
+            column = self.columns[field]
+            start = (self.head - self.size) % self.capacity
+            if start + self.size <= self.capacity:
+                return column[start:start + self.size].tolist()
+            return column[start:].tolist() + column[:self.head].tolist()
+
+    def rows(self):
+        """Все точки как список словарей."""
+        columns = [self.series(f) for f in self.fields]
+        return [dict(zip(self.fields, values)) for values in zip(*columns)]
+
+    def clear(self):
+        with self.lock:
+            self.head = 0
+            self.size = 0
+
+class ProcProcessStats:
+    """Счётчики процесса из /proc (Linux)."""
+
+    def __init__(self, pid):
+        self.pid = pid
+        self.ticks = os.sysconf("SC_CLK_TCK")
+        self.page_size = os.sysconf("SC_PAGE_SIZE")
+
+    def read(self):
+        with open(f"/proc/{self.pid}/stat", "r") as f:
+            data = f.read()
+        # Имя процесса может содержать пробелы, поля начинаются после последней ')'
+        fields = data[data.rindex(")") + 2:].split()
+        stats = {
+            "cpu_seconds": (int(fields[11]) + int(fields[12])) / self.ticks,
+            "rss_bytes": int(fields[21]) * self.page_size,
+            "threads": int(fields[17]),
+            "handles": len(os.listdir(f"/proc/{self.pid}/fd")),
+            "read_bytes": 0,
+            "write_bytes": 0,
+        }
+        try:
+            with open(f"/proc/{self.pid}/io", "r") as f:
+                io = dict(line.split(": ") for line in f.read().splitlines())
+            stats["read_bytes"] = int(io["read_bytes"])
+            stats["write_bytes"] = int(io["write_bytes"])
+        except (OSError, KeyError, ValueError):
+            pass
+        return stats
+
+    def close(self):
+        pass
+
+class WindowsProcessStats:
+    """Счётчики процесса через Win32 API (ctypes)."""
+
+    PROCESS_QUERY_LIMITED_INFORMATION = 0x1000
+    TH32CS_SNAPTHREAD = 0x4
+    MemoryCounters = IoCounters = ThreadEntry = None
+
+    @classmethod
+    def define_structures(cls):
+        """Структуры Win32 создаются при первом замере, чтобы ctypes не импортировался при запуске."""
+        import ctypes
+
+        class MemoryCounters(ctypes.Structure):
+            _fields_ = [("cb", ctypes.c_ulong), ("PageFaultCount", ctypes.c_ulong)] + [
+                (name, ctypes.c_size_t) for name in (
+                    "PeakWorkingSetSize", "WorkingSetSize", "QuotaPeakPagedPoolUsage", "QuotaPagedPoolUsage",
+                    "QuotaPeakNonPagedPoolUsage", "QuotaNonPagedPoolUsage", "PagefileUsage", "PeakPagefileUsage")]
+
+        class IoCounters(ctypes.Structure):
+            _fields_ = [(name, ctypes.c_ulonglong) for name in (
+                "ReadOperationCount", "WriteOperationCount", "OtherOperationCount",
+                "ReadTransferCount", "WriteTransferCount", "OtherTransferCount")]
+
+        class ThreadEntry(ctypes.Structure):
+            _fields_ = [("dwSize", ctypes.c_ulong), ("cntUsage", ctypes.c_ulong), ("th32ThreadID", ctypes.c_ulong),
+                        ("th32OwnerProcessID", ctypes.c_ulong), ("tpBasePri", ctypes.c_long), ("tpDeltaPri", ctypes.c_long),
+                        ("dwFlags", ctypes.c_ulong)]
+
+        cls.MemoryCounters, cls.IoCounters, cls.ThreadEntry = MemoryCounters, IoCounters, ThreadEntry
+
+    def __init__(self, pid):
+        import ctypes
+        from ctypes import wintypes
+        if self.ThreadEntry is None:
+            self.define_structures()
+        self.pid = pid
+        self.kernel32 = ctypes.WinDLL("kernel32", use_last_error=True)
+        self.kernel32.OpenProcess.restype = wintypes.HANDLE
+        self.kernel32.OpenProcess.argtypes = [wintypes.DWORD, wintypes.BOOL, wintypes.DWORD]
+        self.kernel32.CreateToolhelp32Snapshot.restype = wintypes.HANDLE
+        self.kernel32.CreateToolhelp32Snapshot.argtypes = [wintypes.DWORD, wintypes.DWORD]
+        filetime_ptr = ctypes.POINTER(wintypes.FILETIME)
+        self.kernel32.GetProcessTimes.argtypes = [wintypes.HANDLE, filetime_ptr, filetime_ptr, filetime_ptr, filetime_ptr]
+        self.kernel32.K32GetProcessMemoryInfo.argtypes = [wintypes.HANDLE, ctypes.POINTER(self.MemoryCounters), wintypes.DWORD]
+        self.kernel32.GetProcessHandleCount.argtypes = [wintypes.HANDLE, ctypes.POINTER(wintypes.DWORD)]
+        self.kernel32.GetProcessIoCounters.argtypes = [wintypes.HANDLE, ctypes.POINTER(self.IoCounters)]
+        self.kernel32.Thread32First.argtypes = [wintypes.HANDLE, ctypes.POINTER(self.ThreadEntry)]
+        self.kernel32.Thread32Next.argtypes = [wintypes.HANDLE, ctypes.POINTER(self.ThreadEntry)]
+        self.kernel32.CloseHandle.argtypes = [wintypes.HANDLE]
+        self.handle = self.kernel32.OpenProcess(self.PROCESS_QUERY_LIMITED_INFORMATION, False, pid)
+        if not self.handle:
+            raise ctypes.WinError(ctypes.get_last_error())
+
+    def count_threads(self):
+        import ctypes
+        snapshot = self.kernel32.CreateToolhelp32Snapshot(self.TH32CS_SNAPTHREAD, 0)
+        entry = self.ThreadEntry()
+        entry.dwSize = ctypes.sizeof(entry)
+        count = 0
+        try:
+            ok = self.kernel32.Thread32First(snapshot, ctypes.byref(entry))
+            while ok:
+                if entry.th32OwnerProcessID == self.pid:
+                    count += 1
+                ok = self.kernel32.Thread32Next(snapshot, ctypes.byref(entry))
+        finally:
+            self.kernel32.CloseHandle(snapshot)
+        return count
+
+    def read(self):
+        import ctypes
+        from ctypes import wintypes
+        creation, exit_time, kernel, user = (wintypes.FILETIME() for _ in range(4))
+        self.kernel32.GetProcessTimes(self.handle, ctypes.byref(creation), ctypes.byref(exit_time), ctypes.byref(kernel), ctypes.byref(user))
+        memory = self.MemoryCounters()
+        memory.cb = ctypes.sizeof(memory)
+        self.kernel32.K32GetProcessMemoryInfo(self.handle, ctypes.byref(memory), memory.cb)
+        handles = wintypes.DWORD()
+        self.kernel32.GetProcessHandleCount(self.handle, ctypes.byref(handles))
+        io = self.IoCounters()
+        self.kernel32.GetProcessIoCounters(self.handle, ctypes.byref(io))
+        filetime = lambda ft: (ft.dwHighDateTime << 32 | ft.dwLowDateTime) / 1e7
+        return {
+            "cpu_seconds": filetime(kernel) + filetime(user),
+            "rss_bytes": memory.WorkingSetSize,
+            "threads": self.count_threads(),
+            "handles": handles.value,
+            "read_bytes": io.ReadTransferCount,
+            "write_bytes": io.WriteTransferCount,
+        }
+
+    def close(self):
+        self.kernel32.CloseHandle(self.handle)
+
+def open_process_stats(pid):
+    """Источник счётчиков процесса для текущей платформы."""
+    if sys.platform == "win32":
+        return WindowsProcessStats(pid)
+    if os.path.isdir(f"/proc/{pid}"):
+        return ProcProcessStats(pid)
+    raise OSError(f"Нет источника телеметрии для процесса {pid}")
+
+def rss_growth_rate(times, values):
+    """Скорость роста (МБ/ч) по методу наименьших квадратов."""
+    n = len(times)
+    mean_t = sum(times) / n
+    mean_v = sum(values) / n
+    variance = sum((t - mean_t) ** 2 for t in times)
+    if variance == 0:
+        return 0.0
+    slope = sum((t - mean_t) * (v - mean_v) for t, v in zip(times, values)) / variance
+    return slope * 3600
+
+class TelemetrySampler:
+    """Периодический сбор CPU, памяти, потоков, дескрипторов и I/O процесса сервера."""
+
+    def __init__(self, capacity=TELEMETRY_CAPACITY):
+        self.ring = MetricRing(TELEMETRY_FIELDS, capacity)
+        self.event = threading.Event()
+        self.lock = threading.Lock()
+        self.stats = None
+        self.previous = None
+        self.policy_fired = False
+        self.thread = None
+
+    def attach(self, pid):
+        """Начало сбора для нового процесса."""
+        with self.lock:
+            self.detach_locked()
+            try:
+                self.stats = open_process_stats(pid)
+            except OSError as e:
+                logger.warning(f"Телеметрия недоступна: {e}")
+                return
+            self.policy_fired = False
+        if self.thread is None:
+            self.thread = threading.Thread(target=self.run, name="telemetry", daemon=True)
+            self.thread.start()
+        self.event.set()
+
+    def detach(self):
+        with self.lock:
+            self.detach_locked()
+
+    def detach_locked(self):
+        if self.stats is not None:
+            self.stats.close()
+        self.stats = None
+        self.previous = None
+
+    def run(self):
+        while not shutdown_event.is_set():
+            self.event.wait(telemetry_interval)
+            self.event.clear()
+            with self.lock:
+                if self.stats is None:
+                    continue
+                try:
+                    raw = self.stats.read()
+                except (OSError, ValueError, IndexError):
+                    self.detach_locked()
+                    continue
+                now = time.time()
+                previous, self.previous = self.previous, (now, raw)
+            if previous is None:
+                continue
+            elapsed = max(now - previous[0], 1e-6)
+            self.ring.append({
+                "time": now,
+                "cpu_percent": (raw["cpu_seconds"] - previous[1]["cpu_seconds"]) / elapsed * 100,
+                "rss_mb": raw["rss_bytes"] / 1048576,
+                "threads": raw["threads"],
+                "handles": raw["handles"],
+                "read_mb": raw["read_bytes"] / 1048576,
+                "write_mb": raw["write_bytes"] / 1048576,
+            })
+            self.check_policy(now)
+
+    def check_policy(self, now):
+        """Плановый рестарт при превышении лимита памяти или скорости её роста."""
+        if self.policy_fired or not primary_instance.running:
+            return
+        rss = self.ring.series("rss_mb")
+        times = self.ring.series("time")
+        reason = None
+        if rss_limit_mb and rss[-1] > rss_limit_mb:
+            reason = f"память {rss[-1]:.0f} МБ > {rss_limit_mb} МБ"
+        elif rss_growth_limit_mb_per_hour:
+            window = [(t, v) for t, v in zip(times, rss) if now - t <= TELEMETRY_GROWTH_WINDOW]
+            if len(window) >= TELEMETRY_GROWTH_MIN_SAMPLES:
+                rate = rss_growth_rate([t for t, _ in window], [v for _, v in window])
+                if rate > rss_growth_limit_mb_per_hour:
+                    reason = f"рост памяти {rate:.0f} МБ/ч > {rss_growth_limit_mb_per_hour} МБ/ч"
+        if reason:
+            self.policy_fired = True
+            logger.warning(f"Политика памяти: {reason}")
+            log_queue.put(f"Политика памяти: {reason}, запланирован рестарт")
+            request_restart(reason, "memory")
+
+def write_telemetry_csv(path, rows):
+    """Запись точек телеметрии в CSV."""
+    import csv
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(TELEMETRY_FIELDS)
+        for row in rows:
+            writer.writerow([datetime.fromtimestamp(row["time"]).isoformat(timespec="seconds")] + [f"{row[field]:.2f}" for field in TELEMETRY_FIELDS[1:]])
+
+telemetry = TelemetrySampler()
+
+def resolve_query_port():
+    """Порт запросов Steam: из настроек, из -QueryPort=, иначе игровой порт + 1."""
+    if watchdog_query_port:
+        return watchdog_query_port
+    ports = {}
+    for arg in server_args:
+        match = re.match(r"-(port|queryport)=(\d+)$", arg, re.IGNORECASE)
+        if match:
+            ports[match.group(1).lower()] = int(match.group(2))
+    if "queryport" in ports:
+        return ports["queryport"]
+    if "port" in ports:
+        return ports["port"] + 1
+    return None
+
+def probe_query_port(port, timeout=WATCHDOG_PROBE_TIMEOUT):
+    """Отвечает ли сервер на локальный запрос A2S_INFO (любой ответ, включая challenge)."""
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        sock.settimeout(timeout)
+        try:
+            sock.sendto(A2S_INFO_REQUEST, ("127.0.0.1", port))
+            return bool(sock.recvfrom(1400)[0])
+        except OSError:
+            return False
+
+def cpu_stuck(samples):
+    """CPU весь период около нуля или ровно на целом числе ядер."""
+    if not samples:
+        return False
+    if all(value < WATCHDOG_CPU_IDLE for value in samples):
+        return True
+    cores = round(samples[0] / 100)
+    return cores >= 1 and all(abs(value - cores * 100) <= WATCHDOG_CPU_PINNED_TOLERANCE for value in samples)
+
+class HangWatchdog:
+    """Обнаружение зависшего, но не завершившегося сервера.
+    
+    Признаки жизни: время последней строки вывода, ответ порта запросов и
+    динамика CPU из телеметрии. Сервер считается зависшим, если порт не отвечает
+    дольше grace, либо вывод молчит дольше grace при застывшем CPU.
+    """
+
+    def __init__(self, probe=probe_query_port):
+        self.probe = probe
+        self.event = threading.Event()
+        self.lock = threading.Lock()
+        self.process = None
+        self.thread = None
+        self.detections = []
+
+    def attach(self, process):
+        """Начало наблюдения за новым процессом."""
+        now = time.monotonic()
+        with self.lock:
+            self.process = process
+            self.started = now
+            self.last_output = now
+            self.last_probe_ok = None
+            self.fired = False
+        if self.thread is None:
+            self.thread = threading.Thread(target=self.run, name="watchdog", daemon=True)
+            self.thread.start()
+
+    def detach(self):
+        with self.lock:
+            self.process = None
+
+    def note_output(self, timestamp):
+        self.last_output = timestamp
+
+    def evaluate(self, now, port, cpu_samples):
+        """Причина зависания или None. Возвращает (причина, момент последнего признака жизни)."""
+        if now - self.started < watchdog_startup_grace:
+            return None, None
+        if port is not None and self.last_probe_ok is not None and now - self.last_probe_ok > watchdog_grace:
+            return f"порт {port} не отвечает {now - self.last_probe_ok:.0f} с", self.last_probe_ok
+        if now - self.last_output > watchdog_grace and cpu_stuck(cpu_samples):
+            return f"нет вывода {now - self.last_output:.0f} с, CPU застыл на {cpu_samples[-1]:.0f}%", self.last_output
+        return None, None
+
+    def run(self):
+        while not shutdown_event.is_set():
+            self.event.wait(WATCHDOG_CHECK_INTERVAL)
+            with self.lock:
+                process = self.process
+            if not watchdog_enabled or process is None or process.poll() is not None or self.fired:
+                continue
+            port = resolve_query_port()
+            if port is not None and self.probe(port):
+                self.last_probe_ok = time.monotonic()
+            now = time.monotonic()
+            window_start = time.time() - watchdog_grace
+            cpu_samples = [row["cpu_percent"] for row in telemetry.ring.rows() if row["time"] >= window_start]
+            reason, last_alive = self.evaluate(now, port, cpu_samples)
+            if reason and process is self.process:
+                self.fired = True
+                latency = now - last_alive
+                self.detections.append({"time": time.time(), "reason": reason, "latency": latency})
+                logger.error(f"Сервер завис ({reason}), обнаружено через {latency:.0f} с после последнего признака жизни")
+                log_queue.put(f"Сервер завис ({reason}), обнаружено через {latency:.0f} с, выполняется рестарт")
+                request_restart(f"зависание: {reason}", "watchdog")
+
+watchdog = HangWatchdog()
+
+class InotifyWatch:
+    """Наблюдение за каталогом через inotify (Linux) средствами ctypes."""
+
+    def __init__(self, directory):
+        import ctypes
+        libc = ctypes.CDLL(None, use_errno=True)
+        self.fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1")
+        if libc.inotify_add_watch(self.fd, os.fsencode(directory), INOTIFY_MASK) < 0:
+            error = ctypes.get_errno()
+            os.close(self.fd)
+            raise OSError(error, f"inotify_add_watch {directory}")
+
+    def wait(self, timeout):
+        """Имена изменившихся файлов каталога; пустое множество по таймауту."""
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        names = set()
+        while ready:
+            try:
+                data = os.read(self.fd, 65536)
+            except BlockingIOError:
+                break
+            offset = 0
+            while offset < len(data):
+                length = struct.unpack_from("iIII", data, offset)[3]
+                names.add(os.fsdecode(data[offset + 16:offset + 16 + length].rstrip(b"\0")))
+                offset += 16 + length
+        return names
+
+    def close(self):
+        os.close(self.fd)
+
+class SaveWatcher:
+    """Индекс файлов сохранений основного сервера: размер, mtime и изменения с последнего бэкапа.
+    
+    Изменения узнаются через inotify (Linux) или опросом раз в SAVE_WATCH_POLL_INTERVAL.
+    Из заголовков новых кадров SCUM.db-wal читаются номера изменённых страниц базы,
+    изменение самого SCUM.db в режиме WAL означает контрольную точку (checkpoint).
+    При change_backup_enabled онлайн-бэкап запускается после контрольной точки
+    или после change_backup_mb МБ изменений; бэкап конвейера без изменений пропускается."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.directory = None
+        self.backend = None
+        self.files = {}
+        self.baseline = {}
+        self.pages = {}
+        self.page_size = 0
+        self.wal_salt = None
+        self.wal_offset = 0
+        self.seq = 0
+        self.checkpoints = 0
+        self.checkpoint_pending = False
+        self.last_backup = None
+        self.last_trigger = None
+
+    def reset(self, directory):
+        """Новый каталог: базовая линия - файлы, не менявшиеся после последнего бэкапа из каталога."""
+        entries = get_backup_catalog().list()
+        with self.lock:
+            self.directory = directory
+            self.files = {}
+            self.pages = {}
+            self.page_size = 0
+            self.wal_salt = None
+            self.wal_offset = 0
+            self.checkpoint_pending = False
+            self.last_backup = entries[-1]["created"] if entries else None
+            self._scan()
+            threshold = datetime.fromisoformat(self.last_backup).timestamp() if self.last_backup else None
+            self.baseline = {name: signature for name, signature in self.files.items() if threshold is not None and signature[1] / 1e9 <= threshold}
+
+    def scan(self):
+        with self.lock:
+            self._scan()
+
+    def _scan(self):
+        files = {}
+        for name in SAVE_FILES:
+            try:
+                st = os.stat(os.path.join(self.directory, name))
+            except FileNotFoundError:
+                continue
+            files[name] = (st.st_size, st.st_mtime_ns)
+        db_name, wal_name = SAVE_FILES[0], f"{SAVE_FILES[0]}-wal"
+        if self.page_size and db_name in self.files and files.get(db_name) != self.files[db_name]:
+            self.checkpoints += 1
+            self.checkpoint_pending = True
+        if files.get(wal_name) != self.files.get(wal_name):
+            self._read_wal(os.path.join(self.directory, wal_name), files[wal_name][0] if wal_name in files else 0)
+        self.files = files
+
+    def _read_wal(self, path, size):
+        """Номера страниц из новых кадров WAL; после смены salt WAL читается с начала."""
+        try:
+            with open(path, "rb") as f:
+                header = f.read(WAL_HEADER_SIZE)
+                if len(header) < WAL_HEADER_SIZE:
+                    self.wal_salt = None
+                    return
+                magic, _, page_size, _, salt1, salt2 = struct.unpack(">6I", header[:24])
+                if magic not in WAL_MAGIC:
+                    return
+                if (salt1, salt2) != self.wal_salt or size < self.wal_offset:
+                    self.wal_salt = (salt1, salt2)
+                    self.wal_offset = WAL_HEADER_SIZE
+                self.page_size = page_size
+                frame_size = WAL_FRAME_HEADER_SIZE + page_size
+                while self.wal_offset + frame_size <= size:
+                    f.seek(self.wal_offset)
+                    page, _, frame_salt1, frame_salt2 = struct.unpack(">4I", f.read(16))
+                    if (frame_salt1, frame_salt2) != self.wal_salt:
+                        break
+                    self.seq += 1
+                    self.pages[page] = self.seq
+                    self.wal_offset += frame_size
+        except FileNotFoundError:
+            self.wal_salt = None
+        except (OSError, struct.error) as e:
+            logger.debug(f"Ошибка чтения {path}: {e}")
+
+    def changed_files(self):
+        # SCUM.db-shm - только индекс WAL, его изменения не означают новых данных
+        return [name for name, signature in self.files.items() if not name.endswith("-shm") and self.baseline.get(name) != signature]
+
+    def changed_bytes(self):
+        """Объём изменений: изменённые страницы из WAL или размер изменённых файлов без WAL."""
+        if self.page_size:
+            return len(self.pages) * self.page_size
+        return sum(self.files[name][0] for name in self.changed_files())
+
+    def watching(self):
+        return self.directory is not None and self.directory == os.path.normpath(save_dir)
+
+    def observed(self):
+        """Метка состояния перед бэкапом для mark_backup; None, если каталог не отслеживается."""
+        if not self.watching():
+            return None
+        with self.lock:
+            self._scan()
+            return self.seq, dict(self.files), self.checkpoints
+
+    def mark_backup(self, token):
+        """Бэкап с состояния token завершён: изменения до него больше не считаются."""
+        if token is None:
+            return
+        seq, files, checkpoints = token
+        with self.lock:
+            self.baseline = files
+            self.pages = {page: page_seq for page, page_seq in self.pages.items() if page_seq > seq}
+            # Контрольная точка во время бэкапа в него не попала: следующий бэкап всё ещё нужен
+            if self.checkpoints == checkpoints:
+                self.checkpoint_pending = False
+            self.last_backup = datetime.now().isoformat(timespec="seconds")
+
+    def unchanged(self):
+        """True, если сохранения не менялись с последнего бэкапа (по свежему обходу каталога)."""
+        if not self.watching():
+            return False
+        with self.lock:
+            self._scan()
+            return bool(self.files) and not self.changed_files()
+
+    def backup_due(self):
+        """Причина бэкапа по изменениям или None."""
+        with self.lock:
+            if not self.changed_files():
+                return None
+            if self.checkpoint_pending:
+                return "контрольная точка WAL"
+            changed = self.changed_bytes()
+            if changed >= change_backup_mb * 1048576:
+                return f"изменено {changed / 1048576:.0f} МБ"
+        return None
+
+    def status(self):
+        with self.lock:
+            changed = self.changed_files()
+            regions = []
+            for page in sorted(self.pages):
+                if regions and page == regions[-1][1] + 1:
+                    regions[-1][1] = page
+                else:
+                    regions.append([page, page])
+            return {
+                "directory": self.directory,
+                "backend": self.backend,
+                "files": {name: {"size": size, "mtime": mtime_ns / 1e9, "changed": name in changed} for name, (size, mtime_ns) in self.files.items()},
+                "changed": bool(changed),
+                "changed_bytes": self.changed_bytes(),
+                "changed_pages": len(self.pages),
+                "page_size": self.page_size,
+                "regions": [[(first - 1) * self.page_size, last * self.page_size] for first, last in regions[:SAVE_REGIONS_LIMIT]],
+                "checkpoints": self.checkpoints,
+                "last_backup": self.last_backup,
+            }
+
+    def open_watch(self, directory):
+        if sys.platform.startswith("linux"):
+            try:
+                watch = InotifyWatch(directory)
+                self.backend = "inotify"
+                return watch
+            except (OSError, AttributeError) as e:
+                logger.warning(f"inotify недоступен ({e}), изменения сохранений отслеживаются опросом")
+        self.backend = "polling"
+        return None
+
+    def maybe_backup(self):
+        """Онлайн-бэкап по изменениям, не чаще CHANGE_BACKUP_MIN_INTERVAL.
+        
+        Пока идёт конвейер перезапуска какого-либо экземпляра, бэкап не запускается:
+        сервер останавливается, а конвейер сам делает бэкап остановленного сервера.
+        Отметка контрольной точки снимается только завершённым бэкапом (mark_backup)."""
+        if not change_backup_enabled:
+            return
+        if any(instance.pipeline is not None for instance in list(instances)):
+            return
+        if self.last_trigger is not None and time.monotonic() - self.last_trigger < CHANGE_BACKUP_MIN_INTERVAL:
+            return
+        reason = self.backup_due()
+        if reason is None:
+            return
+        try:
+            submit_backup_job("change", perform_online_backup, exclusive=True)
+        except RuntimeError:
+            # Идёт другой бэкап: повторная попытка на следующем обходе
+            return
+        self.last_trigger = time.monotonic()
+        logger.info(f"Бэкап по изменениям сохранений: {reason}")
+        log_queue.put(f"Бэкап по изменениям сохранений: {reason}")
+
+    def run(self):
+        watch = None
+        while not shutdown_event.is_set():
+            directory = os.path.normpath(save_dir)
+            if directory != self.directory:
+                if watch is not None:
+                    watch.close()
+                    watch = None
+                if not os.path.isdir(directory):
+                    shutdown_event.wait(SAVE_WATCH_POLL_INTERVAL)
+                    continue
+                self.reset(directory)
+                watch = self.open_watch(directory)
+                logger.info(f"Отслеживание изменений сохранений в {directory} ({self.backend})")
+            if watch is not None:
+                try:
+                    names = watch.wait(SUPERVISOR_MAX_SLEEP)
+                except OSError as e:
+                    logger.warning(f"Ошибка inotify ({e}), изменения сохранений отслеживаются опросом")
+                    watch.close()
+                    watch = None
+                    self.backend = "polling"
+                    continue
+                if names and not names & set(SAVE_FILES):
+                    continue
+                # Пачка записей SQLite приходит серией событий: обход один раз после паузы
+                shutdown_event.wait(SAVE_WATCH_SETTLE)
+            else:
+                shutdown_event.wait(SAVE_WATCH_POLL_INTERVAL)
+            self.scan()
+            self.maybe_backup()
+
+save_watcher = SaveWatcher()
 
 def create_backup_splash(root):
     """Создание окна уведомления о бэкапе."""
@@ -126,96 +1950,179 @@ def create_update_splash(root):
     logger.info("Окно обновления отображено")
     return splash
 
-def load_settings(time1_entry, time2_entry, args_entry, save_dir_entry, backup_dir_entry, steamcmd_exe_entry, steamcmd_dir_entry, saved_times_label, saved_args_label, saved_paths_label, auto_start_var):
-    """Загрузка настроек из файла."""
-    global restart_times, server_args, auto_start, steamcmd_executable, steamcmd_install_dir, save_dir, backup_dir
+def read_settings():
+    """Загрузка настроек из файла в глобальные переменные (без GUI)."""
+    global restart_schedule, server_args, auto_start, steamcmd_executable, steamcmd_install_dir, save_dir, backup_dir, log_max_lines, crash_restart_delay, backup_mode
+    global log_buffer_lines, log_overflow_policy
+    global backup_compression, backup_compression_level, backup_workers, retention_enabled, retention
+    global telemetry_interval, rss_limit_mb, rss_growth_limit_mb_per_hour
+    global watchdog_enabled, watchdog_grace, watchdog_startup_grace, watchdog_query_port
+    global change_backup_enabled, change_backup_mb, db_maintenance_budget
+    global restart_pipeline, update_mode, api_port, api_token
+    loaded = False
     try:
         with open(SETTINGS_FILE, "r", encoding="utf-8") as f:
             data = json.load(f)
-            restart_times = [dt_time(*map(int, t.split(":"))) for t in data.get("restart_times", ["12:00", "21:00"])]
+            restart_schedule = schedule_from_settings(data)
             server_args = data.get("args", DEFAULT_ARGS[:])
             auto_start = data.get("auto_start", False)
             steamcmd_executable = data.get("steamcmd_executable", DEFAULT_STEAMCMD_EXECUTABLE)
             steamcmd_install_dir = data.get("steamcmd_install_dir", DEFAULT_STEAMCMD_INSTALL_DIR)
             save_dir = data.get("save_dir", DEFAULT_SAVE_DIR)
             backup_dir = data.get("backup_dir", DEFAULT_BACKUP_DIR)
-        
-        time1_entry.delete(0, tk.END)
-        time1_entry.insert(0, f"{restart_times[0].hour:02d}:{restart_times[0].minute:02d}")
-        time2_entry.delete(0, tk.END)
-        time2_entry.insert(0, f"{restart_times[1].hour:02d}:{restart_times[1].minute:02d}")
-        args_entry.delete(0, tk.END)
-        args_entry.insert(0, " ".join(server_args))
-        save_dir_entry.delete(0, tk.END)
-        save_dir_entry.insert(0, save_dir)
-        backup_dir_entry.delete(0, tk.END)
-        backup_dir_entry.insert(0, backup_dir)
-        steamcmd_exe_entry.delete(0, tk.END)
-        steamcmd_exe_entry.insert(0, steamcmd_executable)
-        steamcmd_dir_entry.delete(0, tk.END)
-        steamcmd_dir_entry.insert(0, steamcmd_install_dir)
-        saved_times_label.config(text=f"Время рестарта: {time1_entry.get()}, {time2_entry.get()}")
-        saved_args_label.config(text=f"Аргументы: {' '.join(server_args)}")
-        saved_paths_label.config(text=f"Пути: SteamCMD={steamcmd_executable}, Сервер={steamcmd_install_dir}, Сохранения={save_dir}, Бэкапы={backup_dir}")
-        auto_start_var.set(auto_start)
+            log_max_lines = int(data.get("log_max_lines", DEFAULT_LOG_MAX_LINES))
+            log_buffer_lines = int(data.get("log_buffer_lines", DEFAULT_LOG_BUFFER_LINES))
+            log_overflow_policy = data.get("log_overflow_policy", DEFAULT_LOG_OVERFLOW_POLICY)
+            crash_restart_delay = float(data.get("crash_restart_delay", DEFAULT_CRASH_RESTART_DELAY))
+            backup_mode = data.get("backup_mode", DEFAULT_BACKUP_MODE)
+            if backup_mode not in BACKUP_MODES:
+                backup_mode = DEFAULT_BACKUP_MODE
+            backup_compression = data.get("backup_compression", DEFAULT_BACKUP_COMPRESSION)
+            if backup_compression not in BACKUP_COMPRESSIONS:
+                backup_compression = DEFAULT_BACKUP_COMPRESSION
+            backup_compression_level = min(max(int(data.get("backup_compression_level", DEFAULT_BACKUP_COMPRESSION_LEVEL)), 1), 9)
+            backup_workers = int(data.get("backup_workers", DEFAULT_BACKUP_WORKERS))
+            retention_enabled = bool(data.get("retention_enabled", False))
+            retention = {**DEFAULT_RETENTION, **data.get("retention", {})}
+            telemetry_interval = max(float(data.get("telemetry_interval", DEFAULT_TELEMETRY_INTERVAL)), 0.5)
+            rss_limit_mb = float(data.get("rss_limit_mb", 0))
+            rss_growth_limit_mb_per_hour = float(data.get("rss_growth_limit_mb_per_hour", 0))
+            watchdog_enabled = bool(data.get("watchdog_enabled", False))
+            watchdog_grace = float(data.get("watchdog_grace", DEFAULT_WATCHDOG_GRACE))
+            watchdog_startup_grace = float(data.get("watchdog_startup_grace", DEFAULT_WATCHDOG_STARTUP_GRACE))
+            watchdog_query_port = int(data.get("watchdog_query_port", 0))
+            change_backup_enabled = bool(data.get("change_backup_enabled", False))
+            change_backup_mb = float(data.get("change_backup_mb", DEFAULT_CHANGE_BACKUP_MB))
+            db_maintenance_budget = float(data.get("db_maintenance_budget", DEFAULT_DB_MAINTENANCE_BUDGET))
+            restart_pipeline = [name for name in data.get("restart_pipeline", []) if name in PIPELINE_STAGE_NAMES]
+            update_mode = data.get("update_mode", DEFAULT_UPDATE_MODE)
+            if update_mode not in UPDATE_MODES:
+                update_mode = DEFAULT_UPDATE_MODE
+            update_instances_from_settings(data.get("instances", []))
+            api_port = int(data.get("api_port", DEFAULT_API_PORT))
+            api_token = data.get("api_token", "")
+        loaded = True
         logger.info("Настройки загружены из settings.json")
     except (FileNotFoundError, json.JSONDecodeError, ValueError) as e:
         logger.warning(f"Ошибка загрузки настроек: {e}. Используются значения по умолчанию")
-        restart_times = DEFAULT_RESTART_TIMES[:]
+        restart_schedule = DEFAULT_RESTART_SCHEDULE[:]
         server_args = DEFAULT_ARGS[:]
         auto_start = False
         steamcmd_executable = DEFAULT_STEAMCMD_EXECUTABLE
         steamcmd_install_dir = DEFAULT_STEAMCMD_INSTALL_DIR
         save_dir = DEFAULT_SAVE_DIR
         backup_dir = DEFAULT_BACKUP_DIR
-        time1_entry.delete(0, tk.END)
-        time1_entry.insert(0, "12:00")
-        time2_entry.delete(0, tk.END)
-        time2_entry.insert(0, "21:00")
-        args_entry.delete(0, tk.END)
-        args_entry.insert(0, " ".join(DEFAULT_ARGS))
-        save_dir_entry.delete(0, tk.END)
-        save_dir_entry.insert(0, DEFAULT_SAVE_DIR)
-        backup_dir_entry.delete(0, tk.END)
-        backup_dir_entry.insert(0, DEFAULT_BACKUP_DIR)
-        steamcmd_exe_entry.delete(0, tk.END)
-        steamcmd_exe_entry.insert(0, DEFAULT_STEAMCMD_EXECUTABLE)
-        steamcmd_dir_entry.delete(0, tk.END)
-        steamcmd_dir_entry.insert(0, DEFAULT_STEAMCMD_INSTALL_DIR)
-        saved_times_label.config(text="Время рестарта: 12:00, 21:00")
-        saved_args_label.config(text=f"Аргументы: {' '.join(DEFAULT_ARGS)}")
-        saved_paths_label.config(text=f"Пути: SteamCMD={DEFAULT_STEAMCMD_EXECUTABLE}, Сервер={DEFAULT_STEAMCMD_INSTALL_DIR}, Сохранения={DEFAULT_SAVE_DIR}, Бэкапы={DEFAULT_BACKUP_DIR}")
-        auto_start_var.set(False)
+        log_max_lines = DEFAULT_LOG_MAX_LINES
+        log_buffer_lines = DEFAULT_LOG_BUFFER_LINES
+        log_overflow_policy = DEFAULT_LOG_OVERFLOW_POLICY
+        crash_restart_delay = DEFAULT_CRASH_RESTART_DELAY
+        backup_mode = DEFAULT_BACKUP_MODE
+        backup_compression = DEFAULT_BACKUP_COMPRESSION
+        backup_compression_level = DEFAULT_BACKUP_COMPRESSION_LEVEL
+        backup_workers = DEFAULT_BACKUP_WORKERS
+        retention_enabled = False
+        retention = dict(DEFAULT_RETENTION)
+        telemetry_interval = DEFAULT_TELEMETRY_INTERVAL
+        rss_limit_mb = 0
+        rss_growth_limit_mb_per_hour = 0
+        watchdog_enabled = False
+        watchdog_grace = DEFAULT_WATCHDOG_GRACE
+        watchdog_startup_grace = DEFAULT_WATCHDOG_STARTUP_GRACE
+        watchdog_query_port = 0
+        change_backup_enabled = False
+        change_backup_mb = DEFAULT_CHANGE_BACKUP_MB
+        db_maintenance_budget = DEFAULT_DB_MAINTENANCE_BUDGET
+        restart_pipeline = []
+        update_mode = DEFAULT_UPDATE_MODE
+        api_port = DEFAULT_API_PORT
+        api_token = ""
+    log_queue.configure(log_buffer_lines, log_overflow_policy)
+    if not api_token:
+        import secrets
+        api_token = secrets.token_urlsafe(24)
+        # Повреждённый settings.json не перезаписываем: токен действует до перезапуска
+        if loaded or not os.path.exists(SETTINGS_FILE):
+            logger.info("Сгенерирован токен API (api_token в settings.json)")
+            save_settings()
+    event_bus.publish("settings", update_mode=update_mode)
+
+def load_settings(schedule_entry, args_entry, save_dir_entry, backup_dir_entry, steamcmd_exe_entry, steamcmd_dir_entry, saved_times_label, saved_args_label, saved_paths_label, auto_start_var):
+    """Заполнение полей GUI загруженными настройками."""
+    schedule_entry.delete(0, tk.END)
+    schedule_entry.insert(0, f"{SCHEDULE_SEPARATOR} ".join(restart_schedule))
+    args_entry.delete(0, tk.END)
+    args_entry.insert(0, " ".join(server_args))
+    save_dir_entry.delete(0, tk.END)
+    save_dir_entry.insert(0, save_dir)
+    backup_dir_entry.delete(0, tk.END)
+    backup_dir_entry.insert(0, backup_dir)
+    steamcmd_exe_entry.delete(0, tk.END)
+    steamcmd_exe_entry.insert(0, steamcmd_executable)
+    steamcmd_dir_entry.delete(0, tk.END)
+    steamcmd_dir_entry.insert(0, steamcmd_install_dir)
+    saved_times_label.config(text=f"Расписание рестартов: {', '.join(restart_schedule) or 'нет'}")
+    saved_args_label.config(text=f"Аргументы: {' '.join(server_args)}")
+    saved_paths_label.config(text=f"Пути: SteamCMD={steamcmd_executable}, Сервер={steamcmd_install_dir}, Сохранения={save_dir}, Бэкапы={backup_dir}")
+    auto_start_var.set(auto_start)
 
 def save_settings():
     """Сохранение настроек в файл."""
     try:
         with open(SETTINGS_FILE, "w", encoding="utf-8") as f:
             json.dump({
-                "restart_times": [f"{t.hour:02d}:{t.minute:02d}" for t in restart_times],
+                "restart_schedule": restart_schedule,
                 "args": server_args,
                 "auto_start": auto_start,
                 "steamcmd_executable": steamcmd_executable,
                 "steamcmd_install_dir": steamcmd_install_dir,
                 "save_dir": save_dir,
-                "backup_dir": backup_dir
+                "backup_dir": backup_dir,
+                "log_max_lines": log_max_lines,
+                "log_buffer_lines": log_buffer_lines,
+                "log_overflow_policy": log_overflow_policy,
+                "crash_restart_delay": crash_restart_delay,
+                "backup_mode": backup_mode,
+                "backup_compression": backup_compression,
+                "backup_compression_level": backup_compression_level,
+                "backup_workers": backup_workers,
+                "retention_enabled": retention_enabled,
+                "retention": retention,
+                "telemetry_interval": telemetry_interval,
+                "rss_limit_mb": rss_limit_mb,
+                "rss_growth_limit_mb_per_hour": rss_growth_limit_mb_per_hour,
+                "watchdog_enabled": watchdog_enabled,
+                "watchdog_grace": watchdog_grace,
+                "watchdog_startup_grace": watchdog_startup_grace,
+                "watchdog_query_port": watchdog_query_port,
+                "change_backup_enabled": change_backup_enabled,
+                "change_backup_mb": change_backup_mb,
+                "db_maintenance_budget": db_maintenance_budget,
+                "restart_pipeline": restart_pipeline,
+                "update_mode": update_mode,
+                "instances": [instance.to_settings() for instance in instances[1:]],
+                "api_port": api_port,
+                "api_token": api_token
             }, f, indent=4)
         logger.info("Настройки сохранены в settings.json")
+        event_bus.publish("settings", update_mode=update_mode)
+        if settings_saved_hook is not None:
+            settings_saved_hook()
     except Exception as e:
         logger.error(f"Ошибка сохранения настроек: {e}")
 
+def request_shutdown():
+    """Завершение работы: флаг для всех потоков, событие в шину и пробуждение супервизора."""
+    shutdown_event.set()
+    event_bus.publish("shutdown")
+    wake_supervisor()
+
 def signal_handler(sig, frame):
     """Обработчик сигнала Ctrl+C."""
-    global shutdown_flag
     logger.info("Получен сигнал Ctrl+C. Выполняется graceful shutdown...")
-    shutdown_flag = True
-    if current_process:
-        try:
-            current_process.terminate()
-            current_process.wait(timeout=10)
-        except subprocess.TimeoutExpired:
-            logger.warning("Процесс не завершился вовремя, принудительное завершение...")
-            current_process.kill()
+    request_shutdown()
+    for instance in instances:
+        if instance.process:
+            stop_server_process(instance.process)
 
 def validate_time_input(time_str):
     """Проверка формата времени HH:MM."""
@@ -227,235 +2134,2470 @@ def validate_time_input(time_str):
         if 0 <= hours <= 23 and 0 <= minutes <= 59:
             return True
         return False
-    except ValueError:
+    except ValueError:
+        return False
+
+def validate_path(path_str):
+    """Проверка существования пути."""
+    return os.path.exists(os.path.dirname(path_str)) or path_str == ""
+
+def reflink_file(source, target):
+    """Клон файла с общими блоками (reflink); False, если ФС или платформа этого не умеют."""
+    if not sys.platform.startswith("linux"):
+        return False
+    import fcntl
+    try:
+        with open(source, "rb") as src, open(target, "wb") as dst:
+            fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+    except OSError:
+        try:
+            os.remove(target)
+        except FileNotFoundError:
+            pass
+        return False
+    shutil.copystat(source, target)
+    return True
+
+def file_sha256(path):
+    """SHA-256 файла, читаемого блоками."""
+    file_hash = hashlib.sha256()
+    with open(path, "rb") as f:
+        for data in iter(lambda: f.read(ZIP_BLOCK_SIZE), b""):
+            file_hash.update(data)
+    return file_hash.hexdigest()
+
+def write_backup(files_to_backup, timestamp, source="offline", target_dir=None, install_dir=None, progress=None):
+    """Запись файлов в бэкап выбранного режима и регистрация в каталоге.
+    
+    target_dir и install_dir задают папку бэкапов и установку инстанса (по умолчанию текущие).
+    progress вызывается с числом обработанных байт; исключение из него (отмена) прерывает
+    запись, и недописанный архив удаляется. Возвращает путь к архиву или манифесту.
+    """
+    target_dir = target_dir or backup_dir
+    Path(target_dir).mkdir(parents=True, exist_ok=True)
+    catalog = get_backup_catalog(target_dir)
+    entry = {
+        "id": f"backup_{timestamp}",
+        "created": datetime.strptime(timestamp, "%Y-%m-%d_%H-%M-%S").isoformat(timespec="seconds"),
+        "kind": backup_mode,
+        "build_id": read_installed_build_id(install_dir),
+        "source": source,
+        "verified": None
+    }
+    if backup_mode == "chunks":
+        store = ChunkStore(os.path.join(target_dir, CHUNK_STORE_DIR))
+        try:
+            backup_file, stats = store.backup_files(files_to_backup, f"backup_{timestamp}", progress)
+        except BaseException:
+            # Манифест не записан: новые блоки этого бэкапа ни на что не ссылаются
+            store.collect_garbage()
+            raise
+        logger.info(f"Блоков: {stats['chunks']}, новых: {stats['new_chunks']}, записано {stats['new_bytes'] / 1048576:.1f} из {stats['bytes'] / 1048576:.1f} МБ")
+        log_queue.put(f"Записано новых данных: {stats['new_bytes'] / 1048576:.1f} из {stats['bytes'] / 1048576:.1f} МБ ({stats['new_chunks']} из {stats['chunks']} блоков)")
+        manifest = store.load_manifest(backup_file)
+        entry.update(
+            size=stats["new_bytes"] + os.path.getsize(backup_file),
+            data_size=stats["bytes"],
+            files={f["name"]: {"size": f["size"], "sha256": f["sha256"]} for f in manifest["files"]}
+        )
+    else:
+        backup_file = os.path.join(target_dir, f"backup_{timestamp}.zip")
+        started = time.monotonic()
+        files = {}
+        try:
+            if backup_compression == "lzma":
+                import zipfile
+                with zipfile.ZipFile(backup_file, "w", zipfile.ZIP_LZMA) as zipf:
+                    for file in files_to_backup:
+                        name = os.path.basename(file)
+                        info = zipfile.ZipInfo.from_file(file, name)
+                        info.compress_type = zipfile.ZIP_LZMA
+                        file_hash = hashlib.sha256()
+                        with open(file, "rb") as handle, zipf.open(info, "w") as target:
+                            for data in iter(lambda: handle.read(LZMA_READ_SIZE), b""):
+                                file_hash.update(data)
+                                target.write(data)
+                                if progress is not None:
+                                    progress(len(data))
+                        files[name] = {"size": info.file_size, "sha256": file_hash.hexdigest()}
+                        logger.info(f"Добавлен файл в архив: {file}")
+                        log_queue.put(f"Добавлен файл в архив: {name}")
+            else:
+                with ParallelZipWriter(backup_file, backup_compression, backup_compression_level, backup_workers, progress=progress) as zipf:
+                    for file in files_to_backup:
+                        name = os.path.basename(file)
+                        files[name] = {"size": zipf.write(file, name)}
+                        logger.info(f"Добавлен файл в архив: {file}")
+                        log_queue.put(f"Добавлен файл в архив: {name}")
+                for name, digest in zipf.hashes.items():
+                    files[name]["sha256"] = digest
+                if zipf.block_index:
+                    entry["block_index"] = zipf.block_index
+        except BaseException:
+            if os.path.exists(backup_file):
+                os.remove(backup_file)
+            raise
+        total_bytes = sum(f["size"] for f in files.values())
+        elapsed = max(time.monotonic() - started, 1e-6)
+        logger.info(f"Архив записан: {total_bytes / 1048576:.1f} МБ за {elapsed:.1f} с ({total_bytes / 1048576 / elapsed:.1f} МБ/с, {BACKUP_COMPRESSIONS[backup_compression]}, уровень {backup_compression_level})")
+        log_queue.put(f"Архив записан: {total_bytes / 1048576:.1f} МБ за {elapsed:.1f} с ({total_bytes / 1048576 / elapsed:.1f} МБ/с)")
+        entry.update(size=os.path.getsize(backup_file), data_size=total_bytes, files=files)
+    
+    entry["path"] = os.path.relpath(backup_file, catalog.root_dir)
+    catalog.add(entry)
+    catalog_maintenance_event.set()
+    return backup_file
+
+def snapshot_database(db_path, snapshot_path, progress=None):
+    """Согласованный снимок SQLite-базы (с учётом WAL) через online backup API.
+    
+    Чтение идёт в одной транзакции, поэтому снимок не перезапускается от записей
+    сервера, а сам сервер в режиме WAL продолжает писать без блокировок.
+    """
+    import sqlite3
+    source = sqlite3.connect(f"{Path(db_path).resolve().as_uri()}?mode=ro", uri=True, check_same_thread=False)
+    target = sqlite3.connect(snapshot_path)
+    step_times = []
+    last_report = [time.monotonic(), time.monotonic()]
+    
+    page_size = source.execute("PRAGMA page_size").fetchone()[0]
+    copied = [0]
+    
+    def report(status, remaining, total):
+        now = time.monotonic()
+        step_times.append(now - last_report[1])
+        if progress is not None:
+            progress((total - remaining - copied[0]) * page_size)
+            copied[0] = total - remaining
+        if now - last_report[0] >= 1 or remaining == 0:
+            last_report[0] = now
+            done = total - remaining
+            log_queue.put(f"Онлайн-бэкап: {done}/{total} страниц ({done * 100 // max(total, 1)}%), шаг {step_times[-1] * 1000:.1f} мс, пауза {ONLINE_BACKUP_SLEEP * 1000:.0f} мс")
+        # sqlite3 делает паузу только при SQLITE_BUSY, поэтому уступаем диск серверу сами
+        if remaining:
+            time.sleep(ONLINE_BACKUP_SLEEP)
+        last_report[1] = time.monotonic()
+    
+    try:
+        source.execute("BEGIN")
+        source.execute("SELECT count(*) FROM sqlite_master").fetchone()
+        source.backup(target, pages=ONLINE_BACKUP_PAGES, progress=report)
+        source.rollback()
+        # Снимок должен быть самодостаточным файлом без -wal/-shm
+        target.execute("PRAGMA journal_mode=DELETE")
+    finally:
+        target.close()
+        source.close()
+    
+    if step_times:
+        max_step = max(step_times) * 1000
+        avg_step = sum(step_times) / len(step_times) * 1000
+        logger.info(f"Снимок базы: шагов {len(step_times)}, средний шаг {avg_step:.1f} мс, максимальный {max_step:.1f} мс")
+        log_queue.put(f"Снимок базы: шагов {len(step_times)}, средний шаг {avg_step:.1f} мс, максимальный {max_step:.1f} мс")
+
+class BackupCancelled(RuntimeError):
+    """Бэкап отменён по запросу."""
+
+class BackupJob:
+    """Бэкап в фоновом исполнителе backup_executor: байты, скорость, оставшееся время и отмена.
+    
+    Прогресс публикуется в шину событий (тема backup) не чаще BACKUP_PROGRESS_INTERVAL;
+    отмена срабатывает на ближайшем блоке записи, недописанный архив удаляется."""
+    
+    def __init__(self, kind, instance):
+        self.id = f"{kind}-{next(backup_job_ids)}"
+        self.kind = kind
+        self.instance = instance.name
+        self.state = "queued"
+        self.bytes_total = 0
+        self.bytes_done = 0
+        self.started = None
+        self.finished = None
+        self.result = None
+        self.error = None
+        self.future = None
+        self.cancel_event = threading.Event()
+        self.lock = threading.Lock()
+        self.published_at = 0
+    
+    def add_total(self, size):
+        with self.lock:
+            self.bytes_total += size
+    
+    def advance(self, size):
+        """Учёт обработанных байт из циклов записи; при отмене прерывает их исключением."""
+        if self.cancel_event.is_set():
+            raise BackupCancelled("Бэкап отменён")
+        with self.lock:
+            self.bytes_done += size
+        if time.monotonic() - self.published_at >= BACKUP_PROGRESS_INTERVAL:
+            self.publish()
+    
+    def cancel(self):
+        self.cancel_event.set()
+    
+    def status(self):
+        with self.lock:
+            elapsed = ((self.finished or time.monotonic()) - self.started) if self.started else 0
+            rate = self.bytes_done / elapsed if elapsed > 0 else 0
+            return {
+                "id": self.id,
+                "kind": self.kind,
+                "instance": self.instance,
+                "state": self.state,
+                "bytes_total": self.bytes_total,
+                "bytes_done": self.bytes_done,
+                "mb_per_s": round(rate / 1048576, 1),
+                "eta": round(max(self.bytes_total - self.bytes_done, 0) / rate, 1) if rate and self.state == "running" else None,
+                "result": self.result,
+                "error": self.error,
+            }
+    
+    def publish(self):
+        self.published_at = time.monotonic()
+        event_bus.publish("backup", **self.status())
+    
+    def run(self, func):
+        if self.cancel_event.is_set():
+            self.state = "cancelled"
+            self.publish()
+            raise BackupCancelled("Бэкап отменён")
+        self.started = time.monotonic()
+        self.state = "running"
+        self.publish()
+        try:
+            self.result = func(self)
+            self.state = "done"
+            return self.result
+        except BackupCancelled as e:
+            self.state = "cancelled"
+            self.error = str(e)
+            logger.info(f"Бэкап {self.id} отменён")
+            log_queue.put(f"Бэкап {self.id} отменён, недописанный архив удалён")
+            raise
+        except Exception as e:
+            self.state = "failed"
+            self.error = str(e)
+            raise
+        finally:
+            self.finished = time.monotonic()
+            self.publish()
+            metrics.observe("scum_backup_duration_seconds", self.finished - self.started, kind=self.kind, result=self.state)
+            if self.state == "done":
+                metrics.inc("scum_backup_bytes_total", self.bytes_done, kind=self.kind)
+
+def submit_backup_job(kind, func, instance=None, exclusive=False):
+    """Постановка бэкапа в фоновый исполнитель с одним потоком; func получает BackupJob.
+    
+    exclusive (ручной бэкап) отклоняется, пока другой бэкап в очереди или выполняется;
+    бэкапы конвейера рестарта встают в очередь за текущим."""
+    with backup_jobs_lock:
+        if exclusive and any(job.state in ("queued", "running") for job in backup_jobs):
+            raise RuntimeError("Бэкап уже выполняется")
+        job = BackupJob(kind, instance or primary_instance)
+        backup_jobs.append(job)
+    job.future = backup_executor.submit(job.run, func)
+    job.publish()
+    return job
+
+def find_backup_job(job_id=None):
+    """Задание бэкапа по id; без id - текущее (в очереди или выполняется)."""
+    with backup_jobs_lock:
+        for job in reversed(backup_jobs):
+            if job.id == job_id or (job_id is None and job.state in ("queued", "running")):
+                return job
+    raise LookupError(f"Задание бэкапа {job_id} не найдено" if job_id else "Нет выполняющегося бэкапа")
+
+def perform_online_backup(job=None):
+    """Бэкап SCUM.db без остановки основного сервера; возвращает путь к бэкапу.
+    
+    job (BackupJob) получает прогресс: снимок базы и запись архива."""
+    db_path = os.path.join(save_dir, SAVE_FILES[0])
+    if not os.path.isfile(db_path):
+        raise FileNotFoundError(f"Файл {db_path} не найден")
+    progress = job.advance if job is not None else None
+    if job is not None:
+        job.add_total(2 * os.path.getsize(db_path))
+    
+    logger.info("Запуск онлайн-бэкапа")
+    log_queue.put("Запуск онлайн-бэкапа (сервер продолжает работу)")
+    timestamp = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+    snapshot_dir = os.path.join(backup_dir, f".online_{timestamp}")
+    token = save_watcher.observed()
+    try:
+        Path(snapshot_dir).mkdir(parents=True, exist_ok=True)
+        snapshot_path = os.path.join(snapshot_dir, SAVE_FILES[0])
+        with disk_slot:
+            started = time.monotonic()
+            snapshot_database(db_path, snapshot_path, progress)
+            logger.info(f"Снимок базы создан за {time.monotonic() - started:.1f} с")
+            
+            backup_file = write_backup([snapshot_path], timestamp, source="online", progress=progress)
+        save_watcher.mark_backup(token)
+        logger.info(f"Онлайн-бэкап успешно создан: {backup_file}")
+        log_queue.put(f"Онлайн-бэкап успешно создан: {backup_file}")
+        return backup_file
+    except BackupCancelled:
+        raise
+    except Exception as e:
+        logger.error(f"Ошибка при создании онлайн-бэкапа: {e}")
+        log_queue.put(f"Ошибка при создании онлайн-бэкапа: {e}")
+        raise
+    finally:
+        shutil.rmtree(snapshot_dir, ignore_errors=True)
+
+def perform_backup(job=None):
+    """Бэкап файлов сохранений остановленного основного сервера; возвращает путь к бэкапу.
+    
+    job (BackupJob) получает прогресс записи."""
+    if primary_instance.running:
+        logger.warning("Попытка бэкапа при запущенном сервере")
+        raise RuntimeError("Сначала остановите сервер")
+    
+    logger.info("Запуск процесса бэкапа")
+    timestamp = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+    files_to_backup = [os.path.join(save_dir, f) for f in SAVE_FILES if os.path.isfile(os.path.join(save_dir, f))]
+    if not files_to_backup:
+        logger.error(f"Файлы для бэкапа не найдены в {save_dir}")
+        log_queue.put(f"Ошибка: Файлы для бэкапа не найдены в {save_dir}")
+        raise FileNotFoundError(f"Файлы для бэкапа не найдены в {save_dir}")
+    if job is not None:
+        job.add_total(sum(os.path.getsize(f) for f in files_to_backup))
+    token = save_watcher.observed()
+    try:
+        with disk_slot:
+            backup_file = write_backup(files_to_backup, timestamp, progress=job.advance if job is not None else None)
+        save_watcher.mark_backup(token)
+    except BackupCancelled:
+        raise
+    except Exception as e:
+        logger.error(f"Ошибка при создании бэкапа: {e}")
+        log_queue.put(f"Ошибка при создании бэкапа: {e}")
+        raise
+    logger.info(f"Бэкап успешно создан: {backup_file}")
+    log_queue.put(f"Бэкап успешно создан: {backup_file}")
+    return backup_file
+
+def write_pieces(path, pieces, max_pending):
+    """Запись кусков файла по порядку с подсчётом размера, SHA-256 и CRC32.
+    
+    Куски - байты или Future распаковки на пуле; вперёд берётся не больше max_pending,
+    поэтому память ограничена, а распаковка идёт параллельно с записью."""
+    file_hash = hashlib.sha256()
+    crc = size = 0
+    pending = deque()
+    pieces = iter(pieces)
+    with open(path, "wb") as f:
+        while True:
+            while len(pending) < max_pending:
+                piece = next(pieces, None)
+                if piece is None:
+                    break
+                pending.append(piece)
+            if not pending:
+                break
+            piece = pending.popleft()
+            data = piece.result() if isinstance(piece, Future) else piece
+            file_hash.update(data)
+            crc = zlib.crc32(data, crc)
+            size += len(data)
+            f.write(data)
+    return size, file_hash.hexdigest(), crc
+
+def inflate_block(data):
+    """Распаковка одного блока сырого deflate, записанного compress_block."""
+    return zlib.decompressobj(-15).decompress(data)
+
+def block_index_valid(blocks, info):
+    """Проверка индекса блоков: смещения строго растут и лежат внутри сжатых данных элемента.
+    
+    Каталоги, записанные до исправления ParallelZipWriter, содержат отстающие смещения;
+    такие элементы распаковываются потоком через zipfile."""
+    offsets = [block[0] for block in blocks]
+    sizes = [block[1] for block in blocks]
+    return (bool(blocks) and offsets[0] == 0 and sizes[0] == 0 and offsets[-1] < info.compress_size
+            and all(a < b for a, b in zip(offsets, offsets[1:])) and all(a < b for a, b in zip(sizes, sizes[1:])))
+
+def zip_block_pieces(archive_path, info, blocks, executor):
+    """Сжатые блоки элемента ZIP по block_index каталога, отправленные на распаковку в executor."""
+    with open(archive_path, "rb") as f:
+        f.seek(info.header_offset + 26)
+        name_length, extra_length = struct.unpack("<HH", f.read(4))
+        data_offset = info.header_offset + 30 + name_length + extra_length
+        ends = [block[0] for block in blocks[1:]] + [info.compress_size]
+        for (start, _), end in zip(blocks, ends):
+            f.seek(data_offset + start)
+            yield executor.submit(inflate_block, f.read(end - start))
+
+def extract_backup(catalog, entry, target_dir):
+    """Распаковка бэкапа в target_dir с проверкой размеров, CRC и SHA-256; возвращает {имя: размер}.
+    
+    Инкрементальные бэкапы и ZIP с индексом блоков распаковываются на пуле из
+    backup_workers потоков, остальные ZIP читаются потоком через zipfile."""
+    import zipfile
+    workers = backup_workers or os.cpu_count() or 1
+    path = catalog.entry_path(entry)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        if entry["kind"] == "chunks":
+            return ChunkStore(os.path.join(catalog.root_dir, CHUNK_STORE_DIR)).restore(path, target_dir, executor, workers * 2)
+        expected = entry.get("files", {})
+        block_index = entry.get("block_index", {})
+        restored = {}
+        try:
+            with zipfile.ZipFile(path) as zipf:
+                for info in zipf.infolist():
+                    name = os.path.basename(info.filename)
+                    if name not in SAVE_FILES:
+                        continue
+                    target = os.path.join(target_dir, name)
+                    blocks = block_index.get(info.filename)
+                    if info.compress_type == zipfile.ZIP_DEFLATED and blocks and block_index_valid(blocks, info):
+                        pieces = zip_block_pieces(path, info, blocks, executor)
+                        size, digest, crc = write_pieces(target, pieces, workers * 2)
+                    else:
+                        with zipf.open(info) as member:
+                            size, digest, crc = write_pieces(target, iter(lambda: member.read(ZIP_BLOCK_SIZE), b""), 1)
+                    if size != info.file_size or crc != info.CRC:
+                        raise ValueError(f"Файл {name} в архиве повреждён")
+                    if expected.get(name, {}).get("sha256", digest) != digest:
+                        raise ValueError(f"Хэш восстановленного файла {name} не совпадает")
+                    restored[name] = size
+        except (zipfile.BadZipFile, zlib.error) as e:
+            raise ValueError(f"Архив {entry['id']} повреждён: {e}") from e
+        return restored
+
+def check_database_integrity(db_path):
+    """PRAGMA integrity_check базы только для чтения; "ok" или текст первых найденных ошибок."""
+    import sqlite3
+    try:
+        connection = sqlite3.connect(f"{Path(db_path).resolve().as_uri()}?mode=ro", uri=True)
+        try:
+            rows = connection.execute("PRAGMA integrity_check").fetchmany(RESTORE_INTEGRITY_ERRORS)
+        finally:
+            connection.close()
+    except sqlite3.DatabaseError as e:
+        return str(e)
+    return "; ".join(row[0] for row in rows)
+
+def set_database_deadline(connection, deadline):
+    """Прерывание запросов SQLite после deadline (time.monotonic()); прерванный VACUUM/ANALYZE откатывается."""
+    connection.set_progress_handler(lambda: int(time.monotonic() > deadline), 1000)
+
+def inspect_database(db_path, budget=DB_INSPECT_BUDGET, read_only=True):
+    """Замер SCUM.db: размеры базы и WAL, доля свободных страниц, строки крупнейших таблиц.
+    
+    Работающую базу открывает только для чтения; подсчёт строк прерывается по бюджету,
+    тогда complete=False и в замер попадают только посчитанные таблицы."""
+    import sqlite3
+    wal_path = f"{db_path}-wal"
+    sample = {
+        "time": round(time.time(), 3),
+        "db_bytes": os.path.getsize(db_path),
+        "wal_bytes": os.path.getsize(wal_path) if os.path.exists(wal_path) else 0,
+    }
+    connection = sqlite3.connect(f"{Path(db_path).resolve().as_uri()}?mode={'ro' if read_only else 'rw'}", uri=True, timeout=5)
+    try:
+        set_database_deadline(connection, time.monotonic() + budget)
+        page_size = connection.execute("PRAGMA page_size").fetchone()[0]
+        page_count = connection.execute("PRAGMA page_count").fetchone()[0]
+        free_pages = connection.execute("PRAGMA freelist_count").fetchone()[0]
+        tables = [row[0] for row in connection.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%'")]
+        analyzed = connection.execute("SELECT count(*) FROM sqlite_master WHERE name = 'sqlite_stat1'").fetchone()[0] > 0
+        rows = {}
+        for table in tables:
+            quoted = '"' + table.replace('"', '""') + '"'
+            try:
+                rows[table] = connection.execute(f"SELECT count(*) FROM {quoted}").fetchone()[0]
+            except sqlite3.OperationalError:
+                break
+    finally:
+        connection.close()
+    sample.update(
+        page_size=page_size,
+        page_count=page_count,
+        free_pages=free_pages,
+        free_ratio=round(free_pages / page_count, 4) if page_count else 0.0,
+        analyzed=analyzed,
+        rows_total=sum(rows.values()),
+        tables=dict(sorted(rows.items(), key=lambda item: item[1], reverse=True)[:DB_TOP_TABLES]),
+        complete=len(rows) == len(tables),
+    )
+    return sample
+
+def plan_db_maintenance(sample, budget, vacuum_rate, checkpoint_rate, last_analyze, free_disk, now):
+    """Действия обслуживания, оправданные замером и укладывающиеся в бюджет.
+    
+    VACUUM в режиме WAL пишет всю новую базу в WAL, поэтому после него всегда идёт
+    checkpoint, и его время входит в оценку VACUUM. Возвращает (действия, пропущенные) -
+    списки пар (действие, причина) в порядке выполнения."""
+    actions = []
+    skipped = []
+    remaining = budget
+    checkpoint = None
+    if sample["wal_bytes"] >= DB_CHECKPOINT_MIN_WAL:
+        checkpoint = f"WAL {sample['wal_bytes'] / 1048576:.0f} МБ"
+        remaining -= sample["wal_bytes"] / checkpoint_rate
+    free_bytes = sample["free_pages"] * sample["page_size"]
+    if sample["free_ratio"] >= DB_VACUUM_FREE_RATIO and free_bytes >= DB_VACUUM_MIN_FREE:
+        estimate = (sample["db_bytes"] + sample["wal_bytes"]) / vacuum_rate + sample["db_bytes"] / checkpoint_rate
+        if checkpoint is None:
+            estimate += sample["wal_bytes"] / checkpoint_rate
+        if estimate > remaining:
+            skipped.append(("vacuum", f"оценка {estimate:.0f} с больше бюджета {max(remaining, 0):.0f} с"))
+        elif free_disk < 2 * sample["db_bytes"]:
+            skipped.append(("vacuum", f"на диске свободно {free_disk / 1048576:.0f} МБ, нужно {2 * sample['db_bytes'] / 1048576:.0f} МБ"))
+        else:
+            actions.append(("vacuum", f"свободно {sample['free_ratio']:.0%} ({free_bytes / 1048576:.0f} МБ), оценка {estimate:.0f} с с учётом checkpoint"))
+            remaining -= estimate
+            checkpoint = "после VACUUM" if checkpoint is None else f"{checkpoint}, после VACUUM"
+    if checkpoint is not None:
+        actions.append(("checkpoint", checkpoint))
+    if not sample["analyzed"]:
+        actions.append(("analyze", "статистики нет"))
+    elif last_analyze is None or now - last_analyze["time"] >= DB_ANALYZE_INTERVAL:
+        actions.append(("analyze", "статистика старше недели"))
+    elif last_analyze.get("rows_total") and abs(sample["rows_total"] - last_analyze["rows_total"]) >= DB_ANALYZE_ROW_CHANGE * last_analyze["rows_total"]:
+        actions.append(("analyze", f"строк {last_analyze['rows_total']} -> {sample['rows_total']}"))
+    return actions, skipped
+
+def run_db_maintenance(db_path, budget):
+    """Обслуживание базы остановленного сервера в пределах budget секунд; возвращает запись итога."""
+    import sqlite3
+    started = time.monotonic()
+    deadline = started + budget
+    sample = inspect_database(db_path, min(budget, DB_INSPECT_BUDGET), read_only=False)
+    actions, skipped = plan_db_maintenance(sample, deadline - time.monotonic(), db_health.vacuum_rate(), db_health.checkpoint_rate(), db_health.last_analyze(), shutil.disk_usage(os.path.dirname(os.path.abspath(db_path))).free, time.time())
+    record = {
+        "kind": "maintenance",
+        "time": round(time.time(), 3),
+        "db_bytes_before": sample["db_bytes"],
+        "wal_bytes_before": sample["wal_bytes"],
+        "free_ratio_before": sample["free_ratio"],
+        "rows_total": sample["rows_total"],
+        "skipped": dict(skipped),
+    }
+    if actions:
+        connection = sqlite3.connect(db_path, timeout=5, isolation_level=None)
+        try:
+            set_database_deadline(connection, deadline)
+            for action, reason in actions:
+                step_started = time.monotonic()
+                if step_started >= deadline:
+                    record["skipped"][action] = "бюджет исчерпан"
+                    continue
+                step = {}
+                try:
+                    if action == "checkpoint":
+                        step["wal_bytes"] = os.path.getsize(f"{db_path}-wal") if os.path.exists(f"{db_path}-wal") else 0
+                        busy = connection.execute("PRAGMA wal_checkpoint(TRUNCATE)").fetchone()[0]
+                        error = "база занята, WAL перенесён не полностью" if busy else None
+                    elif action == "vacuum":
+                        connection.execute("VACUUM")
+                        error = None
+                    else:
+                        connection.execute(f"PRAGMA analysis_limit = {DB_ANALYZE_LIMIT}")
+                        connection.execute("ANALYZE")
+                        error = None
+                except sqlite3.Error as e:
+                    # По бюджету запрос прерывается (interrupted), изменения действия откатываются
+                    error = str(e)
+                record[action] = {"ok": error is None, "seconds": round(time.monotonic() - step_started, 3), "reason": reason, "error": error, **step}
+        finally:
+            connection.close()
+    record["db_bytes_after"] = os.path.getsize(db_path)
+    record["seconds"] = round(time.monotonic() - started, 3)
+    return record
+
+def format_db_maintenance(record):
+    """Итог обслуживания базы одной строкой для лога."""
+    done = [f"{action} {record[action]['seconds']:.1f} с{'' if record[action]['ok'] else ' (' + record[action]['error'] + ')'}" for action in ("vacuum", "checkpoint", "analyze") if action in record]
+    skipped = [f"{action} ({reason})" for action, reason in record["skipped"].items()]
+    message = f"Обслуживание базы: {', '.join(done) or 'не требуется'}; {record['db_bytes_before'] / 1048576:.1f} -> {record['db_bytes_after'] / 1048576:.1f} МБ, свободно было {record['free_ratio_before']:.0%}"
+    if skipped:
+        message += f"; пропущено: {', '.join(skipped)}"
+    return message
+
+class DbHealthMonitor:
+    """История замеров SCUM.db основного сервера: раз в DB_HEALTH_INTERVAL, с записью в DB_HEALTH_FILE.
+    
+    В том же файле хранятся итоги обслуживания базы: по ним оцениваются скорости
+    VACUUM и checkpoint на этой машине и давность последнего ANALYZE."""
+
+    def __init__(self, path=DB_HEALTH_FILE):
+        self.path = path
+        self.lock = threading.Lock()
+        self.samples = deque(maxlen=DB_HEALTH_HISTORY)
+        self.maintenance = deque(maxlen=PIPELINE_HISTORY)
+
+    def load(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                records = [json.loads(line) for line in f if line.strip()]
+        except FileNotFoundError:
+            records = []
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ошибка чтения {self.path}: {e}")
+            records = []
+        with self.lock:
+            for record in records:
+                (self.maintenance if record.get("kind") == "maintenance" else self.samples).append(record)
+            if len(records) > 2 * DB_HEALTH_HISTORY:
+                self._compact()
+
+    def _compact(self):
+        """Перезапись файла истории только с хранимыми записями."""
+        records = sorted(list(self.samples) + list(self.maintenance), key=lambda record: record["time"])
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.writelines(json.dumps(record, ensure_ascii=False) + "\n" for record in records)
+        os.replace(tmp_path, self.path)
+
+    def record(self, record):
+        with self.lock:
+            (self.maintenance if record.get("kind") == "maintenance" else self.samples).append(record)
+            try:
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(record, ensure_ascii=False) + "\n")
+            except OSError as e:
+                logger.warning(f"Ошибка записи {self.path}: {e}")
+
+    def inspect(self):
+        """Замер базы основного сервера только для чтения с записью в историю."""
+        sample = inspect_database(os.path.join(save_dir, SAVE_FILES[0]))
+        sample["kind"] = "sample"
+        self.record(sample)
+        return sample
+
+    def latest(self):
+        with self.lock:
+            return self.samples[-1] if self.samples else None
+
+    def vacuum_rate(self):
+        """Скорость VACUUM по последнему удачному, байт базы в секунду; до него - DB_VACUUM_RATE."""
+        with self.lock:
+            for record in reversed(self.maintenance):
+                vacuum = record.get("vacuum")
+                if vacuum and vacuum["ok"] and vacuum["seconds"] > 0:
+                    return (record["db_bytes_before"] + record["wal_bytes_before"]) / vacuum["seconds"]
+        return DB_VACUUM_RATE
+
+    def checkpoint_rate(self):
+        """Скорость checkpoint по последнему удачному, байт WAL в секунду; до него - DB_CHECKPOINT_RATE."""
+        with self.lock:
+            for record in reversed(self.maintenance):
+                checkpoint = record.get("checkpoint")
+                if checkpoint and checkpoint["ok"] and checkpoint["seconds"] > 0 and checkpoint.get("wal_bytes"):
+                    return checkpoint["wal_bytes"] / checkpoint["seconds"]
+        return DB_CHECKPOINT_RATE
+
+    def last_analyze(self):
+        """Запись последнего удачного ANALYZE или None."""
+        with self.lock:
+            for record in reversed(self.maintenance):
+                if record.get("analyze", {}).get("ok"):
+                    return record
+        return None
+
+    def status(self):
+        with self.lock:
+            return {"latest": self.samples[-1] if self.samples else None, "history": list(self.samples), "maintenance": list(self.maintenance)}
+
+    def run(self):
+        self.load()
+        delay = SUPERVISOR_MAX_SLEEP
+        while not shutdown_event.wait(delay):
+            delay = DB_HEALTH_INTERVAL
+            if not os.path.isfile(os.path.join(save_dir, SAVE_FILES[0])):
+                continue
+            try:
+                sample = self.inspect()
+            except Exception as e:
+                logger.warning(f"Ошибка замера базы {SAVE_FILES[0]}: {e}")
+                continue
+            logger.info(f"База {SAVE_FILES[0]}: {sample['db_bytes'] / 1048576:.1f} МБ, WAL {sample['wal_bytes'] / 1048576:.1f} МБ, свободных страниц {sample['free_ratio']:.0%}, строк {sample['rows_total']}")
+
+db_health = DbHealthMonitor()
+
+def replace_save_files(target_dir, work_dir, names):
+    """Замена файлов сохранений проверенными файлами из work_dir через os.replace.
+    
+    Прежние файлы откладываются в work_dir/previous и возвращаются при ошибке.
+    Файлы сохранений, которых нет в бэкапе (например, -wal при онлайн-бэкапе),
+    тоже убираются, чтобы SQLite не применил к восстановленной базе чужой журнал."""
+    previous_dir = os.path.join(work_dir, "previous")
+    Path(previous_dir).mkdir()
+    moved = []
+    placed = []
+    try:
+        for name in SAVE_FILES:
+            if os.path.exists(os.path.join(target_dir, name)):
+                os.replace(os.path.join(target_dir, name), os.path.join(previous_dir, name))
+                moved.append(name)
+        for name in names:
+            os.replace(os.path.join(work_dir, name), os.path.join(target_dir, name))
+            placed.append(name)
+    except OSError:
+        for name in placed:
+            os.remove(os.path.join(target_dir, name))
+        for name in moved:
+            os.replace(os.path.join(previous_dir, name), os.path.join(target_dir, name))
+        raise
+
+def restore_backup(backup_id, instance=None):
+    """Восстановление бэкапа в папку сохранений остановленного инстанса (по умолчанию основного).
+    
+    Файлы распаковываются во временную папку внутри папки сохранений и проверяются,
+    SCUM.db проходит PRAGMA integrity_check, и только затем файлы сохранений заменяются.
+    Возвращает статистику со скоростью восстановления."""
+    instance = instance or primary_instance
+    if instance.running or instance.process is not None:
+        logger.warning(f"{instance.label}Попытка восстановления при запущенном сервере")
+        raise RuntimeError("Сначала остановите сервер")
+    catalog = get_backup_catalog(instance.backup_dir)
+    entry = next((e for e in catalog.list() if e["id"] == backup_id), None)
+    if entry is None:
+        raise LookupError(f"Бэкап {backup_id} не найден")
+    
+    logger.info(f"{instance.label}Восстановление бэкапа {backup_id} в {instance.save_dir}")
+    log_queue.put(f"{instance.label}Восстановление бэкапа {backup_id}...")
+    started = time.monotonic()
+    try:
+        with disk_slot:
+            Path(instance.save_dir).mkdir(parents=True, exist_ok=True)
+            work_dir = os.path.join(instance.save_dir, f"{RESTORE_WORK_PREFIX}{datetime.now().strftime('%Y-%m-%d_%H-%M-%S')}")
+            Path(work_dir).mkdir()
+            try:
+                restored = extract_backup(catalog, entry, work_dir)
+                if SAVE_FILES[0] not in restored:
+                    raise ValueError(f"В бэкапе нет {SAVE_FILES[0]}")
+                integrity = check_database_integrity(os.path.join(work_dir, SAVE_FILES[0]))
+                if integrity != "ok":
+                    raise ValueError(f"Проверка целостности {SAVE_FILES[0]} не пройдена: {integrity}")
+                replace_save_files(instance.save_dir, work_dir, restored)
+            finally:
+                shutil.rmtree(work_dir, ignore_errors=True)
+    except Exception as e:
+        logger.error(f"{instance.label}Ошибка восстановления бэкапа {backup_id}: {e}")
+        log_queue.put(f"{instance.label}Ошибка восстановления бэкапа {backup_id}: {e}")
+        raise
+    
+    elapsed = max(time.monotonic() - started, 1e-6)
+    total_mb = sum(restored.values()) / 1048576
+    message = f"Восстановлен бэкап {backup_id}: {total_mb:.1f} МБ за {elapsed:.1f} с ({total_mb / elapsed:.1f} МБ/с), проверка целостности пройдена"
+    logger.info(f"{instance.label}{message}")
+    log_queue.put(f"{instance.label}{message}")
+    return {"id": backup_id, "files": sorted(restored), "bytes": sum(restored.values()), "seconds": round(elapsed, 3), "mb_per_s": round(total_mb / elapsed, 1)}
+
+def run_steamcmd_update(install_dir=None, validate=False):
+    """Запуск SteamCMD app_update с выводом в консоль; возвращает код возврата."""
+    args = ["+force_install_dir", install_dir or steamcmd_install_dir, "+login", "anonymous", "+app_update", STEAM_APP_ID]
+    if validate:
+        args.append("validate")
+    args.append("+quit")
+    process = output_mux.spawn([steamcmd_executable] + args, queue_output_lines, **NO_WINDOW)
+    logger.info(f"SteamCMD запущен с PID: {process.pid}")
+    process.wait()
+    return process.returncode
+
+def parse_vdf(text):
+    """Разбор текстового KeyValues (VDF) SteamCMD во вложенные словари."""
+    tokens = re.findall(r'"((?:[^"\\]|\\.)*)"|([{}])', text)
+    root = {}
+    stack = [root]
+    key = None
+    for quoted, brace in tokens:
+        if brace == "{":
+            child = {}
+            stack[-1][key] = child
+            stack.append(child)
+            key = None
+        elif brace == "}":
+            if len(stack) > 1:
+                stack.pop()
+            key = None
+        elif key is None:
+            key = quoted
+        else:
+            stack[-1][key] = quoted
+            key = None
+    return root
+
+def query_latest_build_id():
+    """Build ID последней сборки ветки public по app_info_print SteamCMD или None."""
+    args = ["+login", "anonymous", "+app_info_update", "1", "+app_info_print", STEAM_APP_ID, "+quit"]
+    result = subprocess.run([steamcmd_executable] + args, capture_output=True, timeout=STEAMCMD_INFO_TIMEOUT, **NO_WINDOW)
+    output = result.stdout.decode("utf-8", errors="replace")
+    start = output.find(f'"{STEAM_APP_ID}"')
+    if start < 0:
+        return None
+    info = parse_vdf(output[start:]).get(STEAM_APP_ID, {})
+    build_id = info.get("depots", {}).get("branches", {}).get("public", {}).get("buildid")
+    return build_id if build_id and build_id.isdigit() else None
+
+def check_for_update(force=False, install_dir=None):
+    """Сравнение установленной и последней сборки с кешированием на BUILD_CHECK_TTL.
+    
+    Возвращает (нужно_обновление, установленная, последняя). Если сборку узнать не удалось,
+    обновление считается нужным, чтобы не пропустить его."""
+    install_dir = install_dir or steamcmd_install_dir
+    installed = read_installed_build_id(install_dir)
+    cached = build_check_cache.get(install_dir, {})
+    if (not force and cached.get("installed") == installed
+            and time.time() - cached.get("checked", 0) < BUILD_CHECK_TTL):
+        return cached["needed"], installed, cached["latest"]
+    
+    started = time.monotonic()
+    try:
+        latest = query_latest_build_id()
+    except (subprocess.SubprocessError, OSError) as e:
+        logger.warning(f"Не удалось узнать последнюю сборку: {e}")
+        return True, installed, None
+    needed = installed is None or latest is None or installed != latest
+    logger.info(f"Проверка сборки за {time.monotonic() - started:.1f} с: установлена {installed}, последняя {latest}")
+    if latest is not None:
+        build_check_cache[install_dir] = {"installed": installed, "latest": latest, "needed": needed, "checked": time.time()}
+    return needed, installed, latest
+
+class ShadowInstall:
+    """Теневая копия установки сервера для обновления без остановки.
+    
+    Копия собирается из reflink-клонов файлов живой установки, а где ФС их не умеет -
+    из жёстких ссылок; SteamCMD обновляет её. Запись в клон живой файл не меняет. Замена
+    файла разрывает жёсткую ссылку, но запись на месте (починка validate, дельта-патч)
+    прошла бы в живой файл: collect_changes находит такие файлы и отменяет обновление.
+    Изменёнными считаются только файлы, которые SteamCMD создал или заменил: их stat
+    отличается от снимка, сделанного при сборке копии. При рестарте они переносятся
+    в живую установку через os.replace, прежние версии - в папку отката. Каталоги
+    не переименовываются целиком: в установке лежит рабочий каталог самой утилиты,
+    её файлы в копию не попадают."""
+    
+    def __init__(self, live_dir):
+        self.live_dir = os.path.normpath(live_dir)
+        self.shadow_dir = self.live_dir + SHADOW_SUFFIX
+        self.rollback_dir = self.live_dir + ROLLBACK_SUFFIX
+        self.build_id = None
+        self.changes = []
+        self.snapshot = {}
+        self.linked = set()
+        self.exclude = SHADOW_EXCLUDE + self.manager_paths()
+    
+    def manager_paths(self):
+        """Файлы и папки утилиты внутри установки: логи, события, настройки, бэкапы и хранилища блоков."""
+        paths = [LOG_DIR, EVENTS_DIR, SETTINGS_FILE, DB_HEALTH_FILE]
+        for directory in {backup_dir} | {instance.backup_dir for instance in list(instances)}:
+            paths += [directory, os.path.join(directory, CHUNK_STORE_DIR)]
+        live_prefix = os.path.normcase(self.live_dir + os.sep)
+        relative = []
+        for path in paths:
+            path = os.path.abspath(path)
+            if os.path.normcase(path).startswith(live_prefix):
+                relative.append(os.path.relpath(path, self.live_dir).replace(os.sep, "/"))
+        return tuple(relative)
+    
+    def excluded(self, rel_path):
+        rel_path = rel_path.replace(os.sep, "/")
+        return any(rel_path == prefix or rel_path.startswith(prefix + "/") for prefix in self.exclude)
+    
+    @staticmethod
+    def signature(path):
+        st = os.stat(path)
+        return st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns
+    
+    def prepare(self):
+        """Сборка теневой копии и снимка stat её файлов; возвращает (клонов, ссылок, копий)."""
+        shutil.rmtree(self.shadow_dir, ignore_errors=True)
+        self.snapshot = {}
+        self.linked = set()
+        can_clone = True
+        cloned = linked = copied = 0
+        for dirpath, dirnames, filenames in os.walk(self.live_dir):
+            rel_dir = os.path.relpath(dirpath, self.live_dir)
+            dirnames[:] = [d for d in dirnames if not self.excluded(os.path.normpath(os.path.join(rel_dir, d)))]
+            target_dir = os.path.normpath(os.path.join(self.shadow_dir, rel_dir))
+            Path(target_dir).mkdir(parents=True, exist_ok=True)
+            for name in filenames:
+                rel_path = os.path.normpath(os.path.join(rel_dir, name))
+                if self.excluded(rel_path):
+                    continue
+                source = os.path.join(dirpath, name)
+                target = os.path.join(target_dir, name)
+                try:
+                    if name.lower().endswith(SHADOW_COPY_SUFFIXES):
+                        shutil.copy2(source, target)
+                        copied += 1
+                    elif can_clone and reflink_file(source, target):
+                        cloned += 1
+                    else:
+                        # Первая неудача означает, что ФС не умеет reflink: дальше только ссылки
+                        can_clone = False
+                        try:
+                            os.link(source, target)
+                            self.linked.add(rel_path)
+                            linked += 1
+                        except OSError:
+                            shutil.copy2(source, target)
+                            copied += 1
+                    self.snapshot[rel_path] = self.signature(target)
+                except OSError as e:
+                    logger.warning(f"Файл {source} не попал в теневую копию: {e}")
+        return cloned, linked, copied
+    
+    def validate(self, latest):
+        """Проверка теневой копии после SteamCMD: сборка и исполняемый файл сервера."""
+        self.build_id = read_installed_build_id(self.shadow_dir)
+        if self.build_id is None:
+            raise RuntimeError("В теневой копии нет appmanifest с buildid")
+        if latest is not None and self.build_id != latest:
+            raise RuntimeError(f"В теневой копии сборка {self.build_id}, ожидалась {latest}")
+        server_path = os.path.abspath(SERVER_EXECUTABLE)
+        if os.path.normcase(server_path).startswith(os.path.normcase(self.live_dir + os.sep)):
+            shadow_server = os.path.join(self.shadow_dir, os.path.relpath(server_path, self.live_dir))
+            if not os.path.isfile(shadow_server):
+                raise RuntimeError(f"В теневой копии нет {os.path.basename(server_path)}")
+    
+    def collect_changes(self):
+        """Список относительных путей файлов, созданных или заменённых SteamCMD.
+        
+        Файлы, которые утилита или сервер изменили в живой установке после prepare,
+        не попадают в список: их записи в копии остались такими же, как в снимке.
+        RuntimeError, если SteamCMD записал файл на месте через жёсткую ссылку:
+        живой файл уже изменён, и подменять копию нельзя."""
+        self.changes = []
+        for dirpath, dirnames, filenames in os.walk(self.shadow_dir):
+            rel_dir = os.path.relpath(dirpath, self.shadow_dir)
+            dirnames[:] = [d for d in dirnames if not self.excluded(os.path.normpath(os.path.join(rel_dir, d)))]
+            for name in filenames:
+                rel_path = os.path.normpath(os.path.join(rel_dir, name))
+                if self.excluded(rel_path):
+                    continue
+                shadow_file = os.path.join(self.shadow_dir, rel_path)
+                signature = self.signature(shadow_file)
+                if self.snapshot.get(rel_path) == signature:
+                    continue
+                live_file = os.path.join(self.live_dir, rel_path)
+                if rel_path in self.linked and signature[:2] == self.snapshot[rel_path][:2] and os.path.exists(live_file) and os.path.samefile(shadow_file, live_file):
+                    raise RuntimeError(f"SteamCMD изменил {rel_path} на месте через жёсткую ссылку, живой файл уже изменён; нужно обновление на месте при остановленном сервере")
+                if os.path.isfile(live_file):
+                    if os.path.getsize(shadow_file) == os.path.getsize(live_file) and file_sha256(shadow_file) == file_sha256(live_file):
+                        continue
+                self.changes.append(rel_path)
+        return self.changes
+    
+    def apply(self):
+        """Перенос изменённых файлов в живую установку; при ошибке всё возвращается назад."""
+        shutil.rmtree(self.rollback_dir, ignore_errors=True)
+        Path(self.rollback_dir).mkdir(parents=True)
+        moved = []
+        try:
+            for rel_path in self.changes:
+                live_file = os.path.join(self.live_dir, rel_path)
+                existed = os.path.exists(live_file)
+                if existed:
+                    backup_file = os.path.join(self.rollback_dir, rel_path)
+                    Path(backup_file).parent.mkdir(parents=True, exist_ok=True)
+                    os.replace(live_file, backup_file)
+                moved.append((rel_path, existed))
+                Path(live_file).parent.mkdir(parents=True, exist_ok=True)
+                os.replace(os.path.join(self.shadow_dir, rel_path), live_file)
+        except OSError:
+            self.restore(moved)
+            raise
+        with open(os.path.join(self.rollback_dir, ROLLBACK_MANIFEST), "w", encoding="utf-8") as f:
+            json.dump({"build_id": self.build_id, "files": [{"path": p, "existed": e} for p, e in moved]}, f, indent=2)
+        self.discard()
+    
+    def restore(self, moved):
+        """Возврат прежних версий файлов из папки отката."""
+        for rel_path, existed in reversed(moved):
+            live_file = os.path.join(self.live_dir, rel_path)
+            backup_file = os.path.join(self.rollback_dir, rel_path)
+            if existed and os.path.exists(backup_file):
+                os.replace(backup_file, live_file)
+            elif not existed and os.path.exists(live_file):
+                os.remove(live_file)
+    
+    def rollback(self):
+        """Откат последнего применённого обновления по rollback.json."""
+        with open(os.path.join(self.rollback_dir, ROLLBACK_MANIFEST), "r", encoding="utf-8") as f:
+            files = json.load(f)["files"]
+        self.restore([(item["path"], item["existed"]) for item in files])
+        shutil.rmtree(self.rollback_dir, ignore_errors=True)
+        return len(files)
+    
+    def discard(self):
+        shutil.rmtree(self.shadow_dir, ignore_errors=True)
+
+def stage_update(force=False):
+    """Обновление теневой копии, пока сервер работает.
+    
+    Возвращает True, если подготовлено обновление для применения при рестарте."""
+    global staged_update
+    with update_lock:
+        needed, installed, latest = check_for_update(force)
+        if not needed and not force:
+            logger.info(f"Сервер уже актуален (сборка {installed}), теневая копия не нужна")
+            return False
+        shadow = ShadowInstall(steamcmd_install_dir)
+        started = time.monotonic()
+        cloned, linked, copied = shadow.prepare()
+        logger.info(f"Теневая копия собрана за {time.monotonic() - started:.1f} с: клонов {cloned}, ссылок {linked}, копий {copied}")
+        try:
+            return_code = run_steamcmd_update(shadow.shadow_dir, validate=True)
+            if return_code != 0:
+                raise RuntimeError(f"SteamCMD завершился с кодом {return_code}")
+            shadow.validate(latest)
+            changes = shadow.collect_changes()
+        except Exception:
+            shadow.discard()
+            raise
+        if not changes:
+            logger.info("SteamCMD не изменил ни одного файла, обновление не требуется")
+            shadow.discard()
+            return False
+        if staged_update is not None and staged_update.shadow_dir != shadow.shadow_dir:
+            staged_update.discard()
+        staged_update = shadow
+        logger.info(f"Обновление до сборки {shadow.build_id} подготовлено: изменено файлов {len(changes)}")
+        log_queue.put(f"Обновление до сборки {shadow.build_id} подготовлено, применится при рестарте")
+        return True
+
+def apply_staged_update():
+    """Применение подготовленного обновления; вызывается, пока сервер остановлен."""
+    global staged_update, update_applied_at
+    with update_lock:
+        if staged_update is None:
+            return False
+        shadow, staged_update = staged_update, None
+        started = time.monotonic()
+        try:
+            shadow.apply()
+        except OSError as e:
+            logger.error(f"Ошибка применения обновления, прежние файлы возвращены: {e}")
+            log_queue.put(f"Ошибка применения обновления, прежние файлы возвращены: {e}")
+            shadow.discard()
+            return False
+        build_check_cache.clear()
+        update_applied_at = time.monotonic()
+        logger.info(f"Обновление до сборки {shadow.build_id} применено за {time.monotonic() - started:.2f} с ({len(shadow.changes)} файлов)")
+        log_queue.put(f"Обновление до сборки {shadow.build_id} применено")
+        return True
+
+def rollback_update():
+    """Возврат файлов, заменённых последним применённым обновлением."""
+    global update_applied_at
+    with update_lock:
+        count = ShadowInstall(steamcmd_install_dir).rollback()
+        build_check_cache.clear()
+        update_applied_at = None
+    logger.info(f"Откат обновления: возвращено файлов {count}")
+    log_queue.put(f"Откат обновления: возвращено файлов {count}")
+    return count
+
+def perform_update(force=False):
+    """Обновление основного сервера; возвращает сообщение о результате, ошибки - исключениями."""
+    if not update_job_lock.acquire(blocking=False):
+        raise RuntimeError("Обновление уже выполняется")
+    try:
+        if update_mode != "staged" and primary_instance.running:
+            logger.warning("Попытка обновления при запущенном сервере")
+            raise RuntimeError("Сначала остановите сервер")
+        logger.info(f"Запуск обновления сервера через {steamcmd_executable}")
+        if not os.path.isfile(steamcmd_executable):
+            logger.error(f"Файл {steamcmd_executable} не найден")
+            log_queue.put(f"Ошибка: {steamcmd_executable} не найден")
+            raise FileNotFoundError(f"Файл {steamcmd_executable} не найден")
+        started = time.monotonic()
+        result = "error"
+        try:
+            message = run_update(force)
+            result = "ok"
+            return message
+        except (subprocess.SubprocessError, OSError) as e:
+            logger.error(f"Ошибка при обновлении сервера: {e}")
+            log_queue.put(f"Ошибка при обновлении сервера: {e}")
+            raise RuntimeError(f"Ошибка при обновлении: {e}") from e
+        finally:
+            metrics.observe("scum_update_duration_seconds", time.monotonic() - started, result=result)
+    finally:
+        update_job_lock.release()
+
+def run_update(force):
+    """Обновление в выбранном режиме; вызывается под update_job_lock."""
+    if update_mode == "staged":
+        if not stage_update(force):
+            return "Сервер уже актуален"
+        if not primary_instance.running and apply_staged_update():
+            return "Обновление сервера завершено"
+        return "Обновление подготовлено и применится при рестарте"
+    
+    if not force:
+        needed, installed, latest = check_for_update()
+        if not needed:
+            logger.info(f"Сервер уже актуален (сборка {installed}), SteamCMD не запускается")
+            log_queue.put(f"Сервер уже актуален (сборка {installed}), SteamCMD не запускается")
+            return f"Сервер уже актуален (сборка {installed})"
+    
+    return_code = run_steamcmd_update()
+    build_check_cache.clear()
+    if return_code != 0:
+        logger.error(f"Ошибка обновления сервера, код возврата: {return_code}")
+        log_queue.put(f"Ошибка обновления сервера, код возврата: {return_code}")
+        raise RuntimeError(f"Ошибка обновления, код возврата: {return_code}")
+    logger.info("Обновление сервера завершено успешно")
+    log_queue.put("Обновление сервера завершено успешно")
+    return "Обновление сервера завершено"
+
+PipelineStage = namedtuple("PipelineStage", "name phase title func")
+
+def pipeline_backup_copy(context):
+    """Копирование сохранений остановленного сервера во временный каталог; без изменений с прошлого бэкапа - пропуск."""
+    instance = context["instance"]
+    if instance.primary:
+        if save_watcher.unchanged():
+            logger.info("Сохранения не изменились с последнего бэкапа, бэкап конвейера пропущен")
+            log_queue.put("Сохранения не изменились с последнего бэкапа, бэкап конвейера пропущен")
+            return
+        context["backup_token"] = save_watcher.observed()
+    staging_dir = os.path.join(instance.backup_dir, f".pipeline_{context['timestamp']}")
+    Path(staging_dir).mkdir(parents=True, exist_ok=True)
+    context["backup_staging"] = staging_dir
+    copied = []
+    # Копия идёт без дискового слота: сервер стоит, и ожидание чужой архивации удлинило бы простой
+    for name in SAVE_FILES:
+        source = os.path.join(instance.save_dir, name)
+        if os.path.isfile(source):
+            target = os.path.join(staging_dir, name)
+            shutil.copy2(source, target)
+            copied.append(target)
+    if not copied:
+        raise FileNotFoundError(f"Файлы для бэкапа не найдены в {instance.save_dir}")
+    context["backup_files"] = copied
+
+def pipeline_backup_archive(context):
+    """Архивация скопированных сохранений параллельно с работой сервера."""
+    staging_dir = context.get("backup_staging")
+    if staging_dir is None:
+        return
+    instance = context["instance"]
+    
+    def archive(job):
+        job.add_total(sum(os.path.getsize(f) for f in context["backup_files"]))
+        with disk_slot:
+            return write_backup(context["backup_files"], context["timestamp"], source="pipeline", target_dir=instance.backup_dir, install_dir=instance.install_dir, progress=job.advance)
+    
+    try:
+        if context.get("backup_files"):
+            backup_file = submit_backup_job("pipeline", archive, instance).future.result()
+            save_watcher.mark_backup(context.get("backup_token"))
+            logger.info(f"{instance.label}Бэкап конвейера рестарта создан: {backup_file}")
+            log_queue.put(f"{instance.label}Бэкап конвейера рестарта создан: {backup_file}")
+    finally:
+        shutil.rmtree(staging_dir, ignore_errors=True)
+
+def pipeline_db_maintenance(context):
+    """Обслуживание SCUM.db остановленного сервера: VACUUM, checkpoint, ANALYZE по замеру и в пределах бюджета."""
+    instance = context["instance"]
+    db_path = os.path.join(instance.save_dir, SAVE_FILES[0])
+    if not os.path.isfile(db_path):
+        return
+    record = run_db_maintenance(db_path, db_maintenance_budget)
+    record["instance"] = instance.name
+    db_health.record(record)
+    message = format_db_maintenance(record)
+    logger.info(f"{instance.label}{message}")
+    log_queue.put(f"{instance.label}{message}")
+
+def pipeline_update_check(context):
+    """Проверка новой сборки, пока сервер ещё работает."""
+    if not os.path.isfile(steamcmd_executable):
+        raise FileNotFoundError(f"Файл {steamcmd_executable} не найден")
+    instance = context["instance"]
+    needed, installed, latest = check_for_update(install_dir=instance.install_dir)
+    context["update_needed"] = needed
+    if not needed:
+        logger.info(f"{instance.label}Сервер уже актуален (сборка {installed}), обновление пропускается")
+        log_queue.put(f"{instance.label}Сервер уже актуален (сборка {installed}), обновление пропускается")
+
+def pipeline_update_stage(context):
+    """Загрузка обновления в теневую копию, пока сервер ещё работает (только основной инстанс)."""
+    if update_mode != "staged" or not context["instance"].primary or not context.get("update_needed", True):
+        return
+    stage_update()
+
+def pipeline_update(context):
+    """Обновление сервера через SteamCMD, пока сервер остановлен."""
+    instance = context["instance"]
+    if update_mode == "staged" and instance.primary:
+        apply_staged_update()
+        return
+    if not context.get("update_needed", True):
+        return
+    if not os.path.isfile(steamcmd_executable):
+        raise FileNotFoundError(f"Файл {steamcmd_executable} не найден")
+    return_code = run_steamcmd_update(instance.install_dir)
+    build_check_cache.clear()
+    if return_code != 0:
+        raise RuntimeError(f"SteamCMD завершился с кодом {return_code}")
+
+# Этапы в порядке выполнения. pre - до остановки, down - пока сервер остановлен,
+# post - в фоне после запуска; один этап конвейера может работать в нескольких фазах.
+PIPELINE_STAGES = [
+    PipelineStage("update", "pre", "проверка сборки", pipeline_update_check),
+    PipelineStage("update", "pre", "загрузка в теневую копию", pipeline_update_stage),
+    PipelineStage("backup", "down", "копирование сохранений", pipeline_backup_copy),
+    PipelineStage("maintenance", "down", "обслуживание базы", pipeline_db_maintenance),
+    PipelineStage("update", "down", "обновление", pipeline_update),
+    PipelineStage("backup", "post", "архивация бэкапа", pipeline_backup_archive),
+]
+
+class RestartPipeline:
+    """Плановый рестарт как одна задача: stop -> этапы простоя -> start -> фоновые этапы.
+    
+    Замеряет каждый этап и время простоя для игроков (от начала остановки до запуска нового процесса)."""
+    
+    def __init__(self, stage_names, reason, instance):
+        self.stages = [stage for stage in PIPELINE_STAGES if stage.name in stage_names]
+        self.reason = reason
+        self.instance = instance
+        self.context = {"timestamp": datetime.now().strftime("%Y-%m-%d_%H-%M-%S"), "instance": instance}
+        self.timings = []
+        self.stop_started = None
+        self.downtime = None
+        self.report = None
+    
+    def run_phase(self, phase):
+        for stage in self.stages:
+            if stage.phase != phase:
+                continue
+            started = time.monotonic()
+            try:
+                stage.func(self.context)
+                ok = True
+            except Exception as e:
+                ok = False
+                logger.error(f"{self.instance.label}Этап конвейера '{stage.title}' завершился ошибкой: {e}")
+                log_queue.put(f"{self.instance.label}Этап конвейера '{stage.title}' завершился ошибкой: {e}")
+            self.record(stage.title, phase, time.monotonic() - started, ok)
+    
+    def record(self, title, phase, seconds, ok=True):
+        self.timings.append({"stage": title, "phase": phase, "seconds": round(seconds, 3), "ok": ok})
+    
+    def stop(self, process):
+        self.stop_started = time.monotonic()
+        stop_server_process(process)
+        self.record("остановка", "down", time.monotonic() - self.stop_started)
+    
+    def started(self, launch_seconds):
+        """Фиксация запуска сервера и старт фоновых этапов."""
+        self.record("запуск", "down", launch_seconds)
+        self.downtime = time.monotonic() - self.stop_started
+        self.summarize("простой")
+        self.start_post()
+    
+    def abort(self):
+        """Сервер остановили до запуска: фоновые этапы всё равно доводятся до конца."""
+        logger.info(f"{self.instance.label}Конвейер рестарта прерван остановкой сервера")
+        self.start_post()
+    
+    def start_post(self):
+        if any(stage.phase == "post" for stage in self.stages):
+            threading.Thread(target=self.run_post, daemon=True).start()
+        else:
+            self.finish()
+    
+    def run_post(self):
+        self.run_phase("post")
+        self.finish()
+    
+    def summarize(self, label):
+        parts = ", ".join(f"{t['stage']} {t['seconds']:.1f} с{'' if t['ok'] else ' (ошибка)'}" for t in self.timings)
+        message = f"{self.instance.label}Конвейер рестарта ({self.reason}): {parts}"
+        if self.downtime is not None:
+            message += f"; {label} для игроков {self.downtime:.1f} с"
+        logger.info(message)
+        log_queue.put(message)
+    
+    def finish(self):
+        if any(t["phase"] == "post" for t in self.timings):
+            self.summarize("итог, простой")
+        self.report = {
+            "time": datetime.now().isoformat(timespec="seconds"),
+            "instance": self.instance.name,
+            "reason": self.reason,
+            "downtime": round(self.downtime, 3) if self.downtime is not None else None,
+            "stages": self.timings,
+        }
+        pipeline_reports.append(self.report)
+        event_bus.publish("restart", **self.report)
+        if self.downtime is not None:
+            metrics.observe("scum_restart_downtime_seconds", self.downtime, instance=self.instance.name)
+
+def wake_supervisor():
+    """Пробуждение потока супервизора после изменения состояния."""
+    supervisor_event.set()
+
+def on_server_exit(process):
+    """Пробуждение супервизора сразу после завершения процесса сервера."""
+    wake_supervisor()
+
+def stop_server_process(process):
+    """Завершение процесса сервера: terminate, затем kill по таймауту."""
+    process.terminate()
+    try:
+        process.wait(timeout=10)
+        logger.info("Сервер остановлен")
+    except subprocess.TimeoutExpired:
+        logger.warning("Процесс не завершился вовремя, принудительное завершение...")
+        process.kill()
+        process.wait()
+
+ScheduleEntry = namedtuple("ScheduleEntry", "spec weekdays at date")
+
+def parse_schedule_entry(spec):
+    """Разбор записи расписания рестартов; ValueError при неверном формате."""
+    parts = spec.split()
+    if not 1 <= len(parts) <= 2 or not validate_time_input(parts[-1]):
+        raise ValueError(f"неверная запись расписания: {spec!r}")
+    at = dt_time(*map(int, parts[-1].split(":")))
+    if len(parts) == 1:
+        return ScheduleEntry(parts[0], None, at, None)
+    if re.match(r"^\d{4}-\d{2}-\d{2}$", parts[0]):
+        return ScheduleEntry(" ".join(parts), None, at, datetime.strptime(parts[0], "%Y-%m-%d").date())
+    weekdays = set()
+    for token in parts[0].lower().split(","):
+        first, _, last = token.partition("-")
+        if first not in SCHEDULE_WEEKDAYS or (last or first) not in SCHEDULE_WEEKDAYS:
+            raise ValueError(f"неизвестный день недели в записи {spec!r}")
+        start, end = SCHEDULE_WEEKDAYS[first], SCHEDULE_WEEKDAYS[last or first]
+        weekdays.update((start + offset) % 7 for offset in range((end - start) % 7 + 1))
+    return ScheduleEntry(" ".join(parts), frozenset(weekdays), at, None)
+
+def parse_schedule(specs):
+    """Разбор списка записей из настроек: неверные записи пропускаются с предупреждением."""
+    entries = []
+    for spec in specs:
+        try:
+            entries.append(parse_schedule_entry(spec))
+        except ValueError as e:
+            logger.warning(f"Запись расписания пропущена: {e}")
+    return entries
+
+def schedule_from_settings(data):
+    """Расписание из настроек; старый ключ restart_times читается как ежедневные записи."""
+    specs = data.get("restart_schedule", data.get("restart_times", DEFAULT_RESTART_SCHEDULE))
+    return [entry.spec for entry in parse_schedule(specs)]
+
+def entry_next_fire(entry, after):
+    """Ближайшее срабатывание записи строго позже after; None для прошедшей разовой записи."""
+    if entry.date is not None:
+        moment = datetime.combine(entry.date, entry.at)
+        return moment if moment > after else None
+    moment = datetime.combine(after.date(), entry.at)
+    if moment <= after:
+        moment += timedelta(days=1)
+    while entry.weekdays is not None and moment.weekday() not in entry.weekdays:
+        moment += timedelta(days=1)
+    return moment
+
+class RestartSchedule:
+    """Календарь плановых рестартов: куча записей по времени следующего срабатывания.
+    
+    Каждое срабатывание выдаётся ровно один раз: сработавшая запись переносится на
+    вхождение строго позже и момента срабатывания, и текущего времени, поэтому
+    перезапущенный в ту же минуту сервер не рестартится повторно, а после сна
+    системы пропущенные вхождения схлопываются в одно. Разовые записи удаляются."""
+    
+    def __init__(self, specs, now):
+        self.specs = tuple(specs)
+        self.heap = []
+        self.lock = threading.Lock()
+        for order, entry in enumerate(parse_schedule(specs)):
+            self._push(entry, order, now)
+    
+    def _push(self, entry, order, after):
+        moment = entry_next_fire(entry, after)
+        if moment is not None:
+            heapq.heappush(self.heap, (moment, order, entry))
+    
+    def next_fire(self):
+        with self.lock:
+            return self.heap[0][0] if self.heap else None
+    
+    def pop_due(self, now):
+        """Записи, срабатывающие к моменту now, в порядке времени."""
+        fired = []
+        with self.lock:
+            while self.heap and self.heap[0][0] <= now:
+                moment, order, entry = heapq.heappop(self.heap)
+                fired.append(entry)
+                self._push(entry, order, max(moment, now))
+        return fired
+
+def schedule_reason(entry):
+    """Причина рестарта для журнала и отчёта конвейера."""
+    if entry.date is not None:
+        return f"разовое обслуживание {entry.spec}"
+    return f"рестарт по расписанию {entry.spec}"
+
+def wait_supervisor_event(deadline=None):
+    """Сон до события или до дедлайна; без событий поток не потребляет CPU."""
+    timeout = SUPERVISOR_MAX_SLEEP
+    if deadline is not None:
+        timeout = min(timeout, max(0.0, (deadline - datetime.now()).total_seconds()))
+    supervisor_event.wait(timeout)
+    supervisor_event.clear()
+
+class SharedState:
+    """Поля, которые меняют разные потоки (окно, API, сторож, супервизор): чтение и запись под блокировкой."""
+    
+    def __init__(self, **fields):
+        self.lock = threading.Lock()
+        self.fields = fields
+    
+    def get(self, name):
+        with self.lock:
+            return self.fields[name]
+    
+    def set(self, **changes):
+        with self.lock:
+            self.fields.update(changes)
+    
+    def exchange(self, **changes):
+        """Атомарная замена полей; возвращает прежние значения."""
+        with self.lock:
+            previous = {name: self.fields[name] for name in changes}
+            self.fields.update(changes)
+            return previous
+
+def _state_property(name):
+    """Свойство инстанса, хранящееся в его SharedState."""
+    return property(lambda self: self.state.get(name), lambda self, value: self.state.set(**{name: value}))
+
+server_state = SharedState(running=False, restart_now=False, restart_reason=None, restart_kind=None)
+
+class ServerInstance:
+    """Один SCUMServer.exe: процесс, расписание, пути и поток вывода.
+    
+    Своих потоков у инстанса нет: им управляет общий супервизор run_server,
+    долгие операции выполняются в общем пуле instance_jobs."""
+    
+    primary = False
+    running = _state_property("running")
+    restart_now = _state_property("restart_now")
+    restart_reason = _state_property("restart_reason")
+    
+    def __init__(self, name, executable, args, restart_schedule, save_dir, backup_dir, install_dir, auto_start=False):
+        self.name = name
+        self.executable = executable
+        self.args = args
+        self.restart_schedule = restart_schedule
+        self.save_dir = save_dir
+        self.backup_dir = backup_dir
+        self.install_dir = install_dir
+        self.state = SharedState(running=auto_start, restart_now=False, restart_reason=None, restart_kind=None)
+        self.process = None
+        self.start_time = 0
+        self.launched_at = None
+        self.crash_time = None
+        self.relaunch_at = None
+        self.schedule = None
+        self.next_restart = None
+        self.published = None
+        self.pipeline = None
+        self.job = None
+        self.pre_job = None
+        self.removed = False
+    
+    @property
+    def label(self):
+        return f"[{self.name}] "
+    
+    @classmethod
+    def from_settings(cls, data, index):
+        """Инстанс из записи settings.json; ValueError без своих путей.
+        
+        Пути по умолчанию принадлежат основному серверу: с ними конвейер дополнительного
+        обслуживал бы чужую SCUM.db и писал бы бэкапы в чужой каталог."""
+        name = data.get("name", f"server{index + 1}")
+        for key in ("save_dir", "backup_dir", "install_dir"):
+            if not data.get(key):
+                raise ValueError(f"у инстанса {name} не задан {key}")
+        return cls(
+            name,
+            data.get("executable", SERVER_EXECUTABLE),
+            data.get("args", DEFAULT_ARGS[:]),
+            schedule_from_settings(data),
+            data["save_dir"],
+            data["backup_dir"],
+            data["install_dir"],
+            bool(data.get("auto_start", False))
+        )
+    
+    def to_settings(self):
+        return {
+            "name": self.name,
+            "executable": self.executable,
+            "args": self.args,
+            "restart_schedule": self.restart_schedule,
+            "save_dir": self.save_dir,
+            "backup_dir": self.backup_dir,
+            "install_dir": self.install_dir,
+            "auto_start": self.running
+        }
+    
+    def handle_output(self, lines):
+        metrics.inc("scum_log_lines_total", len(lines), instance=self.name)
+        log_queue.put_many(f"{self.label}{line.text}" if line.stream == "stdout" else f"{self.label}STDERR: {line.text}" for line in lines)
+    
+    def attach(self):
+        pass
+    
+    def detach(self):
+        pass
+    
+    def launch_failed(self):
+        self.running = False
+    
+    def request_restart(self, reason, kind="manual"):
+        """Запрос рестарта; kind (manual, watchdog, memory) идёт в метрику scum_restarts_total."""
+        self.state.set(restart_reason=reason, restart_kind=kind, restart_now=True)
+        wake_supervisor()
+    
+    def take_restart_request(self):
+        """(причина, вид) запрошенного рестарта с атомарным сбросом запроса; None, если запроса нет."""
+        previous = self.state.exchange(restart_now=False, restart_reason=None, restart_kind=None)
+        return (previous["restart_reason"], previous["restart_kind"]) if previous["restart_now"] else None
+
+def _global_property(name):
+    """Свойство основного инстанса, хранящееся в глобальной переменной модуля."""
+    return property(lambda self: globals()[name], lambda self, value: globals().__setitem__(name, value))
+
+class PrimaryInstance(ServerInstance):
+    """Основной инстанс: состояние в глобальных переменных, которыми пользуются GUI, телеметрия и сторож."""
+    
+    primary = True
+    executable = _global_property("SERVER_EXECUTABLE")
+    args = _global_property("server_args")
+    restart_schedule = _global_property("restart_schedule")
+    save_dir = _global_property("save_dir")
+    backup_dir = _global_property("backup_dir")
+    install_dir = _global_property("steamcmd_install_dir")
+    process = _global_property("current_process")
+    start_time = _global_property("start_time")
+    
+    def __init__(self):
+        self.name = "main"
+        self.state = server_state
+        self.removed = False
+        self.launched_at = None
+        self.crash_time = None
+        self.relaunch_at = None
+        self.schedule = None
+        self.next_restart = None
+        self.published = None
+        self.pipeline = None
+        self.job = None
+        self.pre_job = None
+    
+    @property
+    def label(self):
+        return ""
+    
+    def handle_output(self, lines):
+        metrics.inc("scum_log_lines_total", len(lines), instance=self.name)
+        handle_server_output(lines)
+    
+    def attach(self):
+        telemetry.attach(self.process.pid)
+        watchdog.attach(self.process)
+    
+    def detach(self):
+        telemetry.detach()
+        watchdog.detach()
+    
+    def launch_failed(self):
+        request_shutdown()
+
+primary_instance = PrimaryInstance()
+instances.append(primary_instance)
+
+def update_instances_from_settings(items):
+    """Сверка дополнительных инстансов с настройками: новые добавляются, у существующих
+    обновляются пути и расписание, пропавшие останавливаются и удаляются супервизором.
+    
+    Запись без своих путей или с каталогом сохранений или бэкапов, занятым другим
+    инстансом, отклоняется с ошибкой в журнале; уже работающий инстанс остаётся как был."""
+    known = {instance.name: instance for instance in instances[1:]}
+    names = set()
+    owners = {}
+    for directory in (save_dir, backup_dir):
+        owners[os.path.normcase(os.path.abspath(directory))] = primary_instance.name
+    for index, item in enumerate(items):
+        try:
+            configured = ServerInstance.from_settings(item, index)
+            for directory in (configured.save_dir, configured.backup_dir):
+                owner = owners.get(os.path.normcase(os.path.abspath(directory)))
+                if owner is not None:
+                    raise ValueError(f"каталог {directory} инстанса {configured.name} уже занят инстансом {owner}")
+        except ValueError as e:
+            logger.error(f"Инстанс из настроек отклонён: {e}")
+            log_queue.put(f"Инстанс из настроек отклонён: {e}")
+            name = item.get("name", f"server{index + 1}")
+            names.add(name)
+            if name in known:
+                for directory in (known[name].save_dir, known[name].backup_dir):
+                    owners.setdefault(os.path.normcase(os.path.abspath(directory)), name)
+            continue
+        for directory in (configured.save_dir, configured.backup_dir):
+            owners[os.path.normcase(os.path.abspath(directory))] = configured.name
+        names.add(configured.name)
+        instance = known.get(configured.name)
+        if instance is None:
+            instances.append(configured)
+            continue
+        for field in ("executable", "args", "restart_schedule", "save_dir", "backup_dir", "install_dir"):
+            setattr(instance, field, getattr(configured, field))
+        instance.removed = False
+    for name, instance in known.items():
+        if name not in names:
+            instance.removed = True
+            instance.running = False
+    wake_supervisor()
+
+def submit_instance_job(instance, func, *args):
+    """Долгая операция инстанса в общем пуле; по завершении будится супервизор."""
+    instance.job = instance_jobs.submit(func, instance, *args)
+    instance.job.add_done_callback(lambda future: wake_supervisor())
+
+def stop_instance(instance):
+    stop_server_process(instance.process)
+    instance.detach()
+    instance.process = None
+
+def prepare_restart(pipeline):
+    """Этапы конвейера до остановки (проверка сборки, загрузка обновления), пока сервер работает."""
+    pipeline.run_phase("pre")
+    return pipeline
+
+def restart_instance(instance, reason, pipeline=None):
+    """Остановка инстанса для рестарта, с этапами простоя конвейера, если он подготовлен."""
+    instance.pipeline = pipeline
+    logger.info(f"{instance.label}Остановка сервера по запросу ({reason})...")
+    if instance.pipeline is not None:
+        instance.pipeline.stop(instance.process)
+        instance.pipeline.run_phase("down")
+    else:
+        stop_server_process(instance.process)
+    instance.detach()
+    instance.process = None
+
+def launch_instance(instance):
+    """Запуск процесса инстанса; возвращает False, если запуск невозможен."""
+    logger.info(f"{instance.label}Попытка запуска {instance.executable} с аргументами: {' '.join(instance.args)}")
+    instance.start_time = time.time()
+    if not os.path.isfile(instance.executable):
+        logger.error(f"{instance.label}Файл {instance.executable} не найден в текущей директории: {os.getcwd()}")
+        return False
+    if not os.access(instance.executable, os.X_OK):
+        logger.error(f"{instance.label}Нет прав на запуск {instance.executable}")
+        return False
+    try:
+        launch_started = time.monotonic()
+        if instance.primary:
+            apply_staged_update()
+        instance.process = output_mux.spawn([instance.executable] + instance.args, instance.handle_output, on_exit=on_server_exit, **NO_WINDOW)
+    except (subprocess.SubprocessError, OSError) as e:
+        logger.error(f"{instance.label}Ошибка при запуске сервера: {e}")
         return False
+    instance.launched_at = datetime.now()
+    if instance.primary:
+        startup_timer.note_server_launch()
+    logger.info(f"{instance.label}Сервер запущен с PID: {instance.process.pid}")
+    if instance.pipeline is not None:
+        instance.pipeline.started(time.monotonic() - launch_started)
+        instance.pipeline = None
+    instance.attach()
+    if instance.crash_time is not None:
+        latency = time.monotonic() - instance.crash_time
+        logger.info(f"{instance.label}Перезапуск после сбоя выполнен за {latency:.3f} с")
+        log_queue.put(f"{instance.label}Перезапуск после сбоя выполнен за {latency:.3f} с")
+        instance.crash_time = None
+    return True
 
-def validate_path(path_str):
-    """Проверка существования пути."""
-    return os.path.exists(os.path.dirname(path_str)) or path_str == ""
+def supervise_instance(instance, index, now):
+    """Один шаг супервизора для инстанса; возвращает момент следующей проверки или None.
+    
+    Пока идёт подготовка конвейера (pre_job, может занимать минуты загрузки обновления),
+    сервер по-прежнему наблюдается и перезапускается при падении; запрошенные в это время
+    рестарты выполняются вместе с конвейером, когда подготовка закончится."""
+    if instance.job is not None:
+        if not instance.job.done():
+            return None
+        job, instance.job = instance.job, None
+        try:
+            job.result()
+        except Exception as e:
+            logger.error(f"{instance.label}Ошибка фоновой операции: {e}")
+    
+    if shutdown_event.is_set() or not instance.running:
+        if instance.process is not None:
+            logger.info(f"{instance.label}Остановка сервера по запросу...")
+            submit_instance_job(instance, stop_instance)
+        elif instance.pipeline is not None:
+            instance.pipeline.abort()
+            instance.pipeline = None
+        if instance.pre_job is not None and instance.pre_job.done():
+            pre_job, instance.pre_job = instance.pre_job, None
+            try:
+                pre_job.result().abort()
+            except Exception as e:
+                logger.error(f"{instance.label}Ошибка подготовки конвейера: {e}")
+        instance.relaunch_at = None
+        instance.schedule = None
+        instance.next_restart = None
+        instance.take_restart_request()
+        return None
+    
+    if instance.process is None:
+        if instance.relaunch_at is not None and time.monotonic() < instance.relaunch_at:
+            return now + timedelta(seconds=instance.relaunch_at - time.monotonic())
+        instance.relaunch_at = None
+        if not launch_instance(instance):
+            instance.launch_failed()
+            return None
+    
+    if instance.process.poll() is not None:
+        instance.crash_time = instance.process.exit_time or time.monotonic()
+        logger.error(f"{instance.label}Сервер неожиданно завершил работу. Код возврата: {instance.process.returncode}")
+        metrics.inc("scum_server_crashes_total", instance=instance.name, code=instance.process.returncode)
+        metrics.inc("scum_restarts_total", instance=instance.name, reason="crash")
+        if instance.primary and update_applied_at is not None and instance.crash_time - update_applied_at < UPDATE_PROBATION:
+            logger.error("Сервер упал вскоре после обновления, выполняется откат")
+            log_queue.put("Сервер упал вскоре после обновления, выполняется откат")
+            try:
+                rollback_update()
+            except (OSError, ValueError, KeyError) as e:
+                logger.error(f"Ошибка отката обновления: {e}")
+        instance.detach()
+        instance.process = None
+        logger.info(f"{instance.label}Перезапуск сервера через {crash_restart_delay:g} секунд...")
+        instance.relaunch_at = time.monotonic() + crash_restart_delay
+        return now + timedelta(seconds=crash_restart_delay)
+    
+    if instance.pre_job is not None:
+        if not instance.pre_job.done():
+            return None
+        pre_job, instance.pre_job = instance.pre_job, None
+        try:
+            pipeline = pre_job.result()
+        except Exception as e:
+            logger.error(f"{instance.label}Ошибка подготовки конвейера: {e}")
+        else:
+            request = instance.take_restart_request()
+            if request is not None:
+                metrics.inc("scum_restarts_total", instance=instance.name, reason=request[1])
+            submit_instance_job(instance, restart_instance, pipeline.reason, pipeline)
+            return None
+    
+    stagger = timedelta(seconds=RESTART_STAGGER * index)
+    if instance.schedule is None or instance.schedule.specs != tuple(instance.restart_schedule):
+        instance.schedule = RestartSchedule(instance.restart_schedule, now - stagger)
+    request = instance.take_restart_request()
+    if request is not None:
+        reason, kind = request
+        metrics.inc("scum_restarts_total", instance=instance.name, reason=kind)
+        submit_instance_job(instance, restart_instance, reason)
+        return None
+    fired = instance.schedule.pop_due(now - stagger)
+    if fired:
+        metrics.inc("scum_restarts_total", instance=instance.name, reason="scheduled")
+        reason = schedule_reason(fired[0])
+        if restart_pipeline:
+            instance.pre_job = instance_jobs.submit(prepare_restart, RestartPipeline(restart_pipeline, reason, instance))
+            instance.pre_job.add_done_callback(lambda future: wake_supervisor())
+        else:
+            submit_instance_job(instance, restart_instance, reason)
+        return None
+    deadline = instance.schedule.next_fire()
+    instance.next_restart = deadline + stagger if deadline is not None else None
+    return instance.next_restart
 
-def backup_server(root, log_widget):
-    """Создание бэкапа файлов сохранений."""
-    if server_running:
-        messagebox.showerror("Ошибка", "Сначала остановите сервер")
-        logger.warning("Попытка бэкапа при запущенном сервере")
-        return
+def publish_instance_status(instance):
+    """Публикация состояния инстанса в шину, если оно изменилось с прошлой публикации."""
+    status = instance_status(instance)
+    del status["uptime"]
+    if status != instance.published:
+        instance.published = status
+        event_bus.publish("instance", **status)
+
+def run_server(log_widget):
+    """Единый супервизор всех инстансов.
     
-    logger.info("Запуск процесса бэкапа")
-    backup_splash = create_backup_splash(root)
+    Решения принимаются в одном потоке по событиям и дедлайнам; остановки и этапы
+    конвейера выполняются в общем пуле, вывод всех процессов читает output_mux.
+    Плановые рестарты инстансов сдвинуты на RESTART_STAGGER по порядку в списке."""
+    if auto_start:
+        primary_instance.running = True
     
-    try:
-        Path(backup_dir).mkdir(parents=True, exist_ok=True)
-        timestamp = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
-        backup_file = os.path.join(backup_dir, f"backup_{timestamp}.zip")
-        
-        files_to_backup = [os.path.join(save_dir, f) for f in SAVE_FILES if os.path.isfile(os.path.join(save_dir, f))]
-        if not files_to_backup:
-            logger.error(f"Файлы для бэкапа не найдены в {save_dir}")
-            log_queue.put(f"Ошибка: Файлы для бэкапа не найдены в {save_dir}")
-            messagebox.showerror("Ошибка", f"Файлы для бэкапа не найдены в {save_dir}")
-            backup_splash.destroy()
-            return
-        
-        with zipfile.ZipFile(backup_file, "w", zipfile.ZIP_DEFLATED) as zipf:
-            for file in files_to_backup:
-                zipf.write(file, os.path.basename(file))
-                logger.info(f"Добавлен файл в архив: {file}")
-                log_queue.put(f"Добавлен файл в архив: {os.path.basename(file)}")
-        
-        logger.info(f"Бэкап успешно создан: {backup_file}")
-        log_queue.put(f"Бэкап успешно создан: {backup_file}")
-        messagebox.showinfo("Успех", f"Бэкап создан: {backup_file}")
-    except Exception as e:
-        logger.error(f"Ошибка при создании бэкапа: {e}")
-        log_queue.put(f"Ошибка при создании бэкапа: {e}")
-        messagebox.showerror("Ошибка", f"Ошибка при создании бэкапа: {e}")
+    while True:
+        now = datetime.now()
+        deadlines = []
+        for index, instance in enumerate(instances):
+            deadline = supervise_instance(instance, index, now)
+            if deadline is not None:
+                deadlines.append(deadline)
+            publish_instance_status(instance)
+        if shutdown_event.is_set() and all(instance.process is None and instance.job is None and instance.pre_job is None for instance in instances):
+            break
+        for instance in [instance for instance in instances if instance.removed and instance.process is None and instance.job is None and instance.pre_job is None]:
+            instances.remove(instance)
+            event_bus.publish("instance_removed", name=instance.name)
+        wait_supervisor_event(min(deadlines) if deadlines else None)
+
+class LogTail:
+    """Хвост журнала для API: кольцевой буфер пронумерованных строк с ожиданием новых."""
     
-    backup_splash.destroy()
+    def __init__(self, capacity):
+        self.lines = deque(maxlen=capacity)
+        self.next_seq = 0
+        self.condition = threading.Condition()
+    
+    def append(self, line):
+        self.extend((line,))
+    
+    def extend(self, lines):
+        with self.condition:
+            self.lines.extend(lines)
+            self.next_seq += len(lines)
+            self.condition.notify_all()
+    
+    def read(self, since, wait=0):
+        """Строки с номера since; при отсутствии новых ждёт до wait секунд.
+        
+        Возвращает (строки, следующий номер, пропущено вытесненных строк)."""
+        with self.condition:
+            if wait > 0 and since >= self.next_seq:
+                self.condition.wait(wait)
+            first = self.next_seq - len(self.lines)
+            if since < 0 or since > self.next_seq:
+                since = self.next_seq
+            start = max(since, first)
+            lines = list(itertools.islice(self.lines, start - first, None))
+            return lines, self.next_seq, start - since
 
-def update_server(root, log_widget):
-    """Обновление сервера через SteamCMD в отдельном потоке."""
-    if server_running:
-        messagebox.showerror("Ошибка", "Сначала остановите сервер")
-        logger.warning("Попытка обновления при запущенном сервере")
-        return
+log_tail = LogTail(API_LOG_TAIL)
+
+class EventBus(LogTail):
+    """Шина событий между потоками: издатели из любого потока публикуют (тема, данные),
+    подписчики читают пронумерованные события со своего номера в своём потоке.
     
-    logger.info(f"Запуск обновления сервера через {steamcmd_executable}")
-    update_splash = create_update_splash(root)
+    Окно подписывается через /api/events и меняет виджеты только в потоке Tk.
+    Хранятся последние EVENT_BUS_CAPACITY событий: подписчик, узнавший о пропуске,
+    перечитывает полное состояние через /api/status."""
     
-    def run_update():
-        try:
-            if not os.path.isfile(steamcmd_executable):
-                logger.error(f"Файл {steamcmd_executable} не найден")
-                log_queue.put(f"Ошибка: {steamcmd_executable} не найден")
-                root.after(0, lambda: messagebox.showerror("Ошибка", f"Файл {steamcmd_executable} не найден"))
-                root.after(0, update_splash.destroy)
-                return
-            
-            args = ["+force_install_dir", steamcmd_install_dir, "+login", "anonymous", "+app_update", "3792580", "+quit"]
-            process = subprocess.Popen(
-                [steamcmd_executable] + args,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                text=True,
-                errors='replace',
-                creationflags=0x08000000
-            )
-            logger.info(f"SteamCMD запущен с PID: {process.pid}")
-            
+    def publish(self, topic, **data):
+        self.append({"topic": topic, "time": time.time(), **data})
+    
+    def read(self, since, wait=0, topics=None):
+        events, next_seq, skipped = super().read(since, wait)
+        if topics:
+            events = [event for event in events if event["topic"] in topics]
+        return events, next_seq, skipped
+    
+    def subscribe(self, handler, topics=None, name="event-subscriber"):
+        """Подписка внутри процесса: handler вызывается по порядку для каждого нового события в отдельном потоке."""
+        def run():
+            since = self.next_seq
             while True:
-                line = process.stdout.readline()
-                if not line and process.poll() is not None:
-                    break
-                if line:
-                    log_queue.put(line.strip())
-            
-            for line in process.stderr:
-                if line:
-                    log_queue.put(f"STDERR: {line.strip()}")
-            
-            return_code = process.returncode
-            if return_code == 0:
-                logger.info("Обновление сервера завершено успешно")
-                log_queue.put("Обновление сервера завершено успешно")
-                root.after(0, lambda: messagebox.showinfo("Успех", "Обновление сервера завершено"))
+                events, since, _ = self.read(since, SUPERVISOR_MAX_SLEEP, topics)
+                for event in events:
+                    handler(event)
+        threading.Thread(target=run, name=name, daemon=True).start()
+
+event_bus = EventBus(EVENT_BUS_CAPACITY)
+
+def prometheus_labels(labels):
+    """Метки в синтаксисе Prometheus: {a="1",b="2"}; пустая строка без меток."""
+    if not labels:
+        return ""
+    escape = lambda value: str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+    return "{" + ",".join(f'{key}="{escape(value)}"' for key, value in labels.items()) + "}"
+
+class Metrics:
+    """Счётчики, гистограммы и показатели (gauge) менеджера в памяти процесса.
+    
+    Обновление - одна операция со словарём под блокировкой, показатели вычисляются
+    только при чтении. Отдаются через /metrics (текстовый формат Prometheus)
+    и /api/metrics (снимок JSON)."""
+    
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.families = {}
+        self.values = {}
+    
+    def register(self, name, kind, help_text, buckets=None, collect=None):
+        self.families[name] = {"type": kind, "help": help_text, "buckets": buckets, "collect": collect}
+    
+    def counter(self, name, help_text):
+        self.register(name, "counter", help_text)
+    
+    def histogram(self, name, help_text, buckets=METRIC_DURATION_BUCKETS):
+        self.register(name, "histogram", help_text, buckets=buckets)
+    
+    def gauge(self, name, help_text, collect):
+        """collect() возвращает список пар (метки, значение) на момент чтения."""
+        self.register(name, "gauge", help_text, collect=collect)
+    
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted((k, str(v)) for k, v in labels.items())))
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + value
+    
+    def observe(self, name, value, **labels):
+        """Значение в гистограмму: счётчики по корзинам (последняя - +Inf) и сумма."""
+        key = (name, tuple(sorted((k, str(v)) for k, v in labels.items())))
+        buckets = self.families[name]["buckets"]
+        with self.lock:
+            histogram = self.values.get(key)
+            if histogram is None:
+                histogram = self.values[key] = [0] * (len(buckets) + 1) + [0.0]
+            histogram[bisect.bisect_left(buckets, value)] += 1
+            histogram[-1] += value
+    
+    def snapshot(self):
+        """Все метрики: {имя: {"type", "help", "samples"}}; у гистограмм накопленные корзины, count и sum."""
+        with self.lock:
+            values = sorted((key, list(value) if isinstance(value, list) else value) for key, value in self.values.items())
+        result = {name: {"type": family["type"], "help": family["help"], "samples": []} for name, family in self.families.items()}
+        for name, family in self.families.items():
+            if family["collect"] is not None:
+                result[name]["samples"] = [{"labels": labels, "value": value} for labels, value in family["collect"]()]
+        for (name, labels), value in values:
+            family = self.families[name]
+            if family["type"] == "histogram":
+                cumulative = list(itertools.accumulate(value[:-1]))
+                bounds = [f"{bound:g}" for bound in family["buckets"]] + ["+Inf"]
+                sample = {"labels": dict(labels), "count": cumulative[-1], "sum": round(value[-1], 3), "buckets": dict(zip(bounds, cumulative))}
             else:
-                logger.error(f"Ошибка обновления сервера, код возврата: {return_code}")
-                log_queue.put(f"Ошибка обновления сервера, код возврата: {return_code}")
-                root.after(0, lambda: messagebox.showerror("Ошибка", f"Ошибка обновления, код возврата: {return_code}"))
-        except Exception as e:
-            logger.error(f"Ошибка при обновлении сервера: {e}")
-            log_queue.put(f"Ошибка при обновлении сервера: {e}")
-            root.after(0, lambda: messagebox.showerror("Ошибка", f"Ошибка при обновлении: {e}"))
-        root.after(0, update_splash.destroy)
+                sample = {"labels": dict(labels), "value": value}
+            result[name]["samples"].append(sample)
+        return result
     
-    threading.Thread(target=run_update, daemon=True).start()
+    def render_prometheus(self):
+        """Снимок в текстовом формате Prometheus 0.0.4."""
+        lines = []
+        for name, family in self.snapshot().items():
+            help_text = family["help"].replace("\\", "\\\\").replace("\n", "\\n")
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {family['type']}")
+            for sample in family["samples"]:
+                labels = sample["labels"]
+                if family["type"] == "histogram":
+                    for bound, count in sample["buckets"].items():
+                        lines.append(f"{name}_bucket{prometheus_labels({**labels, 'le': bound})} {count}")
+                    lines.append(f"{name}_sum{prometheus_labels(labels)} {sample['sum']}")
+                    lines.append(f"{name}_count{prometheus_labels(labels)} {sample['count']}")
+                else:
+                    lines.append(f"{name}{prometheus_labels(labels)} {sample['value']}")
+        return "\n".join(lines) + "\n"
+
+metrics = Metrics()
+metrics.gauge("scum_manager_uptime_seconds", "Время работы утилиты", lambda: [({}, time.perf_counter() - STARTUP_STARTED)])
+metrics.gauge("scum_server_up", "Процесс сервера запущен (1) или нет (0)", lambda: [({"instance": instance.name}, int(instance.process is not None)) for instance in list(instances)])
+metrics.gauge("scum_server_uptime_seconds", "Время работы процесса сервера с момента запуска", lambda: [({"instance": instance.name}, time.time() - instance.start_time) for instance in list(instances) if instance.process is not None])
+metrics.gauge("scum_log_queue_depth", "Строк в буфере log_queue, ещё не переданных в журнал API", lambda: [({}, log_queue.qsize())])
+metrics.register("scum_log_lines_dropped_total", "counter", "Строк, отброшенных политикой переполнения буфера лога", collect=lambda: [({"policy": log_queue.policy}, log_queue.dropped_total)])
+metrics.register("scum_log_lines_summarised_total", "counter", "Строк, свёрнутых политикой summarise", collect=lambda: [({}, log_queue.summarised_total)])
+metrics.gauge("scum_save_changed_bytes", "Изменено байт сохранений с последнего бэкапа", lambda: [({}, save_watcher.changed_bytes())])
+metrics.register("scum_save_checkpoints_total", "counter", "Контрольных точек WAL базы SCUM.db", collect=lambda: [({}, save_watcher.checkpoints)])
+metrics.gauge("scum_db_size_bytes", "Размер SCUM.db по последнему замеру", lambda: [({}, sample["db_bytes"]) for sample in [db_health.latest()] if sample])
+metrics.gauge("scum_db_wal_bytes", "Размер SCUM.db-wal по последнему замеру", lambda: [({}, sample["wal_bytes"]) for sample in [db_health.latest()] if sample])
+metrics.gauge("scum_db_free_ratio", "Доля свободных страниц SCUM.db", lambda: [({}, sample["free_ratio"]) for sample in [db_health.latest()] if sample])
+metrics.gauge("scum_db_table_rows", "Строк в крупнейших таблицах SCUM.db", lambda: [({"table": table}, rows) for sample in [db_health.latest()] if sample for table, rows in sample["tables"].items()])
+metrics.counter("scum_restarts_total", "Рестарты сервера по причине: scheduled, manual, crash, watchdog, memory")
+metrics.counter("scum_server_crashes_total", "Неожиданные завершения сервера по коду возврата")
+metrics.counter("scum_log_lines_total", "Строк вывода сервера")
+metrics.counter("scum_backup_bytes_total", "Байт обработано успешными бэкапами")
+metrics.histogram("scum_backup_duration_seconds", "Длительность бэкапов по виду и результату")
+metrics.histogram("scum_update_duration_seconds", "Длительность обновлений сервера по результату")
+metrics.histogram("scum_restart_downtime_seconds", "Простой для игроков при рестарте через конвейер")
 
-def read_output(process, log_widget):
-    """Чтение вывода процесса и добавление в текстовое поле."""
+def pump_log_queue():
+    """Перенос строк из log_queue в хвост журнала, который раздаёт API, пачками."""
     while True:
-        try:
-            line = process.stdout.readline()
-            if not line and process.poll() is not None:
-                break
-            if line:
-                log_queue.put(line.strip())
-        except Exception as e:
-            log_queue.put(f"Ошибка чтения вывода: {e}")
+        log_tail.extend(log_queue.get_batch())
+
+def find_instance(name):
+    """Инстанс по имени из запроса API; без имени - основной."""
+    if not name:
+        return primary_instance
+    for instance in instances:
+        if instance.name == name:
+            return instance
+    raise LookupError(f"Инстанс {name} не найден")
+
+def instance_status(instance):
+    process = instance.process
+    return {
+        "name": instance.name,
+        "running": instance.running,
+        "pid": process.pid if process is not None else None,
+        "uptime": time.time() - instance.start_time if process is not None else None,
+        "busy": instance.job is not None or instance.pre_job is not None,
+        "started_at": instance.start_time if process is not None else None,
+        "next_restart": instance.next_restart.timestamp() if instance.next_restart is not None else None,
+    }
+
+def api_status(query, body):
+    deadline = primary_instance.next_restart
+    return 200, {
+        "server_running": primary_instance.running,
+        "restart_in": (deadline - datetime.now()).total_seconds() if deadline else None,
+        "update_mode": update_mode,
+        "instances": [instance_status(instance) for instance in instances],
+        "last_restart": pipeline_reports[-1] if pipeline_reports else None,
+        "backup_jobs": {job.id: job.status() for job in list(backup_jobs)},
+    }
+
+def api_start(query, body):
+    instance = find_instance(body.get("instance"))
+    logger.info(f"{instance.label}Запрос запуска сервера через API")
+    instance.running = True
+    wake_supervisor()
+    return 200, instance_status(instance)
+
+def api_stop(query, body):
+    instance = find_instance(body.get("instance"))
+    logger.info(f"{instance.label}Запрос остановки сервера через API")
+    instance.running = False
+    wake_supervisor()
+    return 200, instance_status(instance)
+
+def api_restart(query, body):
+    instance = find_instance(body.get("instance"))
+    if not instance.running:
+        raise RuntimeError("Сервер не запущен")
+    logger.info(f"{instance.label}Запрос немедленного рестарта через API")
+    instance.request_restart(body.get("reason") or "ручной рестарт")
+    return 200, instance_status(instance)
+
+def api_backup(query, body):
+    online = bool(body.get("online"))
+    if not online and primary_instance.running:
+        raise RuntimeError("Сначала остановите сервер")
+    job = submit_backup_job("online" if online else "offline", perform_online_backup if online else perform_backup, exclusive=True)
+    if body.get("wait"):
+        job.future.result()
+        return 200, {"path": job.result, "job": job.status()}
+    return 202, {"job": job.status()}
+
+def api_backup_jobs(query, body):
+    with backup_jobs_lock:
+        return 200, {"jobs": [job.status() for job in backup_jobs]}
+
+def api_backup_cancel(query, body):
+    job = find_backup_job(body.get("id"))
+    logger.info(f"Запрос отмены бэкапа {job.id} через API")
+    job.cancel()
+    return 200, job.status()
+
+def api_restore(query, body):
+    if not body.get("id"):
+        raise ValueError("Не указан бэкап (id)")
+    return 200, restore_backup(body["id"], find_instance(body.get("instance")))
+
+def api_update(query, body):
+    return 200, {"message": perform_update(bool(body.get("force")))}
+
+def api_rollback(query, body):
+    if primary_instance.running:
+        raise RuntimeError("Сначала остановите сервер")
+    return 200, {"files": rollback_update()}
+
+def api_logs(query, body):
+    since = int(query.get("since", ["-1"])[0])
+    wait = min(float(query.get("wait", ["0"])[0]), API_LOG_WAIT_MAX)
+    lines, next_seq, skipped = log_tail.read(since, wait)
+    return 200, {"lines": lines, "next": next_seq, "skipped": skipped}
+
+def api_events(query, body):
+    since = int(query.get("since", ["-1"])[0])
+    wait = min(float(query.get("wait", ["0"])[0]), API_LOG_WAIT_MAX)
+    topics = set(query["topics"][0].split(",")) if "topics" in query else None
+    events, next_seq, skipped = event_bus.read(since, wait, topics)
+    return 200, {"events": events, "next": next_seq, "skipped": skipped}
+
+def api_events_search(query, body):
+    end = float(query.get("end", [time.time()])[0])
+    start = float(query.get("start", [end - 24 * 3600])[0])
+    types = query["types"][0].split(",") if "types" in query else None
+    unknown = set(types or ()) - set(EVENT_TYPES)
+    if unknown:
+        raise ValueError(f"неизвестные типы событий {', '.join(sorted(unknown))}")
+    limit = int(query.get("limit", ["500"])[0])
+    started = time.perf_counter()
+    total = event_store.count(start, end, types)
+    events = event_store.query(start, end, types, limit=limit)
+    return 200, {"total": total, "events": events, "ms": round((time.perf_counter() - started) * 1000, 1)}
+
+def api_telemetry(query, body):
+    rows = telemetry.ring.rows()
+    if "limit" in query:
+        rows = rows[-max(int(query["limit"][0]), 1):]
+    return 200, {"interval": telemetry_interval, "rows": rows}
+
+def api_backups(query, body):
+    """Каталог бэкапов инстанса без индексов блоков; при неизменной версии entries = None."""
+    catalog = get_backup_catalog(find_instance(query.get("instance", [""])[0]).backup_dir)
+    version = f"{os.getpid()}:{catalog.root_dir}:{catalog.version}"
+    if query.get("version", [""])[0] == version:
+        return 200, {"version": version, "entries": None}
+    fields = ("id", "created", "kind", "size", "data_size", "build_id", "source", "verified")
+    return 200, {"version": version, "entries": [{field: entry.get(field) for field in fields} for entry in catalog.list()]}
+
+def api_db(query, body):
+    return 200, db_health.status()
+
+def api_db_inspect(query, body):
+    import sqlite3
+    try:
+        return 200, db_health.inspect()
+    except sqlite3.DatabaseError as e:
+        raise RuntimeError(f"Ошибка замера базы: {e}") from e
+
+def api_saves(query, body):
+    return 200, save_watcher.status()
+
+def api_metrics(query, body):
+    return 200, metrics.snapshot()
+
+def prometheus_metrics(query, body):
+    return 200, metrics.render_prometheus()
+
+def api_reload_settings(query, body):
+    read_settings()
+    wake_supervisor()
+    return 200, {"reloaded": True}
+
+def api_shutdown(query, body):
+    logger.info("Запрос завершения работы через API")
+    request_shutdown()
+    return 200, {"shutdown": True}
+
+API_ROUTES = {
+    ("GET", "/api/status"): api_status,
+    ("GET", "/api/logs"): api_logs,
+    ("GET", "/api/events"): api_events,
+    ("GET", "/api/events/search"): api_events_search,
+    ("GET", "/api/telemetry"): api_telemetry,
+    ("GET", "/api/backups"): api_backups,
+    ("GET", "/api/metrics"): api_metrics,
+    ("GET", "/api/saves"): api_saves,
+    ("GET", "/api/db"): api_db,
+    ("POST", "/api/db/inspect"): api_db_inspect,
+    ("GET", "/metrics"): prometheus_metrics,
+    ("POST", "/api/start"): api_start,
+    ("POST", "/api/stop"): api_stop,
+    ("POST", "/api/restart"): api_restart,
+    ("POST", "/api/backup"): api_backup,
+    ("GET", "/api/backup/jobs"): api_backup_jobs,
+    ("POST", "/api/backup/cancel"): api_backup_cancel,
+    ("POST", "/api/restore"): api_restore,
+    ("POST", "/api/update"): api_update,
+    ("POST", "/api/rollback"): api_rollback,
+    ("POST", "/api/settings/reload"): api_reload_settings,
+    ("POST", "/api/shutdown"): api_shutdown,
+}
+
+def api_local_host(host):
+    """Host или Origin указывает на 127.0.0.1 или localhost (защита от DNS rebinding)."""
+    if not host:
+        return False
+    hostname = urllib.parse.urlsplit(f"//{host}").hostname
+    return hostname in ("127.0.0.1", "localhost")
+
+def make_control_api_handler():
+    """Класс обработчика API; http.server импортируется только при запуске API."""
+    from http.server import BaseHTTPRequestHandler
+    
+    class ControlApiHandler(BaseHTTPRequestHandler):
+        """Обработчик локального JSON API: маршруты из API_ROUTES, ответы JSON (кроме текста /metrics)."""
+    
+        def do_GET(self):
+            self.dispatch("GET")
+    
+        def do_POST(self):
+            self.dispatch("POST")
+    
+        def dispatch(self, method):
+            url = urllib.parse.urlsplit(self.path)
+            route = API_ROUTES.get((method, url.path))
+            origin = self.headers.get("Origin")
+            if not api_local_host(self.headers.get("Host")) or (origin is not None and not api_local_host(urllib.parse.urlsplit(origin).netloc)):
+                self.send_json(403, {"error": "Запросы принимаются только с 127.0.0.1 и localhost"})
+                return
+            if not hmac.compare_digest(self.request_token().encode("utf-8"), api_token.encode("utf-8")):
+                self.send_json(401, {"error": "Неверный токен API"})
+                return
+            if method == "POST" and self.headers.get_content_type() != "application/json":
+                self.send_json(415, {"error": "Тело запроса должно быть application/json"})
+                return
+            if route is None:
+                self.send_json(404, {"error": f"Неизвестный запрос {method} {url.path}"})
+                return
+            try:
+                length = int(self.headers.get("Content-Length") or 0)
+                body = json.loads(self.rfile.read(length) or b"{}") if length else {}
+                status, payload = route(urllib.parse.parse_qs(url.query), body)
+            except LookupError as e:
+                status, payload = 404, {"error": str(e)}
+            except (ValueError, TypeError) as e:
+                status, payload = 400, {"error": f"Неверный запрос: {e}"}
+            except (RuntimeError, OSError) as e:
+                status, payload = 409, {"error": str(e)}
+            except Exception as e:
+                logger.error(f"Ошибка обработки {method} {url.path}: {e}")
+                status, payload = 500, {"error": str(e)}
+            if isinstance(payload, str):
+                self.send_data(status, payload.encode("utf-8"), "text/plain; version=0.0.4; charset=utf-8")
+            else:
+                self.send_json(status, payload)
+    
+        def request_token(self):
+            """Токен из X-Api-Token или Authorization: Bearer (так его передаёт Prometheus)."""
+            authorization = self.headers.get("Authorization", "")
+            if authorization.lower().startswith("bearer "):
+                return authorization[7:].strip()
+            return self.headers.get("X-Api-Token", "")
+    
+        def send_json(self, status, payload):
+            self.send_data(status, json.dumps(payload, ensure_ascii=False, default=str).encode("utf-8"), "application/json; charset=utf-8")
+    
+        def send_data(self, status, data, content_type):
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
     
-    for line in process.stderr:
-        if line:
-            log_queue.put(f"STDERR: {line.strip()}")
+        def log_message(self, format, *args):
+            logger.debug(f"API: {format % args}")
+    
+    return ControlApiHandler
 
-def update_log_widget(log_widget, root):
-    """Обновление текстового поля логами из очереди."""
+def start_control_api():
+    """Запуск JSON API на 127.0.0.1; если порт занят, берётся свободный."""
+    from http.server import ThreadingHTTPServer
+    handler = make_control_api_handler()
     try:
-        while True:
-            line = log_queue.get_nowait()
-            log_widget.insert(tk.END, line + "\n")
-            log_widget.see(tk.END)
-    except queue.Empty:
-        pass
-    root.after(100, update_log_widget, log_widget, root)
+        server = ThreadingHTTPServer((API_HOST, api_port), handler)
+    except OSError as e:
+        logger.warning(f"Порт API {api_port} недоступен ({e}), используется свободный порт")
+        server = ThreadingHTTPServer((API_HOST, 0), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="control-api", daemon=True).start()
+    logger.info(f"API управления: http://{API_HOST}:{server.server_address[1]}/api/status")
+    return server
 
-def run_server(log_widget, notebook):
-    """Запуск сервера и контроль его работы."""
-    global shutdown_flag, restart_now, current_process, start_time, server_running
-    if auto_start:
-        server_running = True
+def start_daemon():
+    """Запуск супервизора, фонового обслуживания и API; настройки уже должны быть загружены."""
+    supervisor_thread = threading.Thread(target=run_server, args=(None,), name="supervisor", daemon=True)
+    supervisor_thread.start()
+    threading.Thread(target=catalog_maintenance, daemon=True).start()
+    threading.Thread(target=pump_log_queue, name="log-tail", daemon=True).start()
+    threading.Thread(target=save_watcher.run, name="save-watcher", daemon=True).start()
+    threading.Thread(target=db_health.run, name="db-health", daemon=True).start()
+    event_store.start()
+    return supervisor_thread, start_control_api()
+
+def run_daemon():
+    """Режим без окна: работа до SIGINT/SIGTERM или POST /api/shutdown."""
+    logger.info(f"Запуск в режиме демона, текущая директория: {os.getcwd()}")
+    read_settings()
+    startup_timer.mark("настройки")
+    signal.signal(signal.SIGINT, signal_handler)
+    signal.signal(signal.SIGTERM, signal_handler)
+    supervisor_thread, server = start_daemon()
+    startup_timer.mark("демон")
+    startup_timer.report()
+    while supervisor_thread.is_alive():
+        supervisor_thread.join(1)
+    server.shutdown()
+    logger.info("Демон завершен")
+
+class ApiError(Exception):
+    """Ошибка, которую вернул API (текст из поля error)."""
+
+class ApiClient:
+    """Клиент локального JSON API; через него окно управляет демоном."""
     
-    while not shutdown_flag:
-        if not server_running:
-            notebook.tab(1, state="normal")
-            notebook.tab(2, state="normal")
-            time.sleep(1)
+    def __init__(self, port, token=""):
+        import urllib.request
+        self.base_url = f"http://{API_HOST}:{port}"
+        self.token = token
+        # Прокси из окружения к 127.0.0.1 не применяются
+        self.opener = urllib.request.build_opener(urllib.request.ProxyHandler({}))
+    
+    def call(self, method, path, body=None, timeout=10):
+        import urllib.request
+        import urllib.error
+        data = json.dumps(body or {}).encode("utf-8") if method == "POST" else None
+        request = urllib.request.Request(self.base_url + path, data=data, method=method)
+        request.add_header("Content-Type", "application/json")
+        if self.token:
+            request.add_header("X-Api-Token", self.token)
+        try:
+            with self.opener.open(request, timeout=timeout) as response:
+                return json.loads(response.read())
+        except urllib.error.HTTPError as e:
+            try:
+                message = json.loads(e.read()).get("error", str(e))
+            except ValueError:
+                message = str(e)
+            raise ApiError(message) from e
+
+def api_request(method, path, body=None, on_done=None, on_error=None, timeout=10):
+    """Запрос к API в фоновом потоке, чтобы окно не блокировалось; колбэки выполняет pump_gui_events в потоке Tk."""
+    def run():
+        try:
+            result = api_client.call(method, path, body, timeout)
+        except (ApiError, OSError, ValueError) as e:
+            logger.error(f"Ошибка запроса {method} {path}: {e}")
+            if on_error is not None:
+                gui_events.put(("call", (on_error, str(e))))
+            return
+        if on_done is not None:
+            gui_events.put(("call", (on_done, result)))
+    threading.Thread(target=run, daemon=True).start()
+
+def watch_events():
+    """Подписка окна на шину демона: снимок состояния, затем long-poll событий в gui_events.
+    
+    Номер события берётся до снимка, поэтому изменения между ними не теряются; при
+    пропуске событий или обрыве связи снимок запрашивается заново."""
+    since = None
+    while not shutdown_event.is_set():
+        try:
+            if since is None:
+                since = api_client.call("GET", "/api/events?since=-1")["next"]
+                gui_events.put(("snapshot", api_client.call("GET", "/api/status")))
+            result = api_client.call("GET", f"/api/events?since={since}&wait={API_LOG_WAIT_MAX}", timeout=API_LOG_WAIT_MAX + 10)
+        except (ApiError, OSError, ValueError) as e:
+            gui_events.put(("error", str(e)))
+            since = None
+            shutdown_event.wait(1)
             continue
-        else:
-            notebook.tab(1, state="disabled")
-            notebook.tab(2, state="disabled")
-        
-        logger.info(f"Попытка запуска {SERVER_EXECUTABLE} с аргументами: {' '.join(server_args)}")
-        start_time = time.time()
-        
+        if result["skipped"]:
+            since = None
+            continue
+        for event in result["events"]:
+            gui_events.put(("event", event))
+        since = result["next"]
+
+def tail_logs():
+    """Long-poll хвоста журнала демона в очередь консоли окна."""
+    since = 0
+    while not shutdown_event.is_set():
         try:
-            if not os.path.isfile(SERVER_EXECUTABLE):
-                logger.error(f"Файл {SERVER_EXECUTABLE} не найден в текущей директории: {os.getcwd()}")
-                shutdown_flag = True
-                break
-            if not os.access(SERVER_EXECUTABLE, os.X_OK):
-                logger.error(f"Нет прав на запуск {SERVER_EXECUTABLE}")
-                shutdown_flag = True
+            result = api_client.call("GET", f"/api/logs?since={since}&wait={API_LOG_WAIT_MAX}", timeout=API_LOG_WAIT_MAX + 10)
+        except (ApiError, OSError, ValueError):
+            shutdown_event.wait(1)
+            continue
+        lines = result["lines"]
+        if result["skipped"]:
+            lines.insert(0, f"... пропущено строк: {result['skipped']}")
+        if lines:
+            gui_log_queue.put(lines)
+        since = result["next"]
+
+def apply_gui_event(event):
+    """Изменение снимка состояния окна gui_status по событию шины."""
+    topic = event["topic"]
+    if topic == "instance":
+        status = {key: value for key, value in event.items() if key not in ("topic", "time")}
+        shown = gui_status.setdefault("instances", [])
+        for index, item in enumerate(shown):
+            if item["name"] == status["name"]:
+                shown[index] = status
                 break
-            
-            current_process = subprocess.Popen(
-                [SERVER_EXECUTABLE] + server_args,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                text=True,
-                errors='replace',
-                creationflags=0x08000000
-            )
-            logger.info(f"Сервер запущен с PID: {current_process.pid}")
-            
-            output_thread = threading.Thread(target=read_output, args=(current_process, log_widget), daemon=True)
-            output_thread.start()
-            
-            while server_running and not shutdown_flag:
-                current_time = datetime.now().time()
-                if restart_now or any(current_time.hour == rt.hour and current_time.minute == rt.minute for rt in restart_times):
-                    reason = "рестарт по времени" if not restart_now else "ручной рестарт"
-                    logger.info(f"Остановка сервера по запросу ({reason})...")
-                    current_process.terminate()
-                    try:
-                        current_process.wait(timeout=10)
-                        logger.info("Сервер остановлен")
-                    except subprocess.TimeoutExpired:
-                        logger.warning("Процесс не завершился вовремя, принудительное завершение...")
-                        current_process.kill()
-                    restart_now = False
-                    break
-                
-                if current_process.poll() is not None:
-                    return_code = current_process.returncode
-                    logger.error(f"Сервер неожиданно завершил работу. Код возврата: {return_code}")
-                    break
-                
-                time.sleep(1)
-                
-        except subprocess.SubprocessError as e:
-            logger.error(f"Ошибка при запуске сервера: {e}")
-            shutdown_flag = True
-            break
-        
-        current_process = None
-        if server_running and not shutdown_flag:
-            logger.info("Перезапуск сервера через 5 секунд...")
-            time.sleep(5)
-
-def update_timer(root, label, status_label, notebook):
-    """Обновление таймера и статуса."""
-    if shutdown_flag:
+        else:
+            shown.append(status)
+        if status["name"] == primary_instance.name:
+            gui_status["server_running"] = status["running"]
+    elif topic == "instance_removed":
+        gui_status["instances"] = [item for item in gui_status.get("instances", []) if item["name"] != event["name"]]
+    elif topic == "settings":
+        gui_status["update_mode"] = event["update_mode"]
+    elif topic == "restart":
+        gui_status["last_restart"] = event
+    elif topic == "backup":
+        gui_status.setdefault("backup_jobs", {})[event["id"]] = event
+
+def pump_gui_events(root, log_console, timer_label, status_label, notebook, instance_listbox, rendered_second):
+    """Единственный периодический цикл окна в потоке Tk.
+    
+    Пачкой применяет события и результаты запросов, накопленные фоновыми потоками,
+    переносит логи в консоль и перерисовывает статус только при изменениях и раз в
+    секунду для таймера. Фоновые потоки виджеты не трогают."""
+    global gui_status
+    if shutdown_event.is_set():
         root.quit()
         return
     
-    current_time = datetime.now().time()
-    next_restart = None
-    for rt in restart_times:
-        if current_time <= rt:
-            next_restart = rt
-            break
-    if not next_restart:
-        next_restart = restart_times[0]
-    
-    delta = (datetime.combine(datetime.today(), next_restart) - datetime.combine(datetime.today(), current_time)).total_seconds()
-    if delta < 0:
-        delta += 24 * 3600
-    label.config(text=f"До рестарта: {format_time(delta)}")
+    changed = False
+    catalog_changed = False
+    try:
+        while True:
+            kind, payload = gui_events.get_nowait()
+            if kind == "call":
+                func, arg = payload
+                func(arg)
+                continue
+            if kind == "snapshot":
+                gui_status = payload
+                catalog_changed = True
+            elif kind == "error":
+                gui_status = {"error": payload}
+            elif payload["topic"] == "catalog":
+                catalog_changed = True
+                continue
+            else:
+                apply_gui_event(payload)
+            changed = True
+    except queue.Empty:
+        pass
+    try:
+        while True:
+            for line in gui_log_queue.get_nowait():
+                log_console.push(line)
+    except queue.Empty:
+        pass
+    log_console.flush()
     
-    status_label.config(text=f"Статус: {'Запущен' if server_running else 'Остановлен'}")
-    notebook.tab(1, state="disabled" if server_running else "normal")
-    notebook.tab(2, state="disabled" if server_running else "normal")
-    root.after(1000, update_timer, root, label, status_label, notebook)
+    second = int(time.time())
+    if catalog_changed and gui_backup_listbox is not None:
+        refresh_backup_list(gui_backup_listbox)
+    if changed:
+        render_backup_progress()
+    if changed or second != rendered_second:
+        render_status(timer_label, status_label, notebook)
+        render_instance_list(instance_listbox)
+        rendered_second = second
+    root.after(GUI_PUMP_INTERVAL, pump_gui_events, root, log_console, timer_label, status_label, notebook, instance_listbox, rendered_second)
+
+def render_status(timer_label, status_label, notebook):
+    """Таймер, статус и доступность вкладки обновления по снимку gui_status."""
+    status = gui_status
+    if "error" in status:
+        timer_label.config(text="До рестарта: --:--:--")
+        status_label.config(text=f"Статус: нет связи с демоном ({status['error']})")
+    elif status:
+        running = status["server_running"]
+        primary = next((item for item in status["instances"] if item["name"] == primary_instance.name), {})
+        next_restart = primary.get("next_restart")
+        timer_label.config(text=f"До рестарта: {format_time(max(next_restart - time.time(), 0)) if next_restart else '--:--:--'}")
+        status_label.config(text=f"Статус: {'Запущен' if running else 'Остановлен'}")
+        notebook.tab(2, state="disabled" if running and status["update_mode"] != "staged" else "normal")
 
 def format_time(seconds):
     """Форматирование времени в ЧЧ:ММ:СС."""
@@ -466,51 +4608,38 @@ def format_time(seconds):
 
 def trigger_start():
     """Обработчик нажатия кнопки старта."""
-    global server_running
-    if not server_running:
-        logger.info("Запрос запуска сервера через GUI")
-        server_running = True
+    logger.info("Запрос запуска сервера через GUI")
+    api_request("POST", "/api/start")
+
+def request_restart(reason, kind="manual"):
+    """Запрос немедленного рестарта с указанием причины."""
+    primary_instance.request_restart(reason, kind)
 
 def trigger_restart():
     """Обработчик нажатия кнопки рестарта."""
-    global restart_now
-    if server_running:
+    if gui_status.get("server_running"):
         logger.info("Запрос немедленного рестарта через GUI")
-        restart_now = True
+        api_request("POST", "/api/restart")
 
 def trigger_stop():
     """Обработчик нажатия кнопки остановки."""
-    global server_running
     logger.info("Запрос остановки сервера через GUI")
-    server_running = False
-    if current_process:
-        try:
-            current_process.terminate()
-            current_process.wait(timeout=10)
-            logger.info("Сервер остановлен")
-        except subprocess.TimeoutExpired:
-            logger.warning("Процесс не завершился вовремя, принудительное завершение...")
-            current_process.kill()
-
-def save_restart_times(time1_entry, time2_entry, saved_times_label):
-    """Сохранение времени рестарта."""
-    global restart_times
-    time1_str = time1_entry.get()
-    time2_str = time2_entry.get()
-    
-    if not (validate_time_input(time1_str) and validate_time_input(time2_str)):
-        messagebox.showerror("Ошибка", "Введите время в формате ЧЧ:ММ (например, 12:35)")
-        return
-    
+    api_request("POST", "/api/stop")
+
+def save_restart_schedule(schedule_entry, saved_times_label):
+    """Сохранение расписания рестартов."""
+    global restart_schedule
+    specs = [spec.strip() for spec in schedule_entry.get().split(SCHEDULE_SEPARATOR) if spec.strip()]
     try:
-        h1, m1 = map(int, time1_str.split(":"))
-        h2, m2 = map(int, time2_str.split(":"))
-        restart_times = [dt_time(h1, m1), dt_time(h2, m2)]
-        saved_times_label.config(text=f"Время рестарта: {time1_str}, {time2_str}")
-        logger.info(f"Установлено время рестарта: {time1_str}, {time2_str}")
-        save_settings()
-    except Exception as e:
-        messagebox.showerror("Ошибка", f"Неверный формат времени: {e}")
+        entries = [parse_schedule_entry(spec) for spec in specs]
+    except ValueError as e:
+        messagebox.showerror("Ошибка", f"Неверное расписание: {e}\nФорматы: ЧЧ:ММ, пн,чт ЧЧ:ММ, пн-пт ЧЧ:ММ, ГГГГ-ММ-ДД ЧЧ:ММ")
+        return
+    restart_schedule = [entry.spec for entry in entries]
+    wake_supervisor()
+    saved_times_label.config(text=f"Расписание рестартов: {', '.join(restart_schedule) or 'нет'}")
+    logger.info(f"Установлено расписание рестартов: {', '.join(restart_schedule) or 'нет'}")
+    save_settings()
 
 def save_args(args_entry, saved_args_label):
     """Сохранение аргументов запуска."""
@@ -549,6 +4678,276 @@ def save_paths(save_dir_entry, backup_dir_entry, steamcmd_exe_entry, steamcmd_di
     logger.info(f"Установлены пути: SteamCMD={steamcmd_executable}, Сервер={steamcmd_install_dir}, Сохранения={save_dir}, Бэкапы={backup_dir}")
     save_settings()
 
+def set_backup_mode(var):
+    """Обработчик выбора режима бэкапа."""
+    global backup_mode
+    labels = {label: mode for mode, label in BACKUP_MODES.items()}
+    backup_mode = labels.get(var.get(), DEFAULT_BACKUP_MODE)
+    logger.info(f"Режим бэкапа: {BACKUP_MODES[backup_mode]}")
+    save_settings()
+
+def set_backup_compression(compression_var, level_var):
+    """Обработчик выбора алгоритма и уровня сжатия архива."""
+    global backup_compression, backup_compression_level
+    labels = {label: name for name, label in BACKUP_COMPRESSIONS.items()}
+    backup_compression = labels.get(compression_var.get(), DEFAULT_BACKUP_COMPRESSION)
+    try:
+        backup_compression_level = min(max(int(level_var.get()), 1), 9)
+    except ValueError:
+        backup_compression_level = DEFAULT_BACKUP_COMPRESSION_LEVEL
+    level_var.set(str(backup_compression_level))
+    logger.info(f"Сжатие бэкапа: {BACKUP_COMPRESSIONS[backup_compression]}, уровень {backup_compression_level}")
+    save_settings()
+
+def set_update_mode(var):
+    """Обработчик выбора режима обновления."""
+    global update_mode
+    labels = {label: mode for mode, label in UPDATE_MODES.items()}
+    update_mode = labels.get(var.get(), DEFAULT_UPDATE_MODE)
+    logger.info(f"Режим обновления: {UPDATE_MODES[update_mode]}")
+    save_settings()
+
+def rollback_server_update(root):
+    """Откат последнего обновления по кнопке; только при остановленном сервере."""
+    api_request("POST", "/api/rollback",
+                on_done=lambda result: messagebox.showinfo("Успех", f"Откат выполнен, возвращено файлов: {result['files']}"),
+                on_error=lambda message: messagebox.showerror("Ошибка", f"Ошибка отката обновления: {message}"))
+
+def create_backup_progress(root, job_id):
+    """Окно прогресса фонового бэкапа с кнопкой отмены; обновляется render_backup_progress."""
+    window = tk.Toplevel(root)
+    window.title("Бэкап")
+    window.geometry("420x140+500+300")
+    window.resizable(False, False)
+    label = ttk.Label(window, text="Бэкап в очереди...", wraplength=380)
+    label.pack(pady=10)
+    bar = ttk.Progressbar(window, length=380, maximum=100)
+    bar.pack(pady=5)
+    cancel = lambda: api_request("POST", "/api/backup/cancel", {"id": job_id})
+    ttk.Button(window, text="Отмена", command=cancel).pack(pady=5)
+    window.protocol("WM_DELETE_WINDOW", cancel)
+    backup_progress[job_id] = (window, label, bar)
+    render_backup_progress()
+
+def render_backup_progress():
+    """Обновление окон прогресса бэкапа по событиям; по завершении окно закрывается с итогом."""
+    for job_id, (window, label, bar) in list(backup_progress.items()):
+        status = gui_status.get("backup_jobs", {}).get(job_id)
+        if status is None:
+            continue
+        if status["state"] in ("done", "failed", "cancelled"):
+            del backup_progress[job_id]
+            window.destroy()
+            if status["state"] == "done":
+                messagebox.showinfo("Успех", f"Бэкап создан: {status['result']} ({status['mb_per_s']} МБ/с)")
+            elif status["state"] == "failed":
+                messagebox.showerror("Ошибка", f"Ошибка при создании бэкапа: {status['error']}")
+            continue
+        if status["state"] == "running" and status["bytes_total"]:
+            bar.config(value=status["bytes_done"] * 100 / status["bytes_total"])
+            eta = format_time(status["eta"]) if status["eta"] is not None else "--:--:--"
+            label.config(text=f"{status['bytes_done'] / 1048576:.0f} из {status['bytes_total'] / 1048576:.0f} МБ, {status['mb_per_s']} МБ/с, осталось {eta}")
+
+def backup_server(root, log_widget):
+    """Бэкап файлов сохранений в фоне демона с окном прогресса и отменой."""
+    api_request("POST", "/api/backup", on_done=lambda result: create_backup_progress(root, result["job"]["id"]),
+                on_error=lambda message: messagebox.showerror("Ошибка", f"Ошибка при создании бэкапа: {message}"))
+
+def online_backup_server(root, log_widget):
+    """Бэкап SCUM.db без остановки сервера в фоне демона с окном прогресса."""
+    api_request("POST", "/api/backup", {"online": True}, on_done=lambda result: create_backup_progress(root, result["job"]["id"]),
+                on_error=lambda message: messagebox.showerror("Ошибка", f"Ошибка при создании онлайн-бэкапа: {message}"))
+
+def restore_selected_backup(root, listbox):
+    """Восстановление выбранного в списке бэкапа через API после подтверждения."""
+    selection = listbox.curselection()
+    if not selection or selection[0] >= len(gui_backup_ids):
+        messagebox.showerror("Ошибка", "Выберите бэкап в списке")
+        return
+    backup_id = gui_backup_ids[selection[0]]
+    if not messagebox.askyesno("Восстановление", f"Заменить текущие сохранения бэкапом {backup_id}?"):
+        return
+    backup_splash = create_backup_splash(root)
+    
+    def done(result):
+        backup_splash.destroy()
+        messagebox.showinfo("Успех", f"Бэкап {backup_id} восстановлен: {result['bytes'] / 1048576:.1f} МБ за {result['seconds']:.1f} с ({result['mb_per_s']} МБ/с)")
+    
+    def failed(message):
+        backup_splash.destroy()
+        messagebox.showerror("Ошибка", f"Ошибка восстановления: {message}")
+    
+    api_request("POST", "/api/restore", {"id": backup_id}, on_done=done, on_error=failed, timeout=None)
+
+def update_server(root, log_widget, force=False):
+    """Обновление сервера через API с окном ожидания."""
+    update_splash = create_update_splash(root)
+    
+    def done(result):
+        update_splash.destroy()
+        messagebox.showinfo("Успех", result["message"])
+    
+    def failed(message):
+        update_splash.destroy()
+        messagebox.showerror("Ошибка", message)
+    
+    api_request("POST", "/api/update", {"force": force}, on_done=done, on_error=failed, timeout=None)
+
+def toggle_retention(var):
+    """Обработчик чекбокса автоочистки бэкапов."""
+    global retention_enabled
+    retention_enabled = var.get()
+    logger.info(f"Автоочистка бэкапов {'включена' if retention_enabled else 'выключена'}")
+    save_settings()
+    if retention_enabled:
+        catalog_maintenance_event.set()
+
+def format_catalog_entry(entry):
+    """Строка списка бэкапов: время, тип, размер, билд и статус проверки."""
+    status = {True: "проверен", False: "ОШИБКА", None: "не проверен"}[entry.get("verified")]
+    size_mb = (entry.get("size") or 0) / 1048576
+    return f"{entry['created'].replace('T', ' ')}  {entry['kind']:6}  {size_mb:9.1f} МБ  билд {entry.get('build_id') or '?'}  {status}"
+
+def refresh_backup_list(listbox):
+    """Перерисовка списка бэкапов из каталога демона, если он изменился с прошлого показа.
+    
+    Вызывается по событию catalog и после каждого снимка состояния (старт окна,
+    переподключение), а не по таймеру; при ошибке запроса список обновит следующий снимок."""
+    def done(result):
+        global gui_backup_version
+        if result["entries"] is not None:
+            entries = list(reversed(result["entries"]))
+            gui_backup_ids[:] = [entry["id"] for entry in entries]
+            listbox.delete(0, tk.END)
+            for entry in entries:
+                listbox.insert(tk.END, format_catalog_entry(entry))
+        gui_backup_version = result["version"]
+    
+    api_request("GET", f"/api/backups?version={urllib.parse.quote(gui_backup_version)}", on_done=done)
+
+def search_events(type_var, hours_entry, result_listbox, count_label):
+    """Поиск событий сервера за последние N часов."""
+    try:
+        hours = float(hours_entry.get())
+    except ValueError:
+        messagebox.showerror("Ошибка", "Введите период в часах")
+        return
+    labels = {label: name for name, label in EVENT_TYPES.items()}
+    end = time.time()
+    params = {"start": end - hours * 3600, "end": end, "limit": 500}
+    if type_var.get() in labels:
+        params["types"] = labels[type_var.get()]
+    
+    def done(result):
+        result_listbox.delete(0, tk.END)
+        for event in reversed(result["events"]):
+            moment = datetime.fromtimestamp(event["ts"]).strftime("%Y-%m-%d %H:%M:%S")
+            who = f"{event.get('player', '')} {event.get('steam_id', '')}".strip()
+            result_listbox.insert(tk.END, f"{moment}  {EVENT_TYPES[event['type']]:16}  {who}  {event.get('message', event['text'])}")
+        count_label.config(text=f"Найдено: {result['total']} (показано {len(result['events'])}), {result['ms']:.0f} мс")
+    
+    def failed(message):
+        messagebox.showerror("Ошибка", f"Ошибка поиска событий: {message}")
+    
+    api_request("GET", f"/api/events/search?{urllib.parse.urlencode(params)}", on_done=done, on_error=failed)
+
+def draw_telemetry(root, canvas, info_label):
+    """Запрос телеметрии у демона и перерисовка графиков памяти и CPU процесса сервера."""
+    def done(result):
+        render_telemetry(canvas, info_label, result["rows"])
+        root.after(int(max(result["interval"], 1) * 1000), draw_telemetry, root, canvas, info_label)
+    
+    def failed(message):
+        root.after(int(max(telemetry_interval, 1) * 1000), draw_telemetry, root, canvas, info_label)
+    
+    api_request("GET", f"/api/telemetry?limit={max(canvas.winfo_width(), 100)}", on_done=done, on_error=failed)
+
+def render_telemetry(canvas, info_label, rows):
+    """Графики памяти и CPU по точкам телеметрии."""
+    canvas.delete("all")
+    width = max(canvas.winfo_width(), 100)
+    height = max(canvas.winfo_height(), 60)
+    rows = rows[-width:]
+    if rows:
+        last = rows[-1]
+        info_label.config(text=f"CPU: {last['cpu_percent']:.0f}%  Память: {last['rss_mb']:.0f} МБ  Потоки: {last['threads']:.0f}  Дескрипторы: {last['handles']:.0f}  Чтение: {last['read_mb']:.0f} МБ  Запись: {last['write_mb']:.0f} МБ")
+        for field, color in (("rss_mb", "blue"), ("cpu_percent", "red")):
+            values = [row[field] for row in rows]
+            top = max(max(values), 1e-6)
+            step = width / max(len(values) - 1, 1)
+            points = []
+            for i, value in enumerate(values):
+                points += [i * step, height - 5 - value / top * (height - 20)]
+            if len(points) >= 4:
+                canvas.create_line(*points, fill=color)
+            canvas.create_text(5, 10 if color == "blue" else 24, anchor="w", fill=color, text=f"{'Память, МБ' if color == 'blue' else 'CPU, %'} (макс. {top:.0f})")
+
+def export_telemetry():
+    """Сохранение телеметрии в CSV-файл."""
+    path = filedialog.asksaveasfilename(defaultextension=".csv", filetypes=[("CSV", "*.csv")], initialfile="telemetry.csv")
+    if not path:
+        return
+    
+    def done(result):
+        try:
+            write_telemetry_csv(path, result["rows"])
+            logger.info(f"Телеметрия выгружена в {path}")
+        except OSError as e:
+            messagebox.showerror("Ошибка", f"Ошибка выгрузки телеметрии: {e}")
+    
+    def failed(message):
+        messagebox.showerror("Ошибка", f"Ошибка выгрузки телеметрии: {message}")
+    
+    api_request("GET", "/api/telemetry", on_done=done, on_error=failed)
+
+def toggle_watchdog(var):
+    """Обработчик чекбокса сторожа зависаний."""
+    global watchdog_enabled
+    watchdog_enabled = var.get()
+    logger.info(f"Сторож зависаний {'включён' if watchdog_enabled else 'выключен'}")
+    save_settings()
+
+def toggle_pipeline_stage(name, var):
+    """Обработчик чекбоксов этапов конвейера планового рестарта."""
+    global restart_pipeline
+    stages = set(restart_pipeline)
+    if var.get():
+        stages.add(name)
+    else:
+        stages.discard(name)
+    restart_pipeline = [stage for stage in PIPELINE_STAGE_NAMES if stage in stages]
+    logger.info(f"Этапы планового рестарта: {', '.join(restart_pipeline) or 'нет'}")
+    save_settings()
+
+def selected_instance(listbox):
+    """Имя инстанса, выбранного в списке вкладки "Инстансы"."""
+    selection = listbox.curselection()
+    shown = gui_status.get("instances", [])
+    return shown[selection[0]]["name"] if selection and selection[0] < len(shown) else None
+
+def instance_action(listbox, action):
+    """Старт, остановка или рестарт выбранного инстанса."""
+    name = selected_instance(listbox)
+    if name is None:
+        return
+    logger.info(f"Запрос через GUI для инстанса {name}: {action}")
+    api_request("POST", f"/api/{action}", {"instance": name})
+
+def render_instance_list(listbox):
+    """Список инстансов по снимку gui_status с сохранением выделения."""
+    selection = listbox.curselection()
+    listbox.delete(0, tk.END)
+    for instance in gui_status.get("instances", []):
+        if instance["pid"] is not None:
+            state = f"запущен, PID {instance['pid']}, аптайм {format_time(time.time() - instance['started_at'])}"
+        else:
+            state = "запускается" if instance["running"] else "остановлен"
+        if instance["busy"]:
+            state += ", выполняется операция"
+        listbox.insert(tk.END, f"{instance['name']:<12} {state}")
+    for index in selection:
+        listbox.selection_set(index)
+
 def toggle_auto_start(var):
     """Обработчик изменения состояния чекбокса автозапуска."""
     global auto_start
@@ -558,6 +4957,7 @@ def toggle_auto_start(var):
 
 def create_gui(root):
     """Создание графического интерфейса."""
+    global gui_backup_listbox
     root.title("SCUM Server Manager")
     root.geometry("600x500")
     root.resizable(True, True)
@@ -578,18 +4978,14 @@ def create_gui(root):
     time_frame = ttk.Frame(main_frame)
     time_frame.pack(pady=10)
     
-    ttk.Label(time_frame, text="Время рестарта 1 (ЧЧ:ММ):").pack(side=tk.LEFT)
-    time1_entry = ttk.Entry(time_frame, width=6)
-    time1_entry.pack(side=tk.LEFT, padx=5)
+    ttk.Label(time_frame, text="Расписание рестартов (через ;):").pack(side=tk.LEFT)
+    schedule_entry = ttk.Entry(time_frame, width=40)
+    schedule_entry.pack(side=tk.LEFT, padx=5)
     
-    ttk.Label(time_frame, text="Время рестарта 2 (ЧЧ:ММ):").pack(side=tk.LEFT)
-    time2_entry = ttk.Entry(time_frame, width=6)
-    time2_entry.pack(side=tk.LEFT, padx=5)
-    
-    save_button = ttk.Button(time_frame, text="Сохранить", command=lambda: save_restart_times(time1_entry, time2_entry, saved_times_label))
+    save_button = ttk.Button(time_frame, text="Сохранить", command=lambda: save_restart_schedule(schedule_entry, saved_times_label))
     save_button.pack(side=tk.LEFT, padx=5)
     
-    saved_times_label = ttk.Label(main_frame, text="Время рестарта: 12:00, 21:00", font=("Arial", 10))
+    saved_times_label = ttk.Label(main_frame, text="Расписание рестартов: 12:00, 21:00", font=("Arial", 10))
     saved_times_label.pack(pady=5)
     
     args_frame = ttk.Frame(main_frame)
@@ -609,6 +5005,20 @@ def create_gui(root):
     auto_start_check = ttk.Checkbutton(main_frame, text="Автозапуск сервера", variable=auto_start_var, command=lambda: toggle_auto_start(auto_start_var))
     auto_start_check.pack(pady=5)
     
+    watchdog_var = tk.BooleanVar(value=watchdog_enabled)
+    watchdog_check = ttk.Checkbutton(main_frame, text="Рестарт при зависании сервера", variable=watchdog_var, command=lambda: toggle_watchdog(watchdog_var))
+    watchdog_check.pack(pady=5)
+    
+    pipeline_frame = ttk.Frame(main_frame)
+    pipeline_frame.pack(pady=5)
+    ttk.Label(pipeline_frame, text="При плановом рестарте:").pack(side=tk.LEFT, padx=5)
+    pipeline_backup_var = tk.BooleanVar(value="backup" in restart_pipeline)
+    ttk.Checkbutton(pipeline_frame, text="бэкап", variable=pipeline_backup_var, command=lambda: toggle_pipeline_stage("backup", pipeline_backup_var)).pack(side=tk.LEFT, padx=5)
+    pipeline_maintenance_var = tk.BooleanVar(value="maintenance" in restart_pipeline)
+    ttk.Checkbutton(pipeline_frame, text="обслуживание базы", variable=pipeline_maintenance_var, command=lambda: toggle_pipeline_stage("maintenance", pipeline_maintenance_var)).pack(side=tk.LEFT, padx=5)
+    pipeline_update_var = tk.BooleanVar(value="update" in restart_pipeline)
+    ttk.Checkbutton(pipeline_frame, text="обновление", variable=pipeline_update_var, command=lambda: toggle_pipeline_stage("update", pipeline_update_var)).pack(side=tk.LEFT, padx=5)
+    
     button_frame = ttk.Frame(main_frame)
     button_frame.pack(pady=10)
     
@@ -633,12 +5043,50 @@ def create_gui(root):
     backup_dir_entry = ttk.Entry(backup_frame, width=50)
     backup_dir_entry.pack(pady=5)
     
+    ttk.Label(backup_frame, text="Режим бэкапа:").pack(pady=5)
+    backup_mode_var = tk.StringVar(value=BACKUP_MODES[backup_mode])
+    backup_mode_combo = ttk.Combobox(backup_frame, textvariable=backup_mode_var, values=list(BACKUP_MODES.values()), state="readonly", width=35)
+    backup_mode_combo.pack(pady=5)
+    backup_mode_combo.bind("<<ComboboxSelected>>", lambda e: set_backup_mode(backup_mode_var))
+    
+    compression_frame = ttk.Frame(backup_frame)
+    compression_frame.pack(pady=5)
+    ttk.Label(compression_frame, text="Сжатие ZIP:").pack(side=tk.LEFT)
+    compression_var = tk.StringVar(value=BACKUP_COMPRESSIONS[backup_compression])
+    compression_combo = ttk.Combobox(compression_frame, textvariable=compression_var, values=list(BACKUP_COMPRESSIONS.values()), state="readonly", width=22)
+    compression_combo.pack(side=tk.LEFT, padx=5)
+    ttk.Label(compression_frame, text="Уровень:").pack(side=tk.LEFT)
+    level_var = tk.StringVar(value=str(backup_compression_level))
+    level_spinbox = ttk.Spinbox(compression_frame, from_=1, to=9, width=3, textvariable=level_var, command=lambda: set_backup_compression(compression_var, level_var))
+    level_spinbox.pack(side=tk.LEFT, padx=5)
+    compression_combo.bind("<<ComboboxSelected>>", lambda e: set_backup_compression(compression_var, level_var))
+    level_spinbox.bind("<FocusOut>", lambda e: set_backup_compression(compression_var, level_var))
+    
     save_paths_button = ttk.Button(backup_frame, text="Сохранить пути", command=lambda: save_paths(save_dir_entry, backup_dir_entry, steamcmd_exe_entry, steamcmd_dir_entry, saved_paths_label))
     save_paths_button.pack(pady=5)
     
     backup_button = ttk.Button(backup_frame, text="Сделать бэкап", command=lambda: backup_server(root, log_widget))
     backup_button.pack(pady=5)
     
+    online_backup_button = ttk.Button(backup_frame, text="Онлайн-бэкап (без остановки сервера)", command=lambda: online_backup_server(root, log_widget))
+    online_backup_button.pack(pady=5)
+    
+    retention_var = tk.BooleanVar(value=retention_enabled)
+    retention_check = ttk.Checkbutton(backup_frame, text="Автоочистка (последние, по часу за сутки, по дню за неделю, по неделе за месяц)", variable=retention_var, command=lambda: toggle_retention(retention_var))
+    retention_check.pack(pady=5)
+    
+    backup_list_frame = ttk.Frame(backup_frame)
+    backup_list_frame.pack(fill=tk.BOTH, expand=True, pady=5)
+    backup_listbox = tk.Listbox(backup_list_frame, height=6, font=("Courier", 9))
+    backup_listbox.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+    gui_backup_listbox = backup_listbox
+    backup_list_scrollbar = ttk.Scrollbar(backup_list_frame, orient=tk.VERTICAL, command=backup_listbox.yview)
+    backup_list_scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+    backup_listbox.config(yscrollcommand=backup_list_scrollbar.set)
+    
+    restore_button = ttk.Button(backup_frame, text="Восстановить выбранный бэкап", command=lambda: restore_selected_backup(root, backup_listbox))
+    restore_button.pack(pady=5)
+    
     # Вкладка "Обновление"
     update_frame = ttk.Frame(notebook, padding="10")
     notebook.add(update_frame, text="Обновление")
@@ -654,9 +5102,69 @@ def create_gui(root):
     save_paths_button_update = ttk.Button(update_frame, text="Сохранить пути", command=lambda: save_paths(save_dir_entry, backup_dir_entry, steamcmd_exe_entry, steamcmd_dir_entry, saved_paths_label))
     save_paths_button_update.pack(pady=5)
     
+    ttk.Label(update_frame, text="Режим обновления:").pack(pady=5)
+    update_mode_var = tk.StringVar(value=UPDATE_MODES[update_mode])
+    update_mode_combo = ttk.Combobox(update_frame, textvariable=update_mode_var, values=list(UPDATE_MODES.values()), state="readonly", width=35)
+    update_mode_combo.pack(pady=5)
+    update_mode_combo.bind("<<ComboboxSelected>>", lambda e: set_update_mode(update_mode_var))
+    
     update_button = ttk.Button(update_frame, text="Обновить сервер", command=lambda: update_server(root, log_widget))
     update_button.pack(pady=5)
     
+    force_update_button = ttk.Button(update_frame, text="Обновить без проверки сборки", command=lambda: update_server(root, log_widget, force=True))
+    force_update_button.pack(pady=5)
+    
+    rollback_button = ttk.Button(update_frame, text="Откатить последнее обновление", command=lambda: rollback_server_update(root))
+    rollback_button.pack(pady=5)
+    
+    # Вкладка "События"
+    events_frame = ttk.Frame(notebook, padding="10")
+    notebook.add(events_frame, text="События")
+    
+    events_filter_frame = ttk.Frame(events_frame)
+    events_filter_frame.pack(pady=5)
+    ttk.Label(events_filter_frame, text="Тип:").pack(side=tk.LEFT)
+    event_type_var = tk.StringVar(value="Все")
+    ttk.Combobox(events_filter_frame, textvariable=event_type_var, values=["Все"] + list(EVENT_TYPES.values()), state="readonly", width=18).pack(side=tk.LEFT, padx=5)
+    ttk.Label(events_filter_frame, text="За последние (ч):").pack(side=tk.LEFT)
+    event_hours_entry = ttk.Entry(events_filter_frame, width=6)
+    event_hours_entry.insert(0, "24")
+    event_hours_entry.pack(side=tk.LEFT, padx=5)
+    ttk.Button(events_filter_frame, text="Найти", command=lambda: search_events(event_type_var, event_hours_entry, events_listbox, events_count_label)).pack(side=tk.LEFT, padx=5)
+    
+    events_count_label = ttk.Label(events_frame, text="", font=("Arial", 10))
+    events_count_label.pack(pady=5)
+    events_list_frame = ttk.Frame(events_frame)
+    events_list_frame.pack(fill=tk.BOTH, expand=True)
+    events_listbox = tk.Listbox(events_list_frame, font=("Courier", 9))
+    events_listbox.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+    events_scrollbar = ttk.Scrollbar(events_list_frame, orient=tk.VERTICAL, command=events_listbox.yview)
+    events_scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+    events_listbox.config(yscrollcommand=events_scrollbar.set)
+    
+    # Вкладка "Ресурсы"
+    resources_frame = ttk.Frame(notebook, padding="10")
+    notebook.add(resources_frame, text="Ресурсы")
+    
+    telemetry_label = ttk.Label(resources_frame, text="Нет данных: сервер не запущен", font=("Arial", 10))
+    telemetry_label.pack(pady=5)
+    telemetry_canvas = tk.Canvas(resources_frame, height=200, bg="white")
+    telemetry_canvas.pack(fill=tk.BOTH, expand=True, pady=5)
+    ttk.Button(resources_frame, text="Экспорт в CSV", command=export_telemetry).pack(pady=5)
+    
+    # Вкладка "Инстансы"
+    instances_frame = ttk.Frame(notebook, padding="10")
+    notebook.add(instances_frame, text="Инстансы")
+    
+    ttk.Label(instances_frame, text="Дополнительные инстансы задаются в settings.json (instances)", font=("Arial", 10)).pack(pady=5)
+    instance_listbox = tk.Listbox(instances_frame, font=("Courier", 10), height=10)
+    instance_listbox.pack(fill=tk.BOTH, expand=True, pady=5)
+    instance_buttons = ttk.Frame(instances_frame)
+    instance_buttons.pack(pady=5)
+    ttk.Button(instance_buttons, text="Старт", command=lambda: instance_action(instance_listbox, "start")).pack(side=tk.LEFT, padx=5)
+    ttk.Button(instance_buttons, text="Рестарт сейчас", command=lambda: instance_action(instance_listbox, "restart")).pack(side=tk.LEFT, padx=5)
+    ttk.Button(instance_buttons, text="Остановить", command=lambda: instance_action(instance_listbox, "stop")).pack(side=tk.LEFT, padx=5)
+    
     saved_paths_label = ttk.Label(main_frame, text=f"Пути: SteamCMD={DEFAULT_STEAMCMD_EXECUTABLE}, Сервер={DEFAULT_STEAMCMD_INSTALL_DIR}, Сохранения={DEFAULT_SAVE_DIR}, Бэкапы={DEFAULT_BACKUP_DIR}", font=("Arial", 10))
     saved_paths_label.pack(pady=5)
     
@@ -671,38 +5179,86 @@ def create_gui(root):
     scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
     log_widget.config(yscrollcommand=scrollbar.set)
     
+    dropped_label = ttk.Label(main_frame, text="", font=("Arial", 9))
+    dropped_label.pack()
+    
     # Загрузка настроек
-    load_settings(time1_entry, time2_entry, args_entry, save_dir_entry, backup_dir_entry, steamcmd_exe_entry, steamcmd_dir_entry, saved_times_label, saved_args_label, saved_paths_label, auto_start_var)
+    load_settings(schedule_entry, args_entry, save_dir_entry, backup_dir_entry, steamcmd_exe_entry, steamcmd_dir_entry, saved_times_label, saved_args_label, saved_paths_label, auto_start_var)
+    log_console = LogConsole(log_widget, log_max_lines, dropped_label)
+    backup_mode_var.set(BACKUP_MODES[backup_mode])
+    update_mode_var.set(UPDATE_MODES[update_mode])
+    compression_var.set(BACKUP_COMPRESSIONS[backup_compression])
+    level_var.set(str(backup_compression_level))
+    retention_var.set(retention_enabled)
+    watchdog_var.set(watchdog_enabled)
+    pipeline_backup_var.set("backup" in restart_pipeline)
+    pipeline_maintenance_var.set("maintenance" in restart_pipeline)
+    pipeline_update_var.set("update" in restart_pipeline)
     
     # Запуск обновления таймера и логов
-    root.after(1000, update_timer, root, timer_label, status_label, notebook)
-    root.after(100, update_log_widget, log_widget, root)
+    root.after(GUI_PUMP_INTERVAL, pump_gui_events, root, log_console, timer_label, status_label, notebook, instance_listbox, 0)
+    root.after(1000, draw_telemetry, root, telemetry_canvas, telemetry_label)
     
     return root, log_widget, notebook
 
 def main():
-    """Основная функция."""
-    global shutdown_flag
+    """Основная функция: окно как клиент API, демон запускается в процессе, если не найден.
     
-    root = tk.Tk()
-    root.withdraw()
-    splash = create_splash_screen(root)
+    Настройки читаются и демон (а с ним и сервер при автозапуске) стартует до импорта
+    tkinter и построения окна; окно показывается сразу, как только готово."""
+    global api_client, settings_saved_hook
+    setup_logging()
+    startup_timer.mark("импорт")
+    if HEADLESS:
+        run_daemon()
+        return
     
     logger.info(f"Запуск скрипта управления сервером {SERVER_EXECUTABLE}")
     logger.info(f"Текущая директория: {os.getcwd()}")
+    read_settings()
+    startup_timer.mark("настройки")
     
-    root, log_widget, notebook = create_gui(root)
-    server_thread = threading.Thread(target=run_server, args=(log_widget, notebook), daemon=True)
-    server_thread.start()
+    api_client = ApiClient(api_port, api_token)
+    try:
+        api_client.call("GET", "/api/status", timeout=1)
+        daemon_found = True
+    except ApiError as e:
+        # Порт отвечает, но запрос отклонён (например, токен): второй супервизор не запускаем,
+        # а окно, все запросы которого будут отклонены так же, не открываем
+        logger.error(f"Демон на порту {api_port} отклонил запрос: {e}")
+        import_tkinter()
+        root = tk.Tk()
+        root.withdraw()
+        messagebox.showerror("Ошибка", f"Утилита уже запущена (порт {api_port}), но отклонила запрос окна: {e}\n\nПроверьте api_token в settings.json.")
+        root.destroy()
+        return
+    except (OSError, ValueError):
+        daemon_found = False
+    if daemon_found:
+        logger.info(f"Найден запущенный демон на порту {api_port}, окно работает как его клиент")
+        settings_saved_hook = lambda: api_request("POST", "/api/settings/reload")
+    else:
+        _, server = start_daemon()
+        api_client = ApiClient(server.server_address[1], api_token)
+    startup_timer.mark("демон")
     
-    root.after(2000, lambda: [splash.destroy(), root.deiconify()])
+    import_tkinter()
+    root = tk.Tk()
+    root.withdraw()
+    startup_timer.mark("tkinter")
+    root, log_widget, notebook = create_gui(root)
+    threading.Thread(target=watch_events, daemon=True).start()
+    threading.Thread(target=tail_logs, daemon=True).start()
+    root.deiconify()
+    startup_timer.mark("окно")
+    root.after_idle(startup_timer.report)
     
     try:
         root.mainloop()
     except KeyboardInterrupt:
-        shutdown_flag = True
+        shutdown_event.set()
     
     logger.info("Скрипт завершен")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
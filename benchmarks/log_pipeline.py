@@ -0,0 +1,53 @@
+"""Бенчмарк пути вывода дочерних процессов: output_mux -> LogBuffer -> читатель GUI.
+
+Запуск: python benchmarks/log_pipeline.py [число строк]
+Для каждой политики переполнения печатает строк/с, МБ/с, доставлено/отброшено/свёрнуто."""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "ScumServerDops"))
+
+import run_scumserver as rs
+
+DEFAULT_LINES = 500000
+
+def child(count):
+    """Дочерний процесс бенчмарка: count строк, похожих на предупреждения сервера, без пауз."""
+    out = sys.stdout.buffer
+    for start in range(0, count, 1000):
+        out.write("".join(f"[2026.10.18-12.00.{i % 60:02d}:{i % 1000:03d}][{i % 100:3d}]LogNet: Warning: Spam message {i}\n" for i in range(start, min(start + 1000, count))).encode())
+    out.flush()
+
+def run(count=DEFAULT_LINES):
+    """Дочерний процесс печатает count строк, output_mux читает их блоками,
+    буфер с каждой политикой принимает пачки, а читатель забирает их раз в GUI_PUMP_INTERVAL.
+    Возвращает {политика: счётчики}."""
+    results = {}
+    for policy in rs.LOG_OVERFLOW_POLICIES:
+        buffer = rs.LogBuffer(rs.DEFAULT_LOG_BUFFER_LINES, policy)
+        delivered = 0
+        peak = 0
+        received = [0, 0]
+        def sink(lines):
+            received[0] += len(lines)
+            received[1] += sum(len(line.text) + 1 for line in lines)
+            buffer.put_many(line.text for line in lines)
+        started = time.perf_counter()
+        process = rs.output_mux.spawn([sys.executable, os.path.abspath(__file__), "--child", str(count)], sink, **rs.NO_WINDOW)
+        while not process.exited.is_set() or buffer.qsize() or buffer.repeats:
+            peak = max(peak, buffer.qsize())
+            delivered += len(buffer.get_batch(rs.GUI_PUMP_INTERVAL / 1000))
+            time.sleep(rs.GUI_PUMP_INTERVAL / 1000)
+        elapsed = time.perf_counter() - started
+        print(f"{policy}: {received[0]} строк за {elapsed:.2f} с ({received[0] / elapsed:.0f} строк/с, {received[1] / 1048576 / elapsed:.1f} МБ/с), "
+              f"доставлено {delivered}, отброшено {buffer.dropped_total}, свёрнуто {buffer.summarised_total}, максимум в буфере {peak}")
+        results[policy] = {"received": received[0], "delivered": delivered, "dropped": buffer.dropped_total, "summarised": buffer.summarised_total}
+    return results
+
+if __name__ == "__main__":
+    if sys.argv[1:2] == ["--child"]:
+        child(int(sys.argv[2]))
+    else:
+        run(int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_LINES)
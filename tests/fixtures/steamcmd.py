@@ -0,0 +1,28 @@
+"""Подмена SteamCMD для тестов: app_info_print и app_update по фикстурам.
+
+Каждый вызов дописывается строкой в файл FAKE_STEAMCMD_LOG. FAKE_STEAMCMD_PATCH_IN_PLACE -
+относительный путь файла установки, который app_update перезаписывает на месте, как починка validate."""
+import os
+import shutil
+import sys
+
+FIXTURES = os.path.dirname(os.path.abspath(__file__))
+APP_ID = "3792580"
+
+args = sys.argv[1:]
+with open(os.environ["FAKE_STEAMCMD_LOG"], "a", encoding="utf-8") as log:
+    log.write(" ".join(args) + "\n")
+
+if "+app_info_print" in args:
+    with open(os.path.join(FIXTURES, f"app_info_{APP_ID}.txt"), encoding="utf-8") as f:
+        sys.stdout.write(f.read())
+elif "+app_update" in args:
+    install_dir = args[args.index("+force_install_dir") + 1]
+    os.makedirs(os.path.join(install_dir, "steamapps"), exist_ok=True)
+    for progress in ("10.00", "55.31", "100.00"):
+        print(f" Update state (0x61) downloading, progress: {progress} (1318743293 / 13187432931)")
+    shutil.copy(os.path.join(FIXTURES, f"appmanifest_{APP_ID}.acf"), os.path.join(install_dir, "steamapps"))
+    if os.environ.get("FAKE_STEAMCMD_PATCH_IN_PLACE"):
+        with open(os.path.join(install_dir, os.environ["FAKE_STEAMCMD_PATCH_IN_PLACE"]), "r+b") as f:
+            f.write(b"patched in place")
+    print(f"Success! App '{APP_ID}' fully installed.")
@@ -0,0 +1,28 @@
+import os
+import threading
+
+import run_scumserver as rs
+
+
+def test_garbage_collection_waits_for_in_flight_backup(tmp_path):
+    store_dir = str(tmp_path / "chunks")
+    source = tmp_path / "SCUM.db"
+    source.write_bytes(os.urandom(4 * 1024))
+    store = rs.ChunkStore(store_dir, chunk_size=1024)
+    collector = threading.Thread(target=rs.ChunkStore(store_dir).collect_garbage)
+    blocked = []
+
+    def progress(size):
+        if not collector.is_alive() and not blocked:
+            collector.start()
+            collector.join(0.2)
+            blocked.append(collector.is_alive())
+
+    manifest_path, stats = store.backup_files([str(source)], "backup_1", progress)
+    collector.join(5)
+    assert blocked == [True]
+    assert stats["new_chunks"] == 4
+    with rs.ThreadPoolExecutor(max_workers=2) as executor:
+        restored = store.restore(manifest_path, str(tmp_path / "restore"), executor, 4)
+    assert restored == {"SCUM.db": 4 * 1024}
+    assert (tmp_path / "restore" / "SCUM.db").read_bytes() == source.read_bytes()
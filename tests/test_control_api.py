@@ -0,0 +1,158 @@
+import http.client
+import json
+
+import pytest
+
+import run_scumserver as rs
+
+TOKEN = "test-token"
+
+
+@pytest.fixture
+def api(monkeypatch):
+    monkeypatch.setattr(rs, "api_port", 0)
+    monkeypatch.setattr(rs, "api_token", TOKEN)
+    server = rs.start_control_api()
+    port = server.server_address[1]
+
+    def request(method, path, body=None, headers=None, host=None):
+        connection = http.client.HTTPConnection("127.0.0.1", port, timeout=10)
+        connection.putrequest(method, path, skip_host=True)
+        connection.putheader("Host", host or f"127.0.0.1:{port}")
+        data = json.dumps(body).encode("utf-8") if body is not None else b""
+        for name, value in {"Content-Length": str(len(data)), **(headers or {})}.items():
+            connection.putheader(name, value)
+        connection.endheaders(data)
+        response = connection.getresponse()
+        payload = response.read()
+        connection.close()
+        return response.status, payload
+
+    request.port = port
+    yield request
+    server.shutdown()
+    server.server_close()
+
+
+def test_token_is_required(api):
+    assert api("GET", "/api/saves")[0] == 401
+    assert api("GET", "/api/saves", headers={"X-Api-Token": "wrong"})[0] == 401
+    assert api("GET", "/api/saves", headers={"X-Api-Token": TOKEN})[0] == 200
+
+
+def test_metrics_accept_bearer_token(api):
+    status, payload = api("GET", "/metrics", headers={"Authorization": f"Bearer {TOKEN}"})
+    assert status == 200
+    assert b"scum_manager_uptime_seconds" in payload
+
+
+def test_foreign_host_and_origin_are_rejected(api):
+    headers = {"X-Api-Token": TOKEN}
+    assert api("GET", "/api/saves", headers=headers, host="evil.example:8765")[0] == 403
+    assert api("GET", "/api/saves", headers={**headers, "Origin": "http://evil.example"})[0] == 403
+    assert api("GET", "/api/saves", headers={**headers, "Origin": "http://localhost:8765"})[0] == 200
+    assert api("GET", "/api/saves", headers=headers, host="localhost")[0] == 200
+
+
+def test_post_requires_json_content_type(api):
+    headers = {"X-Api-Token": TOKEN}
+    assert api("POST", "/api/backup/cancel", {}, headers={**headers, "Content-Type": "text/plain"})[0] == 415
+    assert api("POST", "/api/backup/cancel", {}, headers=headers)[0] == 415
+    assert api("POST", "/api/backup/cancel", {}, headers={**headers, "Content-Type": "application/json"})[0] != 415
+
+
+def test_token_generated_and_saved_on_first_run(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(rs, "api_token", "")
+    monkeypatch.setattr(rs, "settings_saved_hook", None)
+    rs.read_settings()
+    token = rs.api_token
+    assert len(token) >= 32
+    with open(rs.SETTINGS_FILE, encoding="utf-8") as f:
+        assert json.load(f)["api_token"] == token
+    rs.read_settings()
+    assert rs.api_token == token
+
+
+def get_json(api, path):
+    status, payload = api("GET", path, headers={"X-Api-Token": TOKEN})
+    assert status == 200, payload
+    return json.loads(payload)
+
+
+def test_backups_endpoint_lists_catalog_without_block_index(api, tmp_path, monkeypatch):
+    monkeypatch.setattr(rs, "backup_dir", str(tmp_path))
+    monkeypatch.setattr(rs, "backup_catalogs", {})
+    catalog = rs.get_backup_catalog(str(tmp_path))
+    catalog.add({"id": "backup_2026-01-01_00-00-00", "created": "2026-01-01T00:00:00", "kind": "zip", "path": "backup_2026-01-01_00-00-00.zip",
+                 "size": 10, "files": {}, "block_index": {"SCUM.db": [[0, 0]]}, "verified": True})
+    result = get_json(api, "/api/backups")
+    assert [entry["id"] for entry in result["entries"]] == ["backup_2026-01-01_00-00-00"]
+    assert "block_index" not in result["entries"][0]
+    assert get_json(api, f"/api/backups?version={result['version']}")["entries"] is None
+    catalog.update("backup_2026-01-01_00-00-00", verified=False)
+    assert get_json(api, f"/api/backups?version={result['version']}")["entries"][0]["verified"] is False
+
+
+def test_catalog_changes_are_published_on_the_event_bus(api, tmp_path, monkeypatch):
+    monkeypatch.setattr(rs, "backup_catalogs", {})
+    catalog = rs.get_backup_catalog(str(tmp_path))
+    since = get_json(api, "/api/events?since=-1")["next"]
+    catalog.add({"id": "backup_2026-01-01_00-00-00", "created": "2026-01-01T00:00:00", "kind": "zip", "path": "x.zip", "size": 1, "files": {}})
+    catalog.update("backup_2026-01-01_00-00-00", verified=True)
+    catalog.remove({"backup_2026-01-01_00-00-00"})
+    events = get_json(api, f"/api/events?since={since}&topics=catalog")["events"]
+    assert [(event["root_dir"], event["version"]) for event in events] == [(str(tmp_path), 1), (str(tmp_path), 2), (str(tmp_path), 3)]
+
+
+def test_events_search_reads_the_daemon_store(api, tmp_path, monkeypatch):
+    store = rs.EventStore(str(tmp_path / "events"))
+    store.start()
+    now = 1_800_000_000
+    store.flush([{"ts": now - 60, "type": "login", "text": "a", "player": "Ann"},
+                 {"ts": now - 30, "type": "chat", "text": "b", "message": "hi"}])
+    monkeypatch.setattr(rs, "event_store", store)
+    result = get_json(api, f"/api/events/search?start={now - 3600}&end={now}&types=login")
+    assert result["total"] == 1
+    assert [event["player"] for event in result["events"]] == ["Ann"]
+    assert api("GET", "/api/events/search?types=nope", headers={"X-Api-Token": TOKEN})[0] == 400
+
+
+def test_telemetry_endpoint_returns_last_rows(api, monkeypatch):
+    sampler = rs.TelemetrySampler()
+    for i in range(5):
+        sampler.ring.append({field: float(i) for field in rs.TELEMETRY_FIELDS})
+    monkeypatch.setattr(rs, "telemetry", sampler)
+    result = get_json(api, "/api/telemetry?limit=2")
+    assert [row["cpu_percent"] for row in result["rows"]] == [3.0, 4.0]
+
+
+def test_window_exits_when_running_daemon_rejects_it(api, monkeypatch):
+    shown = []
+
+    class FakeTk:
+        def withdraw(self):
+            pass
+
+        def destroy(self):
+            shown.append("destroyed")
+
+    def fake_import_tkinter():
+        monkeypatch.setattr(rs, "tk", type("tk", (), {"Tk": FakeTk}), raising=False)
+        monkeypatch.setattr(rs, "messagebox", type("messagebox", (), {"showerror": staticmethod(lambda title, text: shown.append(text))}), raising=False)
+
+    def unexpected(*args, **kwargs):
+        raise AssertionError("окно не должно запускать демон или строиться")
+
+    monkeypatch.setattr(rs, "api_port", api.port)
+    # Демон ждёт другой токен, чем знает окно
+    client = rs.ApiClient
+    monkeypatch.setattr(rs, "ApiClient", lambda port, token="": client(port, "wrong"))
+    monkeypatch.setattr(rs, "api_client", None)
+    monkeypatch.setattr(rs, "setup_logging", lambda: None)
+    monkeypatch.setattr(rs, "read_settings", lambda: None)
+    monkeypatch.setattr(rs, "import_tkinter", fake_import_tkinter)
+    monkeypatch.setattr(rs, "start_daemon", unexpected)
+    monkeypatch.setattr(rs, "create_gui", unexpected)
+    rs.main()
+    assert len(shown) == 2 and "api_token" in shown[0] and shown[1] == "destroyed"
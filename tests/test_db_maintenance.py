@@ -0,0 +1,111 @@
+import os
+import sqlite3
+
+import pytest
+
+import run_scumserver as rs
+
+MB = 1024 * 1024
+NOW = 1_800_000_000.0
+# Скорости, при которых оценки считаются в уме: VACUUM 10 МБ/с, checkpoint 100 МБ/с
+VACUUM_RATE = 10 * MB
+CHECKPOINT_RATE = 100 * MB
+ANALYZED = {"time": NOW, "rows_total": 1000}
+
+
+def sample(db_mb=100, wal_mb=0, free_ratio=0.0, analyzed=True, rows_total=1000):
+    page_size = 4096
+    page_count = db_mb * MB // page_size
+    return {"db_bytes": db_mb * MB, "wal_bytes": wal_mb * MB, "page_size": page_size, "page_count": page_count,
+            "free_pages": int(page_count * free_ratio), "free_ratio": free_ratio, "analyzed": analyzed, "rows_total": rows_total}
+
+
+def plan(sample, budget=120, last_analyze=ANALYZED, free_disk=10_000 * MB):
+    actions, skipped = rs.plan_db_maintenance(sample, budget, VACUUM_RATE, CHECKPOINT_RATE, last_analyze, free_disk, NOW)
+    return [action for action, _ in actions], [action for action, _ in skipped]
+
+
+@pytest.mark.parametrize("db_sample, budget, last_analyze, free_disk, actions, skipped", [
+    # Здоровая база: делать нечего
+    (sample(), 120, ANALYZED, 10_000 * MB, [], []),
+    # Большой WAL: только checkpoint
+    (sample(wal_mb=64), 120, ANALYZED, 10_000 * MB, ["checkpoint"], []),
+    # Маленький WAL не стоит отдельного действия
+    (sample(wal_mb=1), 120, ANALYZED, 10_000 * MB, [], []),
+    # VACUUM всегда с последующим checkpoint: 10 с + 1 с укладываются в бюджет
+    (sample(free_ratio=0.5), 120, ANALYZED, 10_000 * MB, ["vacuum", "checkpoint"], []),
+    # Доля свободного велика, но в байтах мало
+    (sample(db_mb=10, free_ratio=0.5), 120, ANALYZED, 10_000 * MB, [], []),
+    # 10 с VACUUM + 1 с checkpoint не укладываются в 10.5 с
+    (sample(free_ratio=0.5), 10.5, ANALYZED, 10_000 * MB, [], ["vacuum"]),
+    # Мало места на диске под копию базы
+    (sample(free_ratio=0.5), 120, ANALYZED, 150 * MB, [], ["vacuum"]),
+    # Статистики нет или она устарела
+    (sample(analyzed=False), 120, ANALYZED, 10_000 * MB, ["analyze"], []),
+    (sample(), 120, None, 10_000 * MB, ["analyze"], []),
+    (sample(), 120, {"time": NOW - rs.DB_ANALYZE_INTERVAL, "rows_total": 1000}, 10_000 * MB, ["analyze"], []),
+    # Число строк сильно изменилось с прошлого ANALYZE
+    (sample(rows_total=1300), 120, ANALYZED, 10_000 * MB, ["analyze"], []),
+    (sample(rows_total=1100), 120, ANALYZED, 10_000 * MB, [], []),
+    # Всё сразу: checkpoint большого WAL идёт после VACUUM одним действием
+    (sample(wal_mb=64, free_ratio=0.5, analyzed=False), 120, ANALYZED, 10_000 * MB, ["vacuum", "checkpoint", "analyze"], []),
+])
+def test_plan(db_sample, budget, last_analyze, free_disk, actions, skipped):
+    assert plan(db_sample, budget, last_analyze, free_disk) == (actions, skipped)
+
+
+def test_vacuum_estimate_uses_checkpoint_rate_for_the_rewritten_base():
+    # VACUUM 100 МБ + 100 МБ WAL за 20 с; checkpoint WAL и переписанной базы 200 МБ за 2 с
+    assert plan(sample(wal_mb=100, free_ratio=0.5), budget=22.5) == (["vacuum", "checkpoint"], [])
+    assert plan(sample(wal_mb=100, free_ratio=0.5), budget=21.5) == (["checkpoint"], ["vacuum"])
+    # Медленный диск: checkpoint оценивается по своей скорости, а не по скорости VACUUM
+    actions, skipped = rs.plan_db_maintenance(sample(free_ratio=0.5), 15, VACUUM_RATE, 10 * MB, ANALYZED, 10_000 * MB, NOW)
+    assert (actions, [action for action, _ in skipped]) == ([], ["vacuum"])
+
+
+def test_rates_come_from_the_last_successful_run(tmp_path):
+    health = rs.DbHealthMonitor(str(tmp_path / "health.jsonl"))
+    assert (health.vacuum_rate(), health.checkpoint_rate()) == (rs.DB_VACUUM_RATE, rs.DB_CHECKPOINT_RATE)
+    health.record({"kind": "maintenance", "time": NOW, "db_bytes_before": 90 * MB, "wal_bytes_before": 10 * MB, "skipped": {},
+                   "vacuum": {"ok": True, "seconds": 4.0},
+                   "checkpoint": {"ok": True, "seconds": 0.5, "wal_bytes": 100 * MB}})
+    health.record({"kind": "maintenance", "time": NOW + 1, "db_bytes_before": 90 * MB, "wal_bytes_before": 10 * MB, "skipped": {},
+                   "checkpoint": {"ok": False, "seconds": 9.0, "wal_bytes": 100 * MB}})
+    assert health.vacuum_rate() == 25 * MB
+    assert health.checkpoint_rate() == 200 * MB
+
+
+@pytest.fixture
+def db_path(tmp_path, monkeypatch):
+    monkeypatch.setattr(rs, "db_health", rs.DbHealthMonitor(str(tmp_path / "health.jsonl")))
+    monkeypatch.setattr(rs, "DB_VACUUM_MIN_FREE", 0)
+    path = str(tmp_path / "SCUM.db")
+    connection = sqlite3.connect(path, isolation_level=None)
+    connection.execute("PRAGMA journal_mode = WAL")
+    connection.execute("PRAGMA wal_autocheckpoint = 0")
+    connection.execute("CREATE TABLE items (id INTEGER PRIMARY KEY, data BLOB)")
+    connection.executemany("INSERT INTO items (data) VALUES (?)", [(os.urandom(2000),) for _ in range(2000)])
+    connection.execute("DELETE FROM items WHERE id > 200")
+    connection.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    connection.close()
+    return path
+
+
+def test_vacuum_is_followed_by_a_wal_checkpoint(db_path):
+    before = os.path.getsize(db_path)
+    record = rs.run_db_maintenance(db_path, 60)
+    assert record["vacuum"]["ok"] and record["checkpoint"]["ok"], record
+    assert record["checkpoint"]["reason"] == "после VACUUM"
+    # Переписанная база лежала в WAL и перенесена в файл базы
+    assert record["checkpoint"]["wal_bytes"] > 0
+    assert not os.path.exists(f"{db_path}-wal") or os.path.getsize(f"{db_path}-wal") == 0
+    assert record["db_bytes_after"] < before / 2
+    assert list(record).index("vacuum") < list(record).index("checkpoint")
+    assert "checkpoint" in rs.format_db_maintenance(record)
+
+
+def test_exhausted_budget_skips_the_remaining_steps(db_path, monkeypatch):
+    monkeypatch.setattr(rs, "plan_db_maintenance", lambda *args: ([("vacuum", "тест"), ("checkpoint", "после VACUUM")], []))
+    record = rs.run_db_maintenance(db_path, 0)
+    assert record["skipped"] == {"vacuum": "бюджет исчерпан", "checkpoint": "бюджет исчерпан"}
+    assert "vacuum" not in record and "checkpoint" not in record
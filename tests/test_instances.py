@@ -0,0 +1,46 @@
+import pytest
+
+import run_scumserver as rs
+
+
+@pytest.fixture
+def primary_paths(tmp_path, monkeypatch):
+    monkeypatch.setattr(rs, "save_dir", str(tmp_path / "main" / "SaveFiles"))
+    monkeypatch.setattr(rs, "backup_dir", str(tmp_path / "main" / "backup"))
+    monkeypatch.setattr(rs, "instances", [rs.primary_instance])
+    return tmp_path
+
+
+def extra(tmp_path, name, **paths):
+    item = {"name": name, "save_dir": str(tmp_path / name / "SaveFiles"), "backup_dir": str(tmp_path / name / "backup"), "install_dir": str(tmp_path / name)}
+    item.update(paths)
+    return item
+
+
+@pytest.mark.parametrize("missing", ["save_dir", "backup_dir", "install_dir"])
+def test_extra_instance_requires_its_own_paths(tmp_path, missing):
+    item = extra(tmp_path, "pve")
+    del item[missing]
+    with pytest.raises(ValueError, match=missing):
+        rs.ServerInstance.from_settings(item, 0)
+
+
+def test_instances_with_shared_directories_are_rejected(primary_paths):
+    tmp_path = primary_paths
+    rs.update_instances_from_settings([
+        extra(tmp_path, "pve"),
+        extra(tmp_path, "copy", save_dir=str(tmp_path / "pve" / "SaveFiles")),
+        extra(tmp_path, "onmain", backup_dir=str(tmp_path / "main" / "backup")),
+        extra(tmp_path, "nopaths", save_dir=""),
+    ])
+    assert [instance.name for instance in rs.instances] == ["main", "pve"]
+
+
+def test_running_instance_keeps_paths_when_new_config_conflicts(primary_paths):
+    tmp_path = primary_paths
+    rs.update_instances_from_settings([extra(tmp_path, "pve")])
+    pve = rs.instances[1]
+    rs.update_instances_from_settings([extra(tmp_path, "pve", save_dir=rs.save_dir)])
+    assert rs.instances == [rs.primary_instance, pve]
+    assert not pve.removed
+    assert pve.save_dir == str(tmp_path / "pve" / "SaveFiles")
@@ -0,0 +1,14 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks"))
+
+import log_pipeline
+
+
+def test_every_line_is_delivered_dropped_or_summarised():
+    results = log_pipeline.run(20000)
+    for policy, counts in results.items():
+        assert counts["received"] == 20000, policy
+        # Счётчик свёрнутых строк добавляет одну строку-отметку на серию, отметки пропусков — по одной на пачку
+        assert counts["delivered"] >= 20000 - counts["dropped"] - counts["summarised"], policy
@@ -0,0 +1,58 @@
+import run_scumserver as rs
+
+
+def render(metrics):
+    return metrics.render_prometheus().splitlines()
+
+
+def test_histogram_buckets_are_cumulative_with_sum_and_count():
+    metrics = rs.Metrics()
+    metrics.histogram("job_seconds", "Длительность", buckets=(1, 5, 10))
+    for value in (0.5, 1, 3, 7, 30):
+        metrics.observe("job_seconds", value, result="ok")
+    lines = render(metrics)
+    assert lines == [
+        "# HELP job_seconds Длительность",
+        "# TYPE job_seconds histogram",
+        'job_seconds_bucket{result="ok",le="1"} 2',
+        'job_seconds_bucket{result="ok",le="5"} 3',
+        'job_seconds_bucket{result="ok",le="10"} 4',
+        'job_seconds_bucket{result="ok",le="+Inf"} 5',
+        'job_seconds_sum{result="ok"} 41.5',
+        'job_seconds_count{result="ok"} 5',
+    ]
+
+
+def test_histogram_series_are_kept_per_label_set():
+    metrics = rs.Metrics()
+    metrics.histogram("job_seconds", "Длительность", buckets=(1,))
+    metrics.observe("job_seconds", 2, result="error")
+    metrics.observe("job_seconds", 0.1, result="ok")
+    sample = {tuple(s["labels"].items()): s for s in metrics.snapshot()["job_seconds"]["samples"]}
+    assert sample[(("result", "error"),)]["buckets"] == {"1": 0, "+Inf": 1}
+    assert sample[(("result", "ok"),)]["buckets"] == {"1": 1, "+Inf": 1}
+
+
+def test_type_lines_and_counters_and_gauges():
+    metrics = rs.Metrics()
+    metrics.counter("restarts_total", "Рестарты")
+    metrics.gauge("queue_depth", "Глубина", lambda: [({}, 3)])
+    metrics.inc("restarts_total", instance="main", reason="crash")
+    metrics.inc("restarts_total", instance="main", reason="crash")
+    lines = render(metrics)
+    assert "# TYPE restarts_total counter" in lines
+    assert "# TYPE queue_depth gauge" in lines
+    assert 'restarts_total{instance="main",reason="crash"} 2' in lines
+    assert "queue_depth 3" in lines
+    # Каждое семейство объявляется один раз, до своих строк
+    assert lines.index("# TYPE restarts_total counter") < lines.index('restarts_total{instance="main",reason="crash"} 2')
+    assert sum(line.startswith("# TYPE ") for line in lines) == 2
+
+
+def test_label_values_and_help_are_escaped():
+    metrics = rs.Metrics()
+    metrics.counter("events_total", 'Строка\nс "кавычками" и \\')
+    metrics.inc("events_total", path='C:\\SCUM "main"\nsave')
+    lines = render(metrics)
+    assert lines[0] == '# HELP events_total Строка\\nс "кавычками" и \\\\'
+    assert lines[2] == 'events_total{path="C:\\\\SCUM \\"main\\"\\nsave"} 1'
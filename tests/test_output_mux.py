@@ -0,0 +1,77 @@
+import sys
+import threading
+import time
+
+import run_scumserver as rs
+
+FLOOD_CHILD = """
+import sys
+line = "x" * 1000 + "\\n"
+for i in range(5000):
+    sys.stderr.write(f"{i} {line}")
+sys.stderr.flush()
+for i in range(5000):
+    sys.stdout.write(f"{i} {line}")
+sys.stdout.write("y" * (%d + 10) + "\\n")
+sys.stdout.write("tail")
+"""
+
+
+class Collector:
+    def __init__(self):
+        self.lines = []
+        self.lock = threading.Lock()
+
+    def __call__(self, batch):
+        with self.lock:
+            self.lines.extend(batch)
+
+    def wait_for(self, count, timeout=30):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            with self.lock:
+                if len(self.lines) >= count:
+                    return list(self.lines)
+            time.sleep(0.05)
+        return list(self.lines)
+
+
+def test_flooded_stderr_does_not_block_stdout():
+    collector = Collector()
+    exited = threading.Event()
+    child = rs.output_mux.spawn([sys.executable, "-c", FLOOD_CHILD % rs.CHILD_LINE_LIMIT], collector, on_exit=lambda _: exited.set(), **rs.NO_WINDOW)
+    assert child.wait(60) == 0
+    assert exited.is_set()
+    lines = collector.wait_for(10002)
+    stderr = [line.text for line in lines if line.stream == "stderr"]
+    stdout = [line.text for line in lines if line.stream == "stdout"]
+    assert [int(text.split()[0]) for text in stderr] == list(range(5000))
+    assert [int(text.split()[0]) for text in stdout[:5000]] == list(range(5000))
+    assert stdout[5000:] == [f"Строка длиннее {rs.CHILD_LINE_LIMIT} символов пропущена", "tail"]
+    timestamps = [line.timestamp for line in lines if line.stream == "stdout"]
+    assert timestamps == sorted(timestamps)
+
+
+class ChunkStream:
+    def __init__(self, chunks):
+        self.chunks = list(chunks)
+
+    async def read(self, size):
+        return self.chunks.pop(0) if self.chunks else b""
+
+
+def test_overlong_line_within_one_read_is_replaced():
+    import asyncio
+    line = b"y" * (rs.CHILD_LINE_LIMIT + 10) + b"\n"
+    collector = Collector()
+    asyncio.run(rs.ChildOutputMux()._pump(ChunkStream([b"head\n" + line + b"tail\n"]), "stdout", collector))
+    assert [line.text for line in collector.lines] == ["head", f"Строка длиннее {rs.CHILD_LINE_LIMIT} символов пропущена", "tail"]
+
+
+def test_spawn_without_window_flags_off_windows():
+    collector = Collector()
+    child = rs.output_mux.spawn([sys.executable, "-c", "print('ok')"], collector, **rs.NO_WINDOW)
+    assert child.wait(30) == 0
+    assert [line.text for line in collector.wait_for(1)] == ["ok"]
+    if sys.platform != "win32":
+        assert rs.NO_WINDOW == {}
@@ -0,0 +1,39 @@
+import os
+import zipfile
+
+import run_scumserver as rs
+
+BLOCK_SIZE = 64 * 1024
+
+
+def write_archive(tmp_path, size, workers=4):
+    source = tmp_path / "SCUM.db"
+    source.write_bytes(os.urandom(size))
+    archive = tmp_path / "backup.zip"
+    with rs.ParallelZipWriter(str(archive), workers=workers, block_size=BLOCK_SIZE) as zipf:
+        zipf.write(str(source), "SCUM.db")
+    return source, archive, zipf.block_index["SCUM.db"]
+
+
+def test_block_offsets_strictly_increase(tmp_path):
+    source, archive, blocks = write_archive(tmp_path, 16 * BLOCK_SIZE + 123)
+    assert len(blocks) == 17
+    assert blocks[0] == [0, 0]
+    for (prev_compressed, prev_raw), (compressed, raw) in zip(blocks, blocks[1:]):
+        assert compressed > prev_compressed
+        assert raw == prev_raw + BLOCK_SIZE
+    with zipfile.ZipFile(archive) as zipf:
+        info = zipf.getinfo("SCUM.db")
+        assert blocks[-1][0] < info.compress_size
+        assert zipf.read(info) == source.read_bytes()
+
+
+def test_block_offsets_point_at_inflatable_blocks(tmp_path):
+    source, archive, blocks = write_archive(tmp_path, 8 * BLOCK_SIZE, workers=1)
+    data = source.read_bytes()
+    with zipfile.ZipFile(archive) as zipf:
+        info = zipf.getinfo("SCUM.db")
+    with rs.ThreadPoolExecutor(max_workers=2) as executor:
+        pieces = [future.result() for future in rs.zip_block_pieces(str(archive), info, blocks, executor)]
+    assert [len(piece) for piece in pieces] == [BLOCK_SIZE] * 8
+    assert b"".join(pieces) == data
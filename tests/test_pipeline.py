@@ -0,0 +1,23 @@
+import os
+import threading
+from types import SimpleNamespace
+
+import run_scumserver as rs
+
+
+def test_backup_copy_of_stopped_server_does_not_wait_for_disk_slot(tmp_path):
+    save_dir = tmp_path / "saves"
+    save_dir.mkdir()
+    (save_dir / "SCUM.db").write_bytes(b"db")
+    instance = SimpleNamespace(primary=False, save_dir=str(save_dir), backup_dir=str(tmp_path / "backup"))
+    context = {"instance": instance, "timestamp": "2026-10-18_12-00-00"}
+    # Дисковый слот занят чужой архивацией
+    assert rs.disk_slot.acquire(timeout=5)
+    try:
+        copy = threading.Thread(target=rs.pipeline_backup_copy, args=(context,), daemon=True)
+        copy.start()
+        copy.join(5)
+        assert not copy.is_alive()
+    finally:
+        rs.disk_slot.release()
+    assert [os.path.basename(path) for path in context["backup_files"]] == ["SCUM.db"]
@@ -0,0 +1,76 @@
+import os
+
+import run_scumserver as rs
+
+BLOCK_SIZE = 64 * 1024
+
+
+def make_entry(tmp_path, size):
+    backup_dir = tmp_path / "backup"
+    backup_dir.mkdir()
+    source = tmp_path / "SCUM.db"
+    source.write_bytes(os.urandom(size))
+    with rs.ParallelZipWriter(str(backup_dir / "backup_2026-01-01_00-00-00.zip"), workers=4, block_size=BLOCK_SIZE) as zipf:
+        zipf.write(str(source), "SCUM.db")
+    entry = {
+        "id": "backup_2026-01-01_00-00-00",
+        "created": "2026-01-01T00:00:00",
+        "kind": "zip",
+        "path": "backup_2026-01-01_00-00-00.zip",
+        "files": {"SCUM.db": {"size": size, "sha256": zipf.hashes["SCUM.db"]}},
+        "block_index": zipf.block_index,
+    }
+    return rs.BackupCatalog(str(backup_dir)), entry, source.read_bytes()
+
+
+def record_inflated(monkeypatch):
+    pieces = []
+    inflate_block = rs.inflate_block
+
+    def recording_inflate(data):
+        piece = inflate_block(data)
+        pieces.append(len(piece))
+        return piece
+
+    monkeypatch.setattr(rs, "inflate_block", recording_inflate)
+    return pieces
+
+
+def test_restore_splits_large_file_into_pieces(tmp_path, monkeypatch):
+    catalog, entry, data = make_entry(tmp_path, 10 * BLOCK_SIZE + 17)
+    pieces = record_inflated(monkeypatch)
+    target = tmp_path / "restore"
+    target.mkdir()
+    assert rs.extract_backup(catalog, entry, str(target)) == {"SCUM.db": len(data)}
+    assert len(pieces) == 11
+    assert all(pieces)
+    assert sum(pieces) == len(data)
+    assert (target / "SCUM.db").read_bytes() == data
+
+
+def test_restore_streams_archive_with_stale_block_index(tmp_path, monkeypatch):
+    catalog, entry, data = make_entry(tmp_path, 10 * BLOCK_SIZE)
+    entry["block_index"] = {"SCUM.db": [[0, i * BLOCK_SIZE] for i in range(10)]}
+    pieces = record_inflated(monkeypatch)
+    target = tmp_path / "restore"
+    target.mkdir()
+    assert rs.extract_backup(catalog, entry, str(target)) == {"SCUM.db": len(data)}
+    assert pieces == []
+    assert (target / "SCUM.db").read_bytes() == data
+
+
+def test_lzma_backup_keeps_source_and_restores(tmp_path, monkeypatch):
+    monkeypatch.setattr(rs, "backup_catalogs", {})
+    monkeypatch.setattr(rs, "backup_mode", "zip")
+    monkeypatch.setattr(rs, "backup_compression", "lzma")
+    source = tmp_path / "SCUM.db"
+    source.write_bytes(os.urandom(3 * 1024) * 4)
+    backup_dir = str(tmp_path / "backup")
+    rs.write_backup([str(source)], "2026-01-01_00-00-00", source="pipeline", target_dir=backup_dir, install_dir=str(tmp_path))
+    catalog = rs.get_backup_catalog(backup_dir)
+    entry = catalog.list()[-1]
+    assert entry["source"] == "pipeline"
+    target = tmp_path / "restore"
+    target.mkdir()
+    assert rs.extract_backup(catalog, entry, str(target)) == {"SCUM.db": 12 * 1024}
+    assert (target / "SCUM.db").read_bytes() == source.read_bytes()
@@ -0,0 +1,77 @@
+from datetime import datetime
+
+import pytest
+
+import run_scumserver as rs
+
+NOW = datetime(2026, 10, 18, 12, 30)
+
+
+def entries(*created):
+    return [{"id": stamp, "created": stamp} for stamp in created]
+
+
+@pytest.mark.parametrize("policy, created, pruned", [
+    # keep_last держит самые свежие независимо от окон
+    ({"keep_last": 2},
+     ["2026-10-18T12:00:00", "2026-10-18T11:00:00", "2026-10-18T10:00:00"],
+     ["2026-10-18T10:00:00"]),
+    ({"keep_last": 5},
+     ["2026-10-18T12:00:00", "2025-01-01T00:00:00"],
+     []),
+    # Часовой ярус: самый свежий бэкап в каждом часе, граница часа - ровно HH:00
+    ({"hourly_hours": 24},
+     ["2026-10-18T12:10:00", "2026-10-18T12:00:00", "2026-10-18T11:59:59", "2026-10-18T11:30:00"],
+     ["2026-10-18T12:00:00", "2026-10-18T11:30:00"]),
+    # Окно включает бэкап ровно на его границе
+    ({"hourly_hours": 1},
+     ["2026-10-18T11:30:00", "2026-10-18T11:29:59"],
+     ["2026-10-18T11:29:59"]),
+    # Дневной ярус: граница суток - полночь
+    ({"daily_days": 7},
+     ["2026-10-17T23:59:59", "2026-10-17T00:00:00", "2026-10-16T23:59:59"],
+     ["2026-10-17T00:00:00"]),
+    # Всё старше всех окон удаляется
+    ({"keep_last": 1, "hourly_hours": 24, "daily_days": 7, "weekly_weeks": 4},
+     ["2026-10-18T12:00:00", "2026-08-01T00:00:00", "2026-07-01T00:00:00"],
+     ["2026-08-01T00:00:00", "2026-07-01T00:00:00"]),
+    ({},
+     ["2026-10-18T12:00:00"],
+     ["2026-10-18T12:00:00"]),
+])
+def test_select_backups_to_prune(policy, created, pruned):
+    assert [e["id"] for e in rs.select_backups_to_prune(entries(*created), policy, NOW)] == pruned
+
+
+def test_weekly_buckets_follow_iso_weeks_across_year_end():
+    # 2026-12-28 (пн) .. 2027-01-03 (вс) - неделя 2026-W53, 2027-01-04 - 2027-W01
+    created = ["2027-01-04T10:00:00", "2027-01-03T10:00:00", "2026-12-28T10:00:00", "2026-12-27T10:00:00"]
+    pruned = rs.select_backups_to_prune(entries(*created), {"weekly_weeks": 4}, datetime(2027, 1, 10, 12, 0))
+    assert [e["id"] for e in pruned] == ["2026-12-28T10:00:00"]
+
+
+def test_tiers_combine():
+    created = ["2026-10-18T12:00:00", "2026-10-18T11:00:00", "2026-10-17T09:00:00", "2026-10-17T08:00:00", "2026-10-05T08:00:00"]
+    pruned = rs.select_backups_to_prune(entries(*created), {"hourly_hours": 6, "daily_days": 7, "weekly_weeks": 4}, NOW)
+    assert [e["id"] for e in pruned] == ["2026-10-17T08:00:00"]
+
+
+def test_maintenance_covers_every_instance_backup_dir(tmp_path, monkeypatch):
+    import zipfile
+    from types import SimpleNamespace
+    dirs = [tmp_path / "main", tmp_path / "pve"]
+    for directory in dirs:
+        directory.mkdir()
+        for day in (1, 2, 3):
+            with zipfile.ZipFile(directory / f"backup_2020-01-0{day}_00-00-00.zip", "w") as zipf:
+                zipf.writestr("SCUM.db", b"db")
+    monkeypatch.setattr(rs, "backup_catalogs", {})
+    monkeypatch.setattr(rs, "backup_dir", str(dirs[0]))
+    monkeypatch.setattr(rs, "instances", [rs.primary_instance, SimpleNamespace(backup_dir=str(dirs[1]))])
+    monkeypatch.setattr(rs, "retention_enabled", True)
+    monkeypatch.setattr(rs, "retention", {"keep_last": 1})
+    rs.maintain_backup_catalogs()
+    for directory in dirs:
+        entries = rs.get_backup_catalog(str(directory)).list()
+        assert [(e["id"], e["verified"]) for e in entries] == [("backup_2020-01-03_00-00-00", True)]
+        assert sorted(p.name for p in directory.glob("*.zip")) == ["backup_2020-01-03_00-00-00.zip"]
@@ -0,0 +1,57 @@
+import os
+from types import SimpleNamespace
+
+import pytest
+
+import run_scumserver as rs
+
+
+@pytest.fixture
+def watcher(tmp_path, monkeypatch):
+    """SaveWatcher над tmp_path с SCUM.db в режиме WAL и включёнными бэкапами по изменениям."""
+    (tmp_path / "SCUM.db").write_bytes(b"\0" * 4096)
+    monkeypatch.setattr(rs, "save_dir", str(tmp_path))
+    monkeypatch.setattr(rs, "change_backup_enabled", True)
+    monkeypatch.setattr(rs, "instances", [])
+    monkeypatch.setattr(rs, "get_backup_catalog", lambda: SimpleNamespace(list=lambda: []))
+    save_watcher = rs.SaveWatcher()
+    save_watcher.reset(os.path.normpath(str(tmp_path)))
+    save_watcher.page_size = 4096
+    return save_watcher
+
+
+def checkpoint(watcher, tmp_path):
+    with open(tmp_path / "SCUM.db", "ab") as f:
+        f.write(b"\0" * 4096)
+    watcher.scan()
+
+
+def test_checkpoint_during_backup_stays_pending(watcher, tmp_path):
+    checkpoint(watcher, tmp_path)
+    token = watcher.observed()
+    checkpoint(watcher, tmp_path)
+    watcher.mark_backup(token)
+    assert watcher.backup_due() == "контрольная точка WAL"
+    watcher.mark_backup(watcher.observed())
+    assert watcher.backup_due() is None
+
+
+def test_submitted_backup_leaves_checkpoint_to_mark_backup(watcher, tmp_path, monkeypatch):
+    submitted = []
+    monkeypatch.setattr(rs, "submit_backup_job", lambda kind, func, exclusive=False: submitted.append(kind))
+    checkpoint(watcher, tmp_path)
+    watcher.maybe_backup()
+    assert submitted == ["change"]
+    assert watcher.checkpoint_pending
+
+
+def test_no_change_backup_during_restart_pipeline(watcher, tmp_path, monkeypatch):
+    submitted = []
+    monkeypatch.setattr(rs, "submit_backup_job", lambda kind, func, exclusive=False: submitted.append(kind))
+    monkeypatch.setattr(rs, "instances", [SimpleNamespace(pipeline=None), SimpleNamespace(pipeline=object())])
+    checkpoint(watcher, tmp_path)
+    watcher.maybe_backup()
+    assert submitted == []
+    rs.instances[1].pipeline = None
+    watcher.maybe_backup()
+    assert submitted == ["change"]
@@ -0,0 +1,95 @@
+from datetime import date, datetime, time
+
+import pytest
+
+import run_scumserver as rs
+
+# Суббота
+SAT = datetime(2026, 10, 17, 12, 0)
+
+
+def test_parse_daily_weekday_and_dated_entries():
+    daily = rs.parse_schedule_entry("06:30")
+    assert (daily.weekdays, daily.at, daily.date) == (None, time(6, 30), None)
+    listed = rs.parse_schedule_entry("пн,чт 21:00")
+    assert listed.weekdays == {0, 3}
+    dated = rs.parse_schedule_entry("2026-10-20 04:00")
+    assert (dated.weekdays, dated.at, dated.date) == (None, time(4, 0), date(2026, 10, 20))
+
+
+@pytest.mark.parametrize("spec, weekdays", [
+    ("mon-fri 05:00", {0, 1, 2, 3, 4}),
+    # Диапазон через конец недели
+    ("sat-mon 05:00", {5, 6, 0}),
+    ("пт-вт 05:00", {4, 5, 6, 0, 1}),
+    ("SUN 05:00", {6}),
+])
+def test_weekday_ranges_wrap_around_the_week(spec, weekdays):
+    assert rs.parse_schedule_entry(spec).weekdays == weekdays
+
+
+@pytest.mark.parametrize("spec", ["", "25:00", "12:60", "noon", "sat-mon", "xyz 12:00", "mon-xyz 12:00",
+                                  "mon 12:00 extra", "2026-13-01 12:00"])
+def test_bad_specs_are_rejected(spec):
+    with pytest.raises(ValueError):
+        rs.parse_schedule_entry(spec)
+
+
+def test_parse_schedule_skips_bad_entries():
+    assert [entry.spec for entry in rs.parse_schedule(["12:00", "bad", "sat 13:00"])] == ["12:00", "sat 13:00"]
+
+
+def test_wrapping_range_fires_from_saturday_to_monday():
+    entry = rs.parse_schedule_entry("sat-mon 05:00")
+    fires = []
+    moment = SAT
+    for _ in range(4):
+        moment = rs.entry_next_fire(entry, moment)
+        fires.append(moment)
+    assert fires == [datetime(2026, 10, 18, 5), datetime(2026, 10, 19, 5), datetime(2026, 10, 24, 5), datetime(2026, 10, 25, 5)]
+
+
+def test_next_fire_is_strictly_after():
+    entry = rs.parse_schedule_entry("12:00")
+    assert rs.entry_next_fire(entry, SAT) == datetime(2026, 10, 18, 12)
+    assert rs.entry_next_fire(entry, datetime(2026, 10, 17, 11, 59)) == SAT
+
+
+def test_dated_entry_fires_once_and_is_removed():
+    schedule = rs.RestartSchedule(["2026-10-17 13:00"], SAT)
+    assert schedule.next_fire() == datetime(2026, 10, 17, 13)
+    assert schedule.pop_due(datetime(2026, 10, 17, 12, 59)) == []
+    assert [entry.spec for entry in schedule.pop_due(datetime(2026, 10, 17, 13))] == ["2026-10-17 13:00"]
+    assert schedule.next_fire() is None
+    assert schedule.pop_due(datetime(2026, 10, 18, 13)) == []
+
+
+def test_past_dated_entry_never_fires():
+    schedule = rs.RestartSchedule(["2026-10-16 13:00"], SAT)
+    assert schedule.next_fire() is None
+
+
+def test_no_second_fire_after_restart_in_the_same_minute():
+    schedule = rs.RestartSchedule(["12:00"], datetime(2026, 10, 17, 11, 0))
+    assert len(schedule.pop_due(datetime(2026, 10, 17, 12, 0, 1))) == 1
+    # Сервер перезапустился за несколько секунд, супервизор снова проверяет расписание
+    assert schedule.pop_due(datetime(2026, 10, 17, 12, 0, 20)) == []
+    assert schedule.pop_due(datetime(2026, 10, 17, 12, 0, 59)) == []
+    assert schedule.next_fire() == datetime(2026, 10, 18, 12)
+    # Расписание, построенное заново после рестарта, тоже не срабатывает в ту же минуту
+    rebuilt = rs.RestartSchedule(["12:00"], datetime(2026, 10, 17, 12, 0, 20))
+    assert rebuilt.pop_due(datetime(2026, 10, 17, 12, 0, 59)) == []
+
+
+def test_missed_occurrences_collapse_into_one():
+    schedule = rs.RestartSchedule(["12:00", "sat-mon 05:00"], datetime(2026, 10, 10, 0, 0))
+    # Система спала неделю: каждая запись срабатывает один раз
+    fired = schedule.pop_due(datetime(2026, 10, 17, 12, 30))
+    assert sorted(entry.spec for entry in fired) == ["12:00", "sat-mon 05:00"]
+    assert schedule.pop_due(datetime(2026, 10, 17, 12, 30)) == []
+    assert schedule.next_fire() == datetime(2026, 10, 18, 5)
+
+
+def test_due_entries_come_out_in_time_order():
+    schedule = rs.RestartSchedule(["13:00", "12:30", "sat 12:45"], SAT)
+    assert [entry.spec for entry in schedule.pop_due(datetime(2026, 10, 17, 13))] == ["12:30", "sat 12:45", "13:00"]
@@ -0,0 +1,93 @@
+import json
+import os
+
+import pytest
+
+import run_scumserver as rs
+
+
+def write(path, data):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(path.name + ".tmp")
+    tmp.write_bytes(data)
+    os.replace(tmp, path)
+
+
+@pytest.fixture
+def live(tmp_path, monkeypatch):
+    """Установка, внутри которой работает утилита с папкой бэкапов по умолчанию."""
+    live = tmp_path / "SCUMServer"
+    write(live / "SCUM/Binaries/Win64/SCUMServer.exe", b"exe v1")
+    write(live / "SCUM/Content/Paks/pakchunk0.pak", b"pak v1")
+    write(live / "SCUM/Config/WindowsServer/ServerSettings.ini", b"admin v1")
+    write(live / "steamapps/appmanifest_3792580.acf", b'"buildid" "1"')
+    write(live / "SCUM/Saved/SaveFiles/SCUM.db", b"save")
+    write(live / "backup/catalog.json", json.dumps({"version": 1, "entries": ["backup_1"]}).encode())
+    write(live / "backup/backup_1.zip", b"zip")
+    write(live / "backup/chunks/objects/ab/abcdef", b"chunk")
+    write(live / "logs/server.log", b"log")
+    write(live / "events/index.json", b"{}")
+    write(live / "settings.json", b"{}")
+    write(live / "db_health.jsonl", b"")
+    monkeypatch.chdir(live)
+    monkeypatch.setattr(rs, "backup_dir", str(live / "backup"))
+    monkeypatch.setattr(rs, "instances", [rs.primary_instance])
+    monkeypatch.setattr(rs, "reflink_file", lambda source, target: False)
+    return live
+
+
+def test_manager_files_stay_out_of_shadow(live):
+    shadow = rs.ShadowInstall(str(live))
+    shadow.prepare()
+    shadow_dir = live.parent / "SCUMServer.staged"
+    for rel_path in ("backup", "logs", "events", "settings.json", "db_health.jsonl", "SCUM/Saved"):
+        assert not (shadow_dir / rel_path).exists()
+    assert (shadow_dir / "SCUM/Content/Paks/pakchunk0.pak").samefile(live / "SCUM/Content/Paks/pakchunk0.pak")
+    shadow.discard()
+
+
+def test_apply_moves_only_files_replaced_by_steamcmd(live):
+    shadow = rs.ShadowInstall(str(live))
+    shadow.prepare()
+    shadow_dir = live.parent / "SCUMServer.staged"
+    # SteamCMD обновляет копию
+    write(shadow_dir / "SCUM/Content/Paks/pakchunk0.pak", b"pak v2")
+    write(shadow_dir / "SCUM/Content/Paks/pakchunk1.pak", b"new pak")
+    write(shadow_dir / "steamapps/appmanifest_3792580.acf", b'"buildid" "2"')
+    # Тем временем утилита и администратор меняют живую установку
+    write(live / "backup/catalog.json", json.dumps({"version": 1, "entries": []}).encode())
+    os.remove(live / "backup/backup_1.zip")
+    write(live / "SCUM/Config/WindowsServer/ServerSettings.ini", b"admin v2")
+    os.remove(live / "SCUM/Binaries/Win64/SCUMServer.exe")
+    write(live / "SCUM/Binaries/Win64/SCUMServer.exe", b"exe v1")
+
+    changes = shadow.collect_changes()
+    assert sorted(path.replace(os.sep, "/") for path in changes) == [
+        "SCUM/Content/Paks/pakchunk0.pak",
+        "SCUM/Content/Paks/pakchunk1.pak",
+        "steamapps/appmanifest_3792580.acf",
+    ]
+    shadow.apply()
+    assert (live / "SCUM/Content/Paks/pakchunk0.pak").read_bytes() == b"pak v2"
+    assert (live / "SCUM/Content/Paks/pakchunk1.pak").read_bytes() == b"new pak"
+    assert json.loads((live / "backup/catalog.json").read_text())["entries"] == []
+    assert not (live / "backup/backup_1.zip").exists()
+    assert (live / "SCUM/Config/WindowsServer/ServerSettings.ini").read_bytes() == b"admin v2"
+    assert not shadow_dir.exists()
+
+    assert shadow.rollback() == 3
+    assert (live / "SCUM/Content/Paks/pakchunk0.pak").read_bytes() == b"pak v1"
+    assert not (live / "SCUM/Content/Paks/pakchunk1.pak").exists()
+    assert (live / "SCUM/Config/WindowsServer/ServerSettings.ini").read_bytes() == b"admin v2"
+
+
+def test_reflink_clones_or_leaves_nothing(tmp_path):
+    source = tmp_path / "source.pak"
+    source.write_bytes(b"pak" * 1000)
+    target = tmp_path / "target.pak"
+    if rs.reflink_file(str(source), str(target)):
+        assert target.read_bytes() == source.read_bytes()
+        assert not target.samefile(source)
+        assert target.stat().st_mtime_ns == source.stat().st_mtime_ns
+    else:
+        assert not target.exists()
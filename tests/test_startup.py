@@ -0,0 +1,11 @@
+import os
+import subprocess
+import sys
+
+SCRIPT_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "ScumServerDops")
+
+
+def test_import_does_not_load_heavy_modules():
+    code = "import sys, run_scumserver; print(','.join(m for m in ('asyncio', 'http.server', 'urllib.request', 'ctypes', 'tkinter') if m in sys.modules))"
+    result = subprocess.run([sys.executable, "-c", code], cwd=SCRIPT_DIR, capture_output=True, text=True, check=True)
+    assert result.stdout.strip() == ""
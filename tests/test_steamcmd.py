@@ -0,0 +1,98 @@
+import os
+import shutil
+import stat
+import sys
+
+import pytest
+
+import run_scumserver as rs
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+pytestmark = pytest.mark.skipif(sys.platform == "win32", reason="подмена SteamCMD запускается как shell-скрипт")
+
+
+@pytest.fixture
+def steamcmd(tmp_path, monkeypatch):
+    """Подмена SteamCMD; возвращает функцию со списком вызовов."""
+    log = tmp_path / "steamcmd.log"
+    log.touch()
+    launcher = tmp_path / "steamcmd.sh"
+    launcher.write_text(f'#!/bin/sh\nexec "{sys.executable}" "{os.path.join(FIXTURES, "steamcmd.py")}" "$@"\n')
+    launcher.chmod(launcher.stat().st_mode | stat.S_IXUSR)
+    install_dir = tmp_path / "server"
+    (install_dir / "steamapps").mkdir(parents=True)
+    monkeypatch.setenv("FAKE_STEAMCMD_LOG", str(log))
+    monkeypatch.setattr(rs, "steamcmd_executable", str(launcher))
+    monkeypatch.setattr(rs, "steamcmd_install_dir", str(install_dir))
+    monkeypatch.setattr(rs, "build_check_cache", {})
+    return lambda: log.read_text().splitlines()
+
+
+def install_manifest(build_id):
+    with open(os.path.join(FIXTURES, "appmanifest_3792580.acf"), encoding="utf-8") as f:
+        text = f.read().replace('"19345678"', f'"{build_id}"')
+    with open(os.path.join(rs.steamcmd_install_dir, "steamapps", "appmanifest_3792580.acf"), "w", encoding="utf-8") as f:
+        f.write(text)
+
+
+def test_latest_build_is_read_from_public_branch(steamcmd):
+    assert rs.query_latest_build_id() == "19345678"
+    assert steamcmd() == ["+login anonymous +app_info_update 1 +app_info_print 3792580 +quit"]
+
+
+def test_update_skipped_when_installed_build_is_current(steamcmd):
+    install_manifest("19345678")
+    assert rs.check_for_update() == (False, "19345678", "19345678")
+    assert rs.check_for_update() == (False, "19345678", "19345678")
+    assert len(steamcmd()) == 1
+
+
+def test_update_needed_for_older_build_and_installs_it(steamcmd):
+    install_manifest("19000001")
+    assert rs.check_for_update() == (True, "19000001", "19345678")
+    assert rs.run_steamcmd_update() == 0
+    assert rs.read_installed_build_id() == "19345678"
+    assert rs.check_for_update() == (False, "19345678", "19345678")
+    calls = steamcmd()
+    assert len(calls) == 3
+    assert calls[1] == f"+force_install_dir {rs.steamcmd_install_dir} +login anonymous +app_update 3792580 +quit"
+
+
+def test_update_needed_without_manifest(steamcmd):
+    assert rs.check_for_update() == (True, None, "19345678")
+
+
+def test_in_place_write_through_hard_link_aborts_staged_update(steamcmd, monkeypatch):
+    install_manifest("19000001")
+    pak = os.path.join(rs.steamcmd_install_dir, "SCUM", "Content", "Paks", "pakchunk0.pak")
+    os.makedirs(os.path.dirname(pak))
+    with open(pak, "wb") as f:
+        f.write(b"pak v1 " * 100)
+    monkeypatch.setenv("FAKE_STEAMCMD_PATCH_IN_PLACE", os.path.join("SCUM", "Content", "Paks", "pakchunk0.pak"))
+    monkeypatch.setattr(rs, "reflink_file", lambda source, target: False)
+    monkeypatch.setattr(rs, "staged_update", None)
+    with pytest.raises(RuntimeError, match="на месте"):
+        rs.stage_update(force=True)
+    assert rs.staged_update is None
+    assert not os.path.exists(rs.steamcmd_install_dir + rs.SHADOW_SUFFIX)
+
+
+def test_in_place_write_to_clone_leaves_live_file(steamcmd, monkeypatch):
+    install_manifest("19000001")
+    pak = os.path.join(rs.steamcmd_install_dir, "SCUM", "Content", "Paks", "pakchunk0.pak")
+    os.makedirs(os.path.dirname(pak))
+    with open(pak, "wb") as f:
+        f.write(b"pak v1 " * 100)
+    monkeypatch.setenv("FAKE_STEAMCMD_PATCH_IN_PLACE", os.path.join("SCUM", "Content", "Paks", "pakchunk0.pak"))
+    # Клон на ФС без reflink изображает копия
+    monkeypatch.setattr(rs, "reflink_file", lambda source, target: bool(shutil.copy2(source, target)))
+    monkeypatch.setattr(rs, "staged_update", None)
+    try:
+        assert rs.stage_update(force=True)
+        with open(pak, "rb") as f:
+            assert f.read() == b"pak v1 " * 100
+        assert sorted(path.replace(os.sep, "/") for path in rs.staged_update.changes) == ["SCUM/Content/Paks/pakchunk0.pak", "steamapps/appmanifest_3792580.acf"]
+    finally:
+        if rs.staged_update is not None:
+            rs.staged_update.discard()
@@ -0,0 +1,75 @@
+import sys
+import threading
+from datetime import datetime, time as dt_time
+
+import pytest
+
+import run_scumserver as rs
+
+SLEEPER = "import time; time.sleep(60)"
+
+
+class FireOnce:
+    """Расписание, которое срабатывает один раз при первом опросе."""
+    specs = ()
+
+    def __init__(self):
+        self.entries = [rs.ScheduleEntry("12:00", None, dt_time(12, 0), None)]
+
+    def pop_due(self, now):
+        fired, self.entries = self.entries, []
+        return fired
+
+    def next_fire(self):
+        return None
+
+
+@pytest.fixture
+def instance(tmp_path, monkeypatch):
+    gate = threading.Event()
+    monkeypatch.setattr(rs, "PIPELINE_STAGES", [rs.PipelineStage("update", "pre", "загрузка", lambda context: gate.wait(30))])
+    monkeypatch.setattr(rs, "restart_pipeline", ["update"])
+    monkeypatch.setattr(rs, "crash_restart_delay", 0)
+    instance = rs.ServerInstance("extra", sys.executable, ["-c", SLEEPER], [], str(tmp_path / "saves"), str(tmp_path / "backup"), str(tmp_path / "install"), auto_start=True)
+    instance.gate = gate
+    yield instance
+    gate.set()
+    instance.running = False
+    for job in (instance.pre_job, instance.job):
+        if job is not None:
+            job.result(30)
+    if instance.process is not None:
+        instance.process.kill()
+
+
+def step(instance):
+    return rs.supervise_instance(instance, 0, datetime.now())
+
+
+def test_crash_during_pipeline_preparation_is_relaunched(instance):
+    step(instance)
+    instance.schedule = FireOnce()
+    step(instance)
+    assert instance.pre_job is not None and instance.job is None
+    first = instance.process
+    first.kill()
+    assert first.wait(10) is not None
+
+    # Падение замечено и сервер перезапущен, хотя подготовка конвейера ещё идёт
+    step(instance)
+    assert instance.process is None
+    step(instance)
+    assert instance.process is not None and instance.process.pid != first.pid
+    assert not instance.pre_job.done()
+
+    instance.gate.set()
+    instance.pre_job.result(10)
+    second = instance.process
+    step(instance)
+    assert instance.pre_job is None
+    instance.job.result(30)
+    assert second.poll() is not None
+    step(instance)
+    assert instance.process is not None and instance.process.pid != second.pid
+    assert rs.pipeline_reports[-1]["instance"] == "extra"
+    assert [t["stage"] for t in rs.pipeline_reports[-1]["stages"]][:2] == ["загрузка", "остановка"]
@@ -0,0 +1,109 @@
+import os
+import sys
+import time
+from types import SimpleNamespace
+
+import pytest
+
+import run_scumserver as rs
+
+linux_only = pytest.mark.skipif(not sys.platform.startswith("linux"), reason="счётчики /proc есть только в Linux")
+
+
+def sample(t, rss):
+    return {"time": t, "cpu_percent": 0.0, "rss_mb": rss, "threads": 1, "handles": 1, "read_mb": 0.0, "write_mb": 0.0}
+
+
+@linux_only
+def test_proc_stats_of_own_process():
+    stats = rs.open_process_stats(os.getpid())
+    assert isinstance(stats, rs.ProcProcessStats)
+    before = stats.read()
+    ballast = bytearray(64 * 1048576)
+    deadline = time.process_time() + 0.3
+    while time.process_time() < deadline:
+        pass
+    after = stats.read()
+    assert after["cpu_seconds"] - before["cpu_seconds"] >= 0.2
+    assert after["rss_bytes"] - before["rss_bytes"] >= 32 * 1048576
+    assert after["threads"] == len(os.listdir("/proc/self/task"))
+    # Сам обход /proc/self/fd открывает дескриптор
+    assert abs(after["handles"] - len(os.listdir("/proc/self/fd"))) <= 1
+    assert after["read_bytes"] >= 0 and after["write_bytes"] >= 0
+    del ballast
+
+
+def test_ring_wraps_around():
+    ring = rs.MetricRing(rs.TELEMETRY_FIELDS, 3)
+    for t in range(5):
+        ring.append(sample(t, t * 10))
+    assert ring.series("time") == [2.0, 3.0, 4.0]
+    assert [row["rss_mb"] for row in ring.rows()] == [20.0, 30.0, 40.0]
+    ring.clear()
+    assert ring.rows() == []
+
+
+@linux_only
+def test_sampler_records_own_process(monkeypatch):
+    monkeypatch.setattr(rs, "telemetry_interval", 0.05)
+    monkeypatch.setattr(rs, "primary_instance", SimpleNamespace(running=False))
+    sampler = rs.TelemetrySampler(capacity=4)
+    sampler.attach(os.getpid())
+    try:
+        deadline = time.monotonic() + 5
+        while sampler.ring.size < 4 and time.monotonic() < deadline:
+            time.sleep(0.05)
+    finally:
+        sampler.detach()
+    rows = sampler.ring.rows()
+    assert len(rows) == 4
+    assert [row["time"] for row in rows] == sorted(row["time"] for row in rows)
+    assert all(row["rss_mb"] > 1 and row["threads"] >= 1 and row["cpu_percent"] >= 0 for row in rows)
+
+
+@pytest.fixture
+def policy(monkeypatch):
+    """Сэмплер с заполняемым вручную кольцом; возвращает (сэмплер, запрошенные рестарты)."""
+    restarts = []
+    monkeypatch.setattr(rs, "primary_instance", SimpleNamespace(running=True))
+    monkeypatch.setattr(rs, "request_restart", lambda reason, kind: restarts.append((reason, kind)))
+    monkeypatch.setattr(rs, "rss_limit_mb", 0)
+    monkeypatch.setattr(rs, "rss_growth_limit_mb_per_hour", 0)
+    return rs.TelemetrySampler(capacity=rs.TELEMETRY_GROWTH_MIN_SAMPLES * 2), restarts
+
+
+def test_rss_limit_restarts_once(policy, monkeypatch):
+    sampler, restarts = policy
+    monkeypatch.setattr(rs, "rss_limit_mb", 1000)
+    sampler.ring.append(sample(0, 900))
+    sampler.check_policy(0)
+    assert restarts == []
+    sampler.ring.append(sample(5, 1200))
+    sampler.check_policy(5)
+    sampler.ring.append(sample(10, 1300))
+    sampler.check_policy(10)
+    assert restarts == [("память 1200 МБ > 1000 МБ", "memory")]
+
+
+def test_rss_growth_rate_restarts(policy, monkeypatch):
+    sampler, restarts = policy
+    monkeypatch.setattr(rs, "rss_growth_limit_mb_per_hour", 100)
+    # 60 с между точками, +5 МБ за точку - 300 МБ/ч
+    for i in range(rs.TELEMETRY_GROWTH_MIN_SAMPLES):
+        sampler.ring.append(sample(i * 60, 500 + i * 5))
+        sampler.check_policy(i * 60)
+    assert len(restarts) == 1
+    assert restarts[0] == ("рост памяти 300 МБ/ч > 100 МБ/ч", "memory")
+
+
+def test_slow_growth_and_stopped_server_do_not_restart(policy, monkeypatch):
+    sampler, restarts = policy
+    monkeypatch.setattr(rs, "rss_growth_limit_mb_per_hour", 100)
+    for i in range(rs.TELEMETRY_GROWTH_MIN_SAMPLES):
+        sampler.ring.append(sample(i * 60, 500 + i))
+        sampler.check_policy(i * 60)
+    assert restarts == []
+    monkeypatch.setattr(rs, "rss_limit_mb", 100)
+    monkeypatch.setattr(rs, "primary_instance", SimpleNamespace(running=False))
+    sampler.check_policy(rs.TELEMETRY_GROWTH_MIN_SAMPLES * 60)
+    assert restarts == []
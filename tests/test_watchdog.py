@@ -0,0 +1,93 @@
+import sys
+import threading
+import time
+
+import pytest
+
+import run_scumserver as rs
+
+HUNG_CHILD = "import time; print('started', flush=True); time.sleep(60)"
+CHATTY_CHILD = "import time\nfor i in range(600):\n    print(i, flush=True)\n    time.sleep(0.1)"
+
+
+class FakeRing:
+    def __init__(self, cpu_percent):
+        self.cpu_percent = cpu_percent
+
+    def rows(self):
+        now = time.time()
+        return [{"time": now - age, "cpu_percent": self.cpu_percent} for age in range(3)]
+
+
+class Restarts(list):
+    def __init__(self):
+        super().__init__()
+        self.fired = threading.Event()
+
+
+class FakeTelemetry:
+    def __init__(self, cpu_percent):
+        self.ring = FakeRing(cpu_percent)
+
+
+@pytest.fixture
+def restarts(monkeypatch):
+    """Ускоренный watchdog; возвращает список запрошенных рестартов."""
+    requested = Restarts()
+
+    def request_restart(reason, kind):
+        requested.append((reason, kind))
+        requested.fired.set()
+
+    monkeypatch.setattr(rs, "watchdog_enabled", True)
+    monkeypatch.setattr(rs, "watchdog_grace", 1)
+    monkeypatch.setattr(rs, "watchdog_startup_grace", 0)
+    monkeypatch.setattr(rs, "WATCHDOG_CHECK_INTERVAL", 0.1)
+    monkeypatch.setattr(rs, "resolve_query_port", lambda: None)
+    monkeypatch.setattr(rs, "telemetry", FakeTelemetry(0.0))
+    monkeypatch.setattr(rs, "request_restart", request_restart)
+    return requested
+
+
+def watch(args, probe=None):
+    watchdog = rs.HangWatchdog(probe=probe or (lambda port: False))
+    child = rs.output_mux.spawn([sys.executable, "-c", args], lambda lines: watchdog.note_output(lines[-1].timestamp), **rs.NO_WINDOW)
+    watchdog.attach(child)
+    return watchdog, child
+
+
+def test_silent_child_with_idle_cpu_is_restarted(restarts):
+    watchdog, child = watch(HUNG_CHILD)
+    try:
+        assert restarts.fired.wait(5)
+        assert child.poll() is None
+    finally:
+        watchdog.detach()
+        child.kill()
+    assert restarts[0][1] == "watchdog"
+    assert "нет вывода" in restarts[0][0]
+    assert len(watchdog.detections) == 1
+    assert 1 <= watchdog.detections[0]["latency"] < 3
+
+
+def test_child_with_output_is_left_alone(restarts):
+    watchdog, child = watch(CHATTY_CHILD)
+    try:
+        assert not restarts.fired.wait(2.5)
+    finally:
+        watchdog.detach()
+        child.kill()
+    assert watchdog.detections == []
+
+
+def test_query_port_silence_fires_despite_busy_cpu(restarts, monkeypatch):
+    monkeypatch.setattr(rs, "resolve_query_port", lambda: 27016)
+    monkeypatch.setattr(rs, "telemetry", FakeTelemetry(37.5))
+    answers = iter([True, True])
+    watchdog, child = watch(HUNG_CHILD, probe=lambda port: next(answers, False))
+    try:
+        assert restarts.fired.wait(5)
+    finally:
+        watchdog.detach()
+        child.kill()
+    assert "порт 27016 не отвечает" in restarts[0][0]